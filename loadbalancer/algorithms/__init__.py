@@ -1,12 +1,14 @@
 from algorithms.base import LoadBalancer
 from algorithms.round_robin import RoundRobinBalancer
 from algorithms.weighted import WeightedRoundRobinBalancer, SmoothWeightedRoundRobinBalancer
-from algorithms.ip_hash import IPHashBalancer, ConsistentHashBalancer
+from algorithms.ip_hash import IPHashBalancer, ConsistentHashBalancer, BoundedConsistentHashBalancer
 from algorithms.least_connections import (
     LeastConnectionsBalancer, 
     WeightedLeastConnectionsBalancer, 
     FastestResponseBalancer
 )
+from algorithms.p2c import P2CEWMABalancer
+from algorithms.least_latency import LeastOutstandingLatencyBalancer
 from typing import Dict, Type
 
 class LoadBalancerFactory:
@@ -18,9 +20,12 @@ class LoadBalancerFactory:
         'smooth_weighted_round_robin': SmoothWeightedRoundRobinBalancer,
         'ip_hash': IPHashBalancer,
         'consistent_hash': ConsistentHashBalancer,
+        'consistent_hash_bounded': BoundedConsistentHashBalancer,
         'least_connections': LeastConnectionsBalancer,
         'weighted_least_connections': WeightedLeastConnectionsBalancer,
         'fastest_response': FastestResponseBalancer,
+        'p2c_ewma': P2CEWMABalancer,
+        'least_outstanding_latency': LeastOutstandingLatencyBalancer,
     }
     
     @classmethod
@@ -46,10 +51,26 @@ class LoadBalancerFactory:
         # 为特定算法传递参数
         if algorithm == 'consistent_hash':
             virtual_nodes = kwargs.get('virtual_nodes', 150)
-            return algorithm_class(virtual_nodes=virtual_nodes)
+            hash_engine = kwargs.get('hash_engine', 'ketama')
+            table_size = kwargs.get('table_size', 65537)
+            return algorithm_class(
+                virtual_nodes=virtual_nodes,
+                hash_engine=hash_engine,
+                table_size=table_size
+            )
+        elif algorithm == 'consistent_hash_bounded':
+            virtual_nodes = kwargs.get('virtual_nodes', 150)
+            epsilon = kwargs.get('epsilon', 0.25)
+            return algorithm_class(virtual_nodes=virtual_nodes, epsilon=epsilon)
         elif algorithm == 'ip_hash':
             hash_function = kwargs.get('hash_function', 'md5')
-            return algorithm_class(hash_function=hash_function)
+            rendezvous = kwargs.get('rendezvous', False)
+            cache_size = kwargs.get('cache_size', 4096)
+            return algorithm_class(
+                hash_function=hash_function,
+                rendezvous=rendezvous,
+                cache_size=cache_size
+            )
         elif algorithm == 'fastest_response':
             connection_weight = kwargs.get('connection_weight', 0.6)
             response_time_weight = kwargs.get('response_time_weight', 0.4)
@@ -57,6 +78,14 @@ class LoadBalancerFactory:
                 connection_weight=connection_weight,
                 response_time_weight=response_time_weight
             )
+        elif algorithm == 'p2c_ewma':
+            decay_time = kwargs.get('decay_time', 10.0)
+            default_latency = kwargs.get('default_latency', 100.0)
+            return algorithm_class(decay_time=decay_time, default_latency=default_latency)
+        elif algorithm == 'least_outstanding_latency':
+            smoothing = kwargs.get('smoothing', 0.3)
+            default_latency = kwargs.get('default_latency', 100.0)
+            return algorithm_class(smoothing=smoothing, default_latency=default_latency)
         else:
             return algorithm_class()
     
@@ -74,9 +103,12 @@ class LoadBalancerFactory:
             'smooth_weighted_round_robin': '平滑加权轮询 - 更平滑的权重分发',
             'ip_hash': 'IP哈希 - 基于客户端IP哈希选择后端',
             'consistent_hash': '一致性哈希 - 节点变化时影响最小',
+            'consistent_hash_bounded': '有界负载一致性哈希 - 限制单个后端负载不超过平均值的(1+ε)倍',
             'least_connections': '最少连接 - 选择连接数最少的后端',
             'weighted_least_connections': '加权最少连接 - 结合权重的最少连接',
-            'fastest_response': '最快响应 - 综合连接数和响应时间选择'
+            'fastest_response': '最快响应 - 综合连接数和响应时间选择',
+            'p2c_ewma': '两次随机选择 - 按峰值EWMA延迟与连接数选择两者中较优的后端',
+            'least_outstanding_latency': '最少在途延迟 - 结合在途请求已运行时间与服务时间EWMA，选择预计完成最早的后端'
         }
         return descriptions.get(algorithm, '未知算法')
     
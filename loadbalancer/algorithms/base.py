@@ -1,26 +1,48 @@
 from abc import ABC, abstractmethod
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple, Sequence
 import time
 import threading
+import weakref
 from datetime import datetime
+from algorithms.latency import ResponseTimeTracker
+from algorithms.table import BackendTable, default_table
 
 class Backend:
-    """后端服务实例"""
+    """后端服务实例
     
-    def __init__(self, id: str, host: str, port: int, weight: int = 1):
+    计数器、权重和健康状态保存在 BackendTable 的列中，
+    Backend 本身只是一个带 __slots__ 的视图。
+    """
+    
+    __slots__ = ('id', 'host', 'port', '_table', '_slot', '_pools',
+                 '_active_listeners', '_response_times', '__weakref__')
+    
+    def __init__(self, id: str, host: str, port: int, weight: int = 1,
+                 table: Optional[BackendTable] = None):
         self.id = id
         self.host = host
         self.port = port
-        self.weight = weight
-        self.active_connections = 0
-        self.is_healthy = True
-        self.last_seen = datetime.now()
-        self._lock = threading.RLock()
+        self._table = table if table is not None else default_table()
+        self._slot = self._table.allocate()
+        self._table.weight[self._slot] = weight
+        self._table.healthy[self._slot] = 1
+        self._table.last_seen[self._slot] = time.time()
+        self._table.warmup[self._slot] = 1.0
+        
+        # 包含该后端的服务池，健康状态变化时通知其重建快照
+        self._pools = weakref.WeakSet()
+        
+        # 活跃连接数变化的监听者（弱引用元组，写时复制，读取时无需加锁）
+        self._active_listeners: Tuple[weakref.ref, ...] = ()
         
-        # 统计信息
-        self.total_requests = 0
-        self.total_response_time = 0
-        self.error_count = 0
+        # 最近样本的响应时间及分位数，首次记录时才创建
+        self._response_times: Optional[ResponseTimeTracker] = None
+    
+    def __del__(self):
+        try:
+            self._table.release(self._slot)
+        except Exception:
+            pass
     
     @property
     def address(self) -> str:
@@ -32,102 +54,365 @@ class Backend:
         """获取HTTP URL"""
         return f"http://{self.host}:{self.port}"
     
+    @property
+    def slot(self) -> int:
+        """在BackendTable中的槽位"""
+        return self._slot
+    
+    @property
+    def table(self) -> BackendTable:
+        """所在的BackendTable"""
+        return self._table
+    
+    @property
+    def weight(self) -> int:
+        return self._table.weight[self._slot]
+    
+    @weight.setter
+    def weight(self, value: int):
+        # 与 set_weight 相同，变化时发布新的快照版本
+        self.set_weight(value)
+    
+    @property
+    def warmup(self) -> float:
+        """慢启动系数，取值 (0, 1]，未处于慢启动时为1"""
+        return self._table.warmup[self._slot]
+    
+    @warmup.setter
+    def warmup(self, value: float):
+        self._table.warmup[self._slot] = value
+    
+    @property
+    def effective_weight(self) -> float:
+        """有效权重（配置权重乘以慢启动系数）"""
+        return self._table.weight[self._slot] * self._table.warmup[self._slot]
+    
+    @property
+    def active_connections(self) -> int:
+        return self._table.active[self._slot]
+    
+    @active_connections.setter
+    def active_connections(self, value: int):
+        self._table.active[self._slot] = value
+    
+    @property
+    def is_healthy(self) -> bool:
+        return self._table.healthy[self._slot] == 1
+    
+    @property
+    def last_seen(self) -> datetime:
+        return datetime.fromtimestamp(self._table.last_seen[self._slot])
+    
+    @property
+    def total_requests(self) -> int:
+        return self._table.get('total_requests', self._slot)
+    
+    @property
+    def total_response_time(self) -> float:
+        return self._table.get('total_response_time', self._slot)
+    
+    @property
+    def error_count(self) -> int:
+        return self._table.get('error_count', self._slot)
+    
+    @property
+    def response_times(self) -> ResponseTimeTracker:
+        """响应时间跟踪器"""
+        tracker = self._response_times
+        if tracker is None:
+            with self._table.lock(self._slot):
+                if self._response_times is None:
+                    self._response_times = ResponseTimeTracker()
+                tracker = self._response_times
+        return tracker
+    
     def increment_active(self):
         """增加活跃连接数"""
-        with self._lock:
-            self.active_connections += 1
+        table, slot = self._table, self._slot
+        with table.lock(slot):
+            table.active[slot] += 1
+        self._notify_active_changed()
     
     def decrement_active(self):
         """减少活跃连接数"""
-        with self._lock:
-            if self.active_connections > 0:
-                self.active_connections -= 1
+        table, slot = self._table, self._slot
+        with table.lock(slot):
+            if table.active[slot] <= 0:
+                return
+            table.active[slot] -= 1
+        self._notify_active_changed()
+    
+    def add_active_listener(self, listener):
+        """注册活跃连接数监听者，监听者需实现 _on_active_changed(backend)"""
+        with self._table.lock(self._slot):
+            refs = tuple(r for r in self._active_listeners if r() is not None and r() is not listener)
+            self._active_listeners = refs + (weakref.ref(listener),)
+    
+    def remove_active_listener(self, listener):
+        """移除活跃连接数监听者"""
+        with self._table.lock(self._slot):
+            self._active_listeners = tuple(
+                r for r in self._active_listeners if r() is not None and r() is not listener
+            )
+    
+    def _notify_active_changed(self):
+        """通知监听者活跃连接数已变化"""
+        for ref in self._active_listeners:
+            listener = ref()
+            if listener is not None:
+                listener._on_active_changed(self)
     
     def update_response_time(self, response_time_ms: float):
         """更新响应时间统计"""
-        with self._lock:
-            self.total_requests += 1
-            self.total_response_time += response_time_ms
+        self._table.add_response(self._slot, response_time_ms)
+        self.response_times.add_response_time(response_time_ms)
     
     def get_average_response_time(self) -> float:
         """获取平均响应时间"""
-        with self._lock:
-            if self.total_requests == 0:
-                return 0.0
-            return self.total_response_time / self.total_requests
+        total_requests = self.total_requests
+        if total_requests == 0:
+            return 0.0
+        return self.total_response_time / total_requests
     
     def mark_error(self):
         """标记错误"""
-        with self._lock:
-            self.error_count += 1
+        self._table.add('error_count', self._slot)
     
     def set_healthy(self, healthy: bool):
         """设置健康状态"""
-        with self._lock:
-            self.is_healthy = healthy
+        table, slot = self._table, self._slot
+        with table.lock(slot):
+            changed = (table.healthy[slot] == 1) != healthy
+            table.healthy[slot] = 1 if healthy else 0
             if healthy:
-                self.last_seen = datetime.now()
+                table.last_seen[slot] = time.time()
+        
+        # 在释放锁之后通知服务池，避免与池的写锁形成锁顺序问题
+        if changed:
+            for pool in list(self._pools):
+                pool._on_backend_changed()
+    
+    def set_weight(self, weight: int):
+        """设置权重"""
+        table, slot = self._table, self._slot
+        with table.lock(slot):
+            changed = table.weight[slot] != weight
+            table.weight[slot] = weight
+        
+        # 权重变化同样需要通知服务池发布新版本，让调度表按需重建
+        if changed:
+            for pool in list(self._pools):
+                pool._on_backend_changed()
     
     def to_dict(self) -> Dict[str, Any]:
         """转换为字典"""
+        tracker = self._response_times
         return {
             'id': self.id,
             'host': self.host,
             'port': self.port,
             'weight': self.weight,
+            'effective_weight': self.effective_weight,
             'active_connections': self.active_connections,
             'is_healthy': self.is_healthy,
             'last_seen': self.last_seen.isoformat(),
             'total_requests': self.total_requests,
             'average_response_time': self.get_average_response_time(),
+            'response_time_percentiles': (
+                tracker.get_percentiles() if tracker is not None
+                else {'p50': 0, 'p95': 0, 'p99': 0}
+            ),
             'error_count': self.error_count
         }
 
+class PoolSnapshot:
+    """后端服务池的不可变快照
+    
+    只在成员、健康状态或权重变化时重建，读取方通过一次属性读取拿到快照，
+    无需加锁。
+    """
+    
+    __slots__ = ('version', 'backends', 'healthy', 'index', 'by_id')
+    
+    def __init__(self, version: int, backends: Tuple[Backend, ...]):
+        self.version = version
+        self.backends = backends
+        self.healthy: Tuple[Backend, ...] = tuple(b for b in backends if b.is_healthy)
+        self.index: Dict[str, int] = {b.id: i for i, b in enumerate(self.healthy)}  # backend_id -> healthy下标
+        self.by_id: Dict[str, Backend] = {b.id: b for b in backends}
+
+class SlowStartController:
+    """慢启动控制器
+    
+    新加入或从不健康恢复的后端，其有效权重在 window 秒内从 floor × weight
+    分 steps 级升到 weight。慢启动系数由后台定时器每 interval 秒重新计算一次并
+    写入 Backend，只有系数升了一级时才发布新的快照版本，各算法在版本变化时
+    重建调度表或索引，一次慢启动最多触发 steps 次重建，请求路径上没有额外的
+    计算。没有后端处于慢启动时定时器自动退出。
+    """
+    
+    def __init__(self, pool: 'BackendPool', window: float = 30.0,
+                 floor: float = 0.1, interval: float = 1.0, steps: int = 10):
+        """
+        Args:
+            pool: 所属的后端服务池
+            window: 慢启动时长（秒）
+            floor: 起始系数，取值 (0, 1]
+            interval: 重新计算系数的间隔（秒）
+            steps: 系数从 floor 升到1分几级
+        """
+        if window <= 0:
+            raise ValueError("Slow start window must be positive")
+        if not 0 < floor <= 1:
+            raise ValueError("Slow start floor must be in (0, 1]")
+        if steps < 1:
+            raise ValueError("Slow start steps must be at least 1")
+        
+        self.pool = pool
+        self.window = window
+        self.floor = floor
+        self.interval = interval
+        self.steps = steps
+        self._ramping: Dict[str, Tuple[Backend, float]] = {}  # backend_id -> (后端, 开始时间)
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+    
+    def on_publish(self, old: PoolSnapshot, new: PoolSnapshot):
+        """服务池发布快照时调用（调用方持有服务池写锁）"""
+        now = time.monotonic()
+        with self._lock:
+            # 离开健康集合的后端结束慢启动
+            for backend_id in [i for i in self._ramping if i not in new.index]:
+                backend, _ = self._ramping.pop(backend_id)
+                backend.warmup = 1.0
+            
+            # 新加入健康集合的后端开始慢启动
+            for backend in new.healthy:
+                if backend.id not in old.index:
+                    backend.warmup = self.floor
+                    self._ramping[backend.id] = (backend, now)
+            
+            if self._ramping and self._thread is None and not self._stop_event.is_set():
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+    
+    def _tick(self, now: float) -> Tuple[bool, bool]:
+        """重新计算慢启动系数，返回 (是否还有后端处于慢启动, 是否有系数发生变化)"""
+        changed = False
+        with self._lock:
+            for backend_id, (backend, start) in list(self._ramping.items()):
+                progress = (now - start) / self.window
+                if progress >= 1:
+                    warmup = 1.0
+                    del self._ramping[backend_id]
+                else:
+                    level = int(progress * self.steps) / self.steps
+                    warmup = self.floor + (1 - self.floor) * level
+                if warmup != backend.warmup:
+                    backend.warmup = warmup
+                    changed = True
+            
+            if not self._ramping:
+                self._thread = None
+                return False, changed
+            return True, changed
+    
+    def _run(self):
+        """定时器线程"""
+        while not self._stop_event.wait(self.interval):
+            ramping, changed = self._tick(time.monotonic())
+            # 在控制器锁之外发布新版本，避免与服务池写锁形成锁顺序问题
+            if changed:
+                self.pool._on_backend_changed()
+            if not ramping:
+                return
+    
+    def get_status(self) -> Dict[str, float]:
+        """获取处于慢启动的后端及其系数"""
+        with self._lock:
+            return {backend_id: backend.warmup for backend_id, (backend, _) in self._ramping.items()}
+    
+    def stop(self):
+        """停止慢启动，所有后端恢复完整权重"""
+        self._stop_event.set()
+        with self._lock:
+            for backend, _ in self._ramping.values():
+                backend.warmup = 1.0
+            self._ramping.clear()
+            self._thread = None
+
 class BackendPool:
     """后端服务池"""
     
     def __init__(self):
         self.backends: Dict[str, Backend] = {}
         self._lock = threading.RWMutex()
+        self._version = 0
+        self._snapshot = PoolSnapshot(0, ())
+        self.slow_start: Optional[SlowStartController] = None
+    
+    def _publish(self):
+        """重建并发布快照（调用方需持有写锁）"""
+        self._version += 1
+        snapshot = PoolSnapshot(self._version, tuple(self.backends.values()))
+        # 慢启动系数必须在新快照可见之前设置好
+        if self.slow_start is not None:
+            self.slow_start.on_publish(self._snapshot, snapshot)
+        self._snapshot = snapshot
+    
+    def _on_backend_changed(self):
+        """后端状态变化回调"""
+        with self._lock.write_lock():
+            self._publish()
     
     def add_backend(self, backend: Backend):
         """添加后端服务"""
         with self._lock.write_lock():
+            old = self.backends.get(backend.id)
+            if old is not None and old is not backend:
+                old._pools.discard(self)
             self.backends[backend.id] = backend
+            backend._pools.add(self)
+            self._publish()
     
     def remove_backend(self, backend_id: str):
         """移除后端服务"""
         with self._lock.write_lock():
             if backend_id in self.backends:
-                del self.backends[backend_id]
+                self.backends.pop(backend_id)._pools.discard(self)
+                self._publish()
+    
+    def get_snapshot(self) -> PoolSnapshot:
+        """获取当前快照（无锁）"""
+        return self._snapshot
     
     def get_backend(self, backend_id: str) -> Optional[Backend]:
         """获取指定后端服务"""
-        with self._lock.read_lock():
-            return self.backends.get(backend_id)
+        return self._snapshot.by_id.get(backend_id)
     
     def get_all_backends(self) -> List[Backend]:
         """获取所有后端服务"""
-        with self._lock.read_lock():
-            return list(self.backends.values())
+        return list(self._snapshot.backends)
     
-    def get_healthy_backends(self) -> List[Backend]:
-        """获取健康的后端服务"""
-        with self._lock.read_lock():
-            return [backend for backend in self.backends.values() 
-                   if backend.is_healthy]
+    def get_healthy_backends(self) -> Tuple[Backend, ...]:
+        """获取健康的后端服务（返回快照中的只读元组）"""
+        return self._snapshot.healthy
     
     def size(self) -> int:
         """获取后端服务数量"""
-        with self._lock.read_lock():
-            return len(self.backends)
+        return len(self._snapshot.backends)
     
     def update_backends(self, backends: List[Backend]):
         """更新后端服务列表"""
         with self._lock.write_lock():
+            for backend in self.backends.values():
+                backend._pools.discard(self)
             self.backends.clear()
             for backend in backends:
                 self.backends[backend.id] = backend
+                backend._pools.add(self)
+            self._publish()
 
 class LoadBalancer(ABC):
     """负载均衡器抽象基类"""
@@ -141,6 +426,14 @@ class LoadBalancer(ABC):
         """获取下一个后端服务"""
         pass
     
+    def next_backends(self, client_ips: Sequence[Optional[str]]) -> List[Optional[Backend]]:
+        """批量获取后端服务，结果与逐个调用 next_backend 一致
+        
+        默认实现逐个调用 next_backend，各算法可覆盖此方法，
+        只读取一次快照、只获取一次锁来完成整批选择。
+        """
+        return [self.next_backend(client_ip) for client_ip in client_ips]
+    
     def add_backend(self, backend: Backend):
         """添加后端服务"""
         self.pool.add_backend(backend)
@@ -157,22 +450,57 @@ class LoadBalancer(ABC):
         """获取所有后端服务"""
         return self.pool.get_all_backends()
     
-    def get_healthy_backends(self) -> List[Backend]:
+    def get_healthy_backends(self) -> Tuple[Backend, ...]:
         """获取健康的后端服务"""
         return self.pool.get_healthy_backends()
     
+    def get_snapshot(self) -> PoolSnapshot:
+        """获取后端服务池快照"""
+        return self.pool.get_snapshot()
+    
     def update_backends(self, backends: List[Backend]):
         """更新后端服务列表"""
         self.pool.update_backends(backends)
     
+    def enable_slow_start(self, window: float = 30.0, floor: float = 0.1,
+                          interval: float = 1.0, steps: int = 10) -> SlowStartController:
+        """启用慢启动
+        
+        此后新加入或从不健康恢复的后端，其有效权重在 window 秒内从
+        floor × weight 分 steps 级升到 weight。已有的后端不受影响。
+        """
+        controller = SlowStartController(self.pool, window, floor, interval, steps)
+        with self.pool._lock.write_lock():
+            previous, self.pool.slow_start = self.pool.slow_start, controller
+        if previous is not None:
+            previous.stop()
+        return controller
+    
+    def disable_slow_start(self):
+        """停用慢启动，所有后端立即恢复完整权重"""
+        with self.pool._lock.write_lock():
+            controller, self.pool.slow_start = self.pool.slow_start, None
+        if controller is not None:
+            controller.stop()
+            self.pool._on_backend_changed()
+    
     def get_stats(self) -> Dict[str, Any]:
         """获取统计信息"""
-        backends = self.get_all_backends()
-        healthy_count = len(self.get_healthy_backends())
+        snapshot = self.get_snapshot()
+        backends = snapshot.backends
+        healthy_count = len(snapshot.healthy)
         
-        total_requests = sum(b.total_requests for b in backends)
-        total_errors = sum(b.error_count for b in backends)
-        avg_response_time = sum(b.get_average_response_time() for b in backends) / len(backends) if backends else 0
+        # 按BackendTable分组，直接对列求和
+        total_requests = 0
+        total_errors = 0
+        response_time_sum = 0.0
+        for table, slots in _group_slots(backends).items():
+            total_requests += table.sum('total_requests', slots)
+            total_errors += table.sum('error_count', slots)
+            requests = table.values('total_requests', slots)
+            times = table.values('total_response_time', slots)
+            response_time_sum += sum(t / r for t, r in zip(times, requests) if r)
+        avg_response_time = response_time_sum / len(backends) if backends else 0
         
         return {
             'algorithm': self.__class__.__name__,
@@ -186,6 +514,13 @@ class LoadBalancer(ABC):
             'backends': [b.to_dict() for b in backends]
         }
 
+def _group_slots(backends: Sequence[Backend]) -> Dict[BackendTable, List[int]]:
+    """按所在的BackendTable对后端槽位分组"""
+    groups: Dict[BackendTable, List[int]] = {}
+    for backend in backends:
+        groups.setdefault(backend.table, []).append(backend.slot)
+    return groups
+
 # 简化的读写锁实现（仅用于演示）
 class RWLock:
     """简化的读写锁"""
@@ -0,0 +1,73 @@
+from typing import Dict, Iterable
+import os
+import threading
+
+# 默认分片数：与CPU核数相当即可，再多只会增加读取时的合并开销
+DEFAULT_SHARDS = min(max(os.cpu_count() or 1, 4), 32)
+
+def current_shard(shards: int) -> int:
+    """当前线程对应的分片下标
+    
+    使用内核线程ID而不是 get_ident()：后者是pthread地址，低位总是对齐的，
+    取模后会集中到少数分片上。
+    """
+    return threading.get_native_id() % shards
+
+class StripedCounter:
+    """分片计数器（类似Java的LongAdder）
+    
+    一组命名计数器按线程分散到多个分片，每个分片有自己的锁，写入时
+    只会与落在同一分片的线程竞争；读取时再把所有分片合并，得到精确的总数。
+    """
+    
+    def __init__(self, names: Iterable[str], shards: int = DEFAULT_SHARDS):
+        """
+        Args:
+            names: 计数器名称
+            shards: 分片数
+        """
+        self.names = tuple(names)
+        self.shards = shards
+        self._index = {name: i for i, name in enumerate(self.names)}
+        self._values = [[0] * len(self.names) for _ in range(shards)]
+        self._locks = [threading.Lock() for _ in range(shards)]
+    
+    def add(self, name: str, value=1):
+        """累加单个计数器"""
+        shard = current_shard(self.shards)
+        with self._locks[shard]:
+            self._values[shard][self._index[name]] += value
+    
+    def add_many(self, values: Dict[str, float]):
+        """在同一分片内一次累加多个计数器"""
+        shard = current_shard(self.shards)
+        index = self._index
+        with self._locks[shard]:
+            row = self._values[shard]
+            for name, value in values.items():
+                row[index[name]] += value
+    
+    def get(self, name: str):
+        """获取单个计数器的总数"""
+        i = self._index[name]
+        total = 0
+        for lock, row in zip(self._locks, self._values):
+            with lock:
+                total += row[i]
+        return total
+    
+    def snapshot(self) -> Dict[str, float]:
+        """合并所有分片，返回各计数器的总数"""
+        totals = [0] * len(self.names)
+        for lock, row in zip(self._locks, self._values):
+            with lock:
+                values = list(row)
+            for i, value in enumerate(values):
+                totals[i] += value
+        return dict(zip(self.names, totals))
+    
+    def reset(self):
+        """清零所有计数器"""
+        for lock, row in zip(self._locks, self._values):
+            with lock:
+                row[:] = [0] * len(self.names)
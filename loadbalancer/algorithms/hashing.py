@@ -0,0 +1,363 @@
+"""
+一致性哈希引擎
+提供快速的64位非加密哈希，以及 ketama 哈希环、Maglev 查找表和
+Jump 一致性哈希三种可互换的引擎
+"""
+
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Tuple, Union
+from array import array
+from bisect import bisect_right
+import hashlib
+import socket
+import threading
+
+from algorithms.base import Backend, PoolSnapshot
+
+try:
+    import xxhash
+except ImportError:  # xxhash是可选依赖
+    xxhash = None
+
+MASK64 = (1 << 64) - 1
+
+def splitmix64(x: int) -> int:
+    """splitmix64混合函数，把整数打散为均匀分布的64位值"""
+    x = (x + 0x9E3779B97F4A7C15) & MASK64
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & MASK64
+    return x ^ (x >> 31)
+
+if xxhash is not None:
+    def hash64(key: Union[str, bytes]) -> int:
+        """计算64位非加密哈希"""
+        if isinstance(key, str):
+            key = key.encode()
+        return xxhash.xxh3_64_intdigest(key)
+else:
+    def hash64(key: Union[str, bytes]) -> int:
+        """计算64位哈希（未安装xxhash时使用C实现的blake2b，截取8字节）"""
+        if isinstance(key, str):
+            key = key.encode()
+        return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'little')
+
+def ip_to_int(ip: str) -> int:
+    """把IPv4/IPv6地址直接解析为整数，无法解析时退回到字符串哈希"""
+    try:
+        return int.from_bytes(socket.inet_pton(socket.AF_INET, ip), 'big')
+    except OSError:
+        pass
+    try:
+        return int.from_bytes(socket.inet_pton(socket.AF_INET6, ip), 'big')
+    except OSError:
+        return hash64(ip)
+
+class HashEngine(ABC):
+    """一致性哈希引擎抽象基类
+    
+    引擎跟随服务池快照的版本同步：成员变化时增量更新，健康状态变化时
+    预先计算好跳过不健康节点的映射，查询时不需要再遍历。映射只取决于成员
+    和健康状态，只有权重或慢启动系数变化的新版本不需要重建。
+    """
+    
+    def __init__(self):
+        self._version = -1
+        self._members: Tuple[Tuple[Backend, ...], Tuple[Backend, ...]] = ((), ())  # (全部后端, 健康后端)
+        self._lock = threading.Lock()
+    
+    def sync(self, snapshot: PoolSnapshot):
+        """与服务池快照同步"""
+        if self._version == snapshot.version:
+            return
+        with self._lock:
+            if self._version != snapshot.version:
+                members = (snapshot.backends, snapshot.healthy)
+                if self._version < 0 or members != self._members:
+                    self._rebuild(snapshot)
+                    self._members = members
+                self._version = snapshot.version
+    
+    @abstractmethod
+    def _rebuild(self, snapshot: PoolSnapshot):
+        """根据新快照更新内部结构（已持有锁）"""
+        pass
+    
+    @abstractmethod
+    def lookup(self, key_hash: int, snapshot: PoolSnapshot) -> Optional[Backend]:
+        """根据哈希值查找健康的后端"""
+        pass
+    
+    @abstractmethod
+    def get_status(self) -> Dict[str, Any]:
+        """获取引擎状态（用于调试）"""
+        pass
+
+class _RingState:
+    """ketama哈希环的不可变状态"""
+    
+    __slots__ = ('keys', 'owners', 'resolved', 'backends')
+    
+    def __init__(self, keys: array, owners: array, resolved: array, backends: List[Optional[Backend]]):
+        self.keys = keys          # 排序后的虚拟节点哈希值
+        self.owners = owners      # 与keys平行的后端槽位
+        self.resolved = resolved  # 每个位置顺时针方向第一个健康节点的槽位，-1表示没有
+        self.backends = backends  # 槽位 -> Backend
+
+class KetamaRing(HashEngine):
+    """ketama哈希环
+    
+    排序后的虚拟节点哈希值保存在 array('Q') 中并用二分查找定位。
+    增删后端时只计算该后端自己的虚拟节点并插入/删除，不重建整个环。
+    """
+    
+    def __init__(self, virtual_nodes: int = 150):
+        super().__init__()
+        self.virtual_nodes = virtual_nodes
+        self._slots: Dict[str, int] = {}                 # backend_id -> 槽位
+        self._slot_keys: Dict[int, List[int]] = {}       # 槽位 -> 该后端的虚拟节点哈希值
+        self._free_slots: List[int] = []
+        self._state = _RingState(array('Q'), array('i'), array('i'), [])
+    
+    def _virtual_keys(self, backend: Backend) -> List[int]:
+        return [hash64(f"{backend.address}:{i}") for i in range(self.virtual_nodes)]
+    
+    def _rebuild(self, snapshot: PoolSnapshot):
+        state = self._state
+        keys, owners = state.keys, state.owners
+        slot_backends = list(state.backends)
+        current = snapshot.by_id
+        
+        removed = [backend_id for backend_id in self._slots
+                   if backend_id not in current or slot_backends[self._slots[backend_id]] is not current[backend_id]]
+        added = [b for b in snapshot.backends
+                 if b.id not in self._slots or b.id in removed]
+        
+        if removed or added:
+            # 在副本上修改，保证并发读取的状态始终完整
+            keys, owners = array('Q', keys), array('i', owners)
+            
+            for backend_id in removed:
+                slot = self._slots.pop(backend_id)
+                for key in self._slot_keys.pop(slot):
+                    pos = bisect_right(keys, key) - 1
+                    while pos >= 0 and keys[pos] == key and owners[pos] != slot:
+                        pos -= 1
+                    if pos >= 0 and keys[pos] == key:
+                        del keys[pos]
+                        del owners[pos]
+                slot_backends[slot] = None
+                self._free_slots.append(slot)
+            
+            for backend in added:
+                if self._free_slots:
+                    slot = self._free_slots.pop()
+                    slot_backends[slot] = backend
+                else:
+                    slot = len(slot_backends)
+                    slot_backends.append(backend)
+                self._slots[backend.id] = slot
+                backend_keys = self._virtual_keys(backend)
+                self._slot_keys[slot] = backend_keys
+                for key in backend_keys:
+                    pos = bisect_right(keys, key)
+                    keys.insert(pos, key)
+                    owners.insert(pos, slot)
+        
+        # 预先计算每个位置顺时针的第一个健康节点
+        healthy_slots = {self._slots[b.id] for b in snapshot.healthy if b.id in self._slots}
+        size = len(keys)
+        resolved = array('i', [-1]) * size
+        if healthy_slots and size:
+            # 从最后一个健康节点开始反向扫描，处理环形回绕
+            last = size - 1
+            while owners[last] not in healthy_slots:
+                last -= 1
+            target = owners[last]
+            for pos in range(last, last - size, -1):
+                owner = owners[pos]
+                if owner in healthy_slots:
+                    target = owner
+                resolved[pos] = target
+        
+        self._state = _RingState(keys, owners, resolved, slot_backends)
+    
+    def lookup(self, key_hash: int, snapshot: PoolSnapshot) -> Optional[Backend]:
+        state = self._state
+        if not state.keys:
+            return None
+        pos = bisect_right(state.keys, key_hash)
+        if pos == len(state.keys):
+            pos = 0
+        slot = state.resolved[pos]
+        return state.backends[slot] if slot >= 0 else None
+    
+    def iter_owners(self, key_hash: int):
+        """从哈希值位置开始顺时针遍历不重复的后端（用于有界负载等扩展）"""
+        state = self._state
+        size = len(state.keys)
+        if not size:
+            return
+        start = bisect_right(state.keys, key_hash)
+        seen = set()
+        for i in range(size):
+            slot = state.owners[(start + i) % size]
+            if slot not in seen:
+                seen.add(slot)
+                yield state.backends[slot]
+    
+    def get_status(self) -> Dict[str, Any]:
+        state = self._state
+        distribution: Dict[str, int] = {}
+        for slot in state.owners:
+            backend_id = state.backends[slot].id
+            distribution[backend_id] = distribution.get(backend_id, 0) + 1
+        return {
+            'engine': 'ketama',
+            'total_virtual_nodes': len(state.keys),
+            'virtual_nodes_per_backend': self.virtual_nodes,
+            'backend_distribution': distribution,
+            'ring_size': len(state.keys)
+        }
+
+class MaglevTable(HashEngine):
+    """Maglev一致性哈希查找表
+    
+    查找表只由健康的后端填充，查询是一次取模和数组访问。每个后端的
+    排列参数（offset, skip）按后端缓存，成员或健康状态变化时只需重新填表。
+    """
+    
+    def __init__(self, table_size: int = 65537):
+        super().__init__()
+        self.table_size = table_size  # 应为质数，且远大于后端数量
+        self._permutations: Dict[str, Tuple[int, int]] = {}  # backend_id -> (offset, skip)
+        self._table = array('i')
+        self._backends: Tuple[Backend, ...] = ()
+    
+    def _permutation(self, backend: Backend) -> Tuple[int, int]:
+        perm = self._permutations.get(backend.id)
+        if perm is None:
+            h = hash64(backend.address)
+            offset = h % self.table_size
+            skip = splitmix64(h) % (self.table_size - 1) + 1
+            perm = self._permutations[backend.id] = (offset, skip)
+        return perm
+    
+    def _rebuild(self, snapshot: PoolSnapshot):
+        for backend_id in list(self._permutations):
+            if backend_id not in snapshot.by_id:
+                del self._permutations[backend_id]
+        
+        backends = snapshot.healthy
+        size = self.table_size
+        table = array('i', [-1]) * size
+        if backends:
+            perms = [self._permutation(b) for b in backends]
+            offsets = [p[0] for p in perms]
+            skips = [p[1] for p in perms]
+            nexts = [0] * len(backends)
+            filled = 0
+            while filled < size:
+                for i in range(len(backends)):
+                    c = (offsets[i] + nexts[i] * skips[i]) % size
+                    while table[c] >= 0:
+                        nexts[i] += 1
+                        c = (offsets[i] + nexts[i] * skips[i]) % size
+                    table[c] = i
+                    nexts[i] += 1
+                    filled += 1
+                    if filled == size:
+                        break
+        
+        self._backends, self._table = backends, table
+    
+    def lookup(self, key_hash: int, snapshot: PoolSnapshot) -> Optional[Backend]:
+        backends, table = self._backends, self._table
+        if not backends:
+            return None
+        return backends[table[key_hash % self.table_size]]
+    
+    def get_status(self) -> Dict[str, Any]:
+        backends, table = self._backends, self._table
+        distribution: Dict[str, int] = {}
+        for i in table:
+            if i >= 0:
+                backend_id = backends[i].id
+                distribution[backend_id] = distribution.get(backend_id, 0) + 1
+        return {
+            'engine': 'maglev',
+            'table_size': self.table_size,
+            'backend_distribution': distribution
+        }
+
+def jump_hash(key: int, num_buckets: int) -> int:
+    """Jump一致性哈希（Lamping & Veach），返回[0, num_buckets)中的桶号"""
+    b, j = -1, 0
+    while j < num_buckets:
+        b = j
+        key = (key * 2862933555777941757 + 1) & MASK64
+        j = int((b + 1) * (float(1 << 31) / float((key >> 33) + 1)))
+    return b
+
+class JumpHash(HashEngine):
+    """Jump一致性哈希
+    
+    不需要额外内存，桶按服务池中后端的顺序编号。桶号对应的后端不健康时，
+    使用预先计算好的“下一个健康桶”映射，跳过不健康节点为O(1)。
+    注意：只有在末尾增删后端时映射变化最小。
+    """
+    
+    def __init__(self):
+        super().__init__()
+        self._backends: Tuple[Backend, ...] = ()
+        self._resolved = array('i')
+    
+    def _rebuild(self, snapshot: PoolSnapshot):
+        backends = snapshot.backends
+        size = len(backends)
+        resolved = array('i', [-1]) * size
+        healthy = [i for i, b in enumerate(backends) if b.id in snapshot.index]
+        if healthy:
+            target = healthy[0]
+            for i in range(size - 1, -1, -1):
+                if backends[i].id in snapshot.index:
+                    target = i
+                resolved[i] = target
+        self._backends, self._resolved = backends, resolved
+    
+    def lookup(self, key_hash: int, snapshot: PoolSnapshot) -> Optional[Backend]:
+        backends, resolved = self._backends, self._resolved
+        if not backends:
+            return None
+        target = resolved[jump_hash(key_hash, len(backends))]
+        return backends[target] if target >= 0 else None
+    
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            'engine': 'jump',
+            'buckets': len(self._backends)
+        }
+
+HASH_ENGINES = {
+    'ketama': KetamaRing,
+    'maglev': MaglevTable,
+    'jump': JumpHash,
+}
+
+def create_hash_engine(name: str, **kwargs) -> HashEngine:
+    """创建哈希引擎
+    
+    Args:
+        name: 引擎名称（ketama/maglev/jump）
+        **kwargs: virtual_nodes（ketama）、table_size（maglev）
+    
+    Raises:
+        ValueError: 未知的引擎名称
+    """
+    if name == 'ketama':
+        return KetamaRing(virtual_nodes=kwargs.get('virtual_nodes', 150))
+    if name == 'maglev':
+        return MaglevTable(table_size=kwargs.get('table_size', 65537))
+    if name == 'jump':
+        return JumpHash()
+    available = ', '.join(HASH_ENGINES.keys())
+    raise ValueError(f"Unknown hash engine '{name}'. Available: {available}")
@@ -0,0 +1,101 @@
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+class IndexedMinHeap:
+    """可按key原地更新的最小堆
+    
+    记录每个元素在堆中的位置，更新某个元素的优先级时只需要做一次
+    上浮或下沉，时间复杂度O(log n)；取最小元素为O(1)。
+    """
+    
+    def __init__(self):
+        self._heap: List[list] = []  # [priority, item_key, item]
+        self._positions: Dict[Hashable, int] = {}  # item_key -> 堆中的下标
+    
+    def __len__(self) -> int:
+        return len(self._heap)
+    
+    def __contains__(self, item_key: Hashable) -> bool:
+        return item_key in self._positions
+    
+    def clear(self):
+        """清空堆"""
+        self._heap.clear()
+        self._positions.clear()
+    
+    def build(self, entries: List[Tuple[Any, Hashable, Any]]):
+        """用 (priority, item_key, item) 列表批量建堆，O(n)"""
+        self._heap = [list(entry) for entry in entries]
+        self._positions = {entry[1]: i for i, entry in enumerate(self._heap)}
+        for i in reversed(range(len(self._heap) // 2)):
+            self._sift_down(i)
+    
+    def push(self, priority: Any, item_key: Hashable, item: Any):
+        """插入元素，已存在时更新其优先级"""
+        if item_key in self._positions:
+            self.update(item_key, priority)
+            return
+        self._heap.append([priority, item_key, item])
+        self._positions[item_key] = len(self._heap) - 1
+        self._sift_up(len(self._heap) - 1)
+    
+    def remove(self, item_key: Hashable):
+        """移除元素"""
+        pos = self._positions.pop(item_key, None)
+        if pos is None:
+            return
+        last = self._heap.pop()
+        if pos < len(self._heap):
+            self._heap[pos] = last
+            self._positions[last[1]] = pos
+            self._sift_down(pos)
+            self._sift_up(self._positions[last[1]])
+    
+    def update(self, item_key: Hashable, priority: Any) -> bool:
+        """更新元素的优先级，元素不存在时返回False"""
+        pos = self._positions.get(item_key)
+        if pos is None:
+            return False
+        entry = self._heap[pos]
+        old_priority = entry[0]
+        entry[0] = priority
+        if priority < old_priority:
+            self._sift_up(pos)
+        elif old_priority < priority:
+            self._sift_down(pos)
+        return True
+    
+    def peek(self) -> Optional[Any]:
+        """获取优先级最小的元素"""
+        return self._heap[0][2] if self._heap else None
+    
+    def _swap(self, i: int, j: int):
+        heap = self._heap
+        heap[i], heap[j] = heap[j], heap[i]
+        self._positions[heap[i][1]] = i
+        self._positions[heap[j][1]] = j
+    
+    def _sift_up(self, pos: int):
+        heap = self._heap
+        while pos > 0:
+            parent = (pos - 1) >> 1
+            if heap[pos][0] < heap[parent][0]:
+                self._swap(pos, parent)
+                pos = parent
+            else:
+                break
+    
+    def _sift_down(self, pos: int):
+        heap = self._heap
+        size = len(heap)
+        while True:
+            smallest = pos
+            left = 2 * pos + 1
+            right = left + 1
+            if left < size and heap[left][0] < heap[smallest][0]:
+                smallest = left
+            if right < size and heap[right][0] < heap[smallest][0]:
+                smallest = right
+            if smallest == pos:
+                break
+            self._swap(pos, smallest)
+            pos = smallest
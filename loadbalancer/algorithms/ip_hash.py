@@ -1,19 +1,70 @@
-from algorithms.base import LoadBalancer, Backend
-from typing import Optional, Dict, List
+from algorithms.base import LoadBalancer, Backend, PoolSnapshot
+from algorithms.hashing import HashEngine, create_hash_engine, hash64, ip_to_int, splitmix64, MASK64
+from typing import Optional, Dict, List, Tuple, Sequence
+from collections import OrderedDict
 import hashlib
-import bisect
-import threading
+import math
 
 class IPHashBalancer(LoadBalancer):
-    """IP哈希负载均衡器"""
+    """IP哈希负载均衡器
     
-    def __init__(self, hash_function='md5'):
+    hash_function 为 'splitmix64' 时直接把IPv4/IPv6地址解析为整数再做64位混合，
+    避免每次请求计算MD5；rendezvous=True 时使用最高随机权重（HRW）哈希，
+    后端健康状态抖动时只有落在该后端上的客户端会被重新映射。
+    最近的 ip -> 后端 结果缓存在有界LRU中，按服务池快照版本失效。
+    """
+    
+    def __init__(self, hash_function='md5', rendezvous: bool = False, cache_size: int = 4096):
         super().__init__()
         self.hash_function = hash_function
+        self.rendezvous = rendezvous
+        self.cache_size = cache_size
+        self._cache: OrderedDict = OrderedDict()  # client_ip -> (快照版本, Backend)
+        self._backend_keys: Tuple[int, Tuple[Tuple[int, Backend], ...]] = (-1, ())  # (快照版本, ((后端哈希, Backend), ...))
+    
+    def _hash(self, client_ip: str) -> int:
+        """计算客户端IP的哈希值"""
+        if self.hash_function == 'md5':
+            return int(hashlib.md5(client_ip.encode()).hexdigest(), 16)
+        elif self.hash_function == 'sha1':
+            return int(hashlib.sha1(client_ip.encode()).hexdigest(), 16)
+        elif self.hash_function == 'splitmix64':
+            return splitmix64(ip_to_int(client_ip))
+        elif self.hash_function == 'xxhash':
+            return hash64(client_ip)
+        else:
+            # 默认使用简单的哈希
+            return hash(client_ip)
+    
+    def _select(self, client_ip: str, snapshot: PoolSnapshot) -> Backend:
+        """根据哈希值选择后端（不使用缓存）"""
+        backends = snapshot.healthy
+        hash_value = self._hash(client_ip)
+        
+        if not self.rendezvous:
+            # 使用哈希值对后端数量取模
+            return backends[hash_value % len(backends)]
+        
+        # HRW：选择 mix(客户端哈希 ^ 后端哈希) 最大的后端
+        version, backend_keys = self._backend_keys
+        if version != snapshot.version:
+            backend_keys = tuple((hash64(b.id), b) for b in backends)
+            self._backend_keys = (snapshot.version, backend_keys)
+        
+        client_key = hash_value & MASK64
+        best_score = -1
+        selected = backends[0]
+        for backend_key, backend in backend_keys:
+            score = splitmix64(client_key ^ backend_key)
+            if score > best_score:
+                best_score = score
+                selected = backend
+        return selected
     
     def next_backend(self, client_ip: str = None) -> Optional[Backend]:
         """使用IP哈希算法获取后端服务"""
-        backends = self.get_healthy_backends()
+        snapshot = self.get_snapshot()
+        backends = snapshot.healthy
         if not backends:
             return None
         
@@ -21,117 +72,214 @@ class IPHashBalancer(LoadBalancer):
             # 如果没有客户端IP，返回第一个后端
             return backends[0]
         
-        # 计算客户端IP的哈希值
-        if self.hash_function == 'md5':
-            hash_value = int(hashlib.md5(client_ip.encode()).hexdigest(), 16)
-        elif self.hash_function == 'sha1':
-            hash_value = int(hashlib.sha1(client_ip.encode()).hexdigest(), 16)
-        else:
-            # 默认使用简单的哈希
-            hash_value = hash(client_ip)
+        if self.cache_size <= 0:
+            return self._select(client_ip, snapshot)
         
-        # 使用哈希值对后端数量取模
-        index = hash_value % len(backends)
-        return backends[index]
+        cached = self._cache.get(client_ip)
+        if cached is not None and cached[0] == snapshot.version:
+            with self._lock:
+                if client_ip in self._cache:
+                    self._cache.move_to_end(client_ip)
+            return cached[1]
+        
+        backend = self._select(client_ip, snapshot)
+        with self._lock:
+            self._cache[client_ip] = (snapshot.version, backend)
+            self._cache.move_to_end(client_ip)
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return backend
+    
+    def next_backends(self, client_ips: Sequence[Optional[str]]) -> List[Optional[Backend]]:
+        """批量获取后端服务，整批共享一次快照，缓存只加锁一次"""
+        snapshot = self.get_snapshot()
+        backends = snapshot.healthy
+        if not backends:
+            return [None] * len(client_ips)
+        
+        result = []
+        misses = {}
+        cache = self._cache
+        for client_ip in client_ips:
+            if not client_ip:
+                result.append(backends[0])
+                continue
+            cached = cache.get(client_ip) if self.cache_size > 0 else None
+            if cached is not None and cached[0] == snapshot.version:
+                result.append(cached[1])
+                continue
+            backend = misses.get(client_ip)
+            if backend is None:
+                backend = misses[client_ip] = self._select(client_ip, snapshot)
+            result.append(backend)
+        
+        if misses and self.cache_size > 0:
+            with self._lock:
+                for client_ip, backend in misses.items():
+                    cache[client_ip] = (snapshot.version, backend)
+                    cache.move_to_end(client_ip)
+                while len(cache) > self.cache_size:
+                    cache.popitem(last=False)
+        return result
+    
+    def clear_cache(self):
+        """清空 ip -> 后端 缓存"""
+        with self._lock:
+            self._cache.clear()
 
 class ConsistentHashBalancer(LoadBalancer):
     """一致性哈希负载均衡器
     
-    相比简单的IP哈希，一致性哈希在节点变化时能提供更好的稳定性
+    相比简单的IP哈希，一致性哈希在节点变化时能提供更好的稳定性。
+    哈希引擎可选 ketama 哈希环（默认）、Maglev 查找表或 Jump 一致性哈希。
     """
     
-    def __init__(self, virtual_nodes: int = 150):
+    def __init__(self, virtual_nodes: int = 150, hash_engine: str = 'ketama', table_size: int = 65537):
         super().__init__()
         self.virtual_nodes = virtual_nodes
-        self.hash_ring: Dict[int, str] = {}  # hash_value -> backend_id
-        self.sorted_keys: List[int] = []
-        self._ring_lock = threading.Lock()
-    
-    def _hash(self, key: str) -> int:
-        """计算哈希值"""
-        return int(hashlib.md5(key.encode()).hexdigest(), 16)
-    
-    def _rebuild_ring(self):
-        """重建哈希环"""
-        with self._ring_lock:
-            self.hash_ring.clear()
-            self.sorted_keys.clear()
-            
-            backends = self.get_all_backends()
-            for backend in backends:
-                # 为每个后端创建虚拟节点
-                for i in range(self.virtual_nodes):
-                    virtual_key = f"{backend.address}:{i}"
-                    hash_value = self._hash(virtual_key)
-                    self.hash_ring[hash_value] = backend.id
-            
-            # 对哈希值进行排序
-            self.sorted_keys = sorted(self.hash_ring.keys())
-    
-    def add_backend(self, backend: Backend):
-        """添加后端服务"""
-        super().add_backend(backend)
-        self._rebuild_ring()
-    
-    def remove_backend(self, backend_id: str):
-        """移除后端服务"""
-        super().remove_backend(backend_id)
-        self._rebuild_ring()
-    
-    def update_backends(self, backends: List[Backend]):
-        """更新后端服务列表"""
-        super().update_backends(backends)
-        self._rebuild_ring()
+        self.hash_engine = hash_engine
+        self.engine: HashEngine = create_hash_engine(
+            hash_engine, virtual_nodes=virtual_nodes, table_size=table_size
+        )
     
     def next_backend(self, client_ip: str = None) -> Optional[Backend]:
         """使用一致性哈希算法获取后端服务"""
+        snapshot = self.get_snapshot()
         if not client_ip:
-            backends = self.get_healthy_backends()
-            return backends[0] if backends else None
-        
-        with self._ring_lock:
-            if not self.sorted_keys:
-                self._rebuild_ring()
-            
-            if not self.sorted_keys:
-                return None
-            
-            # 计算客户端IP的哈希值
-            hash_value = self._hash(client_ip)
-            
-            # 在哈希环上找到第一个大于等于hash值的节点
-            idx = bisect.bisect_right(self.sorted_keys, hash_value)
-            
-            # 如果没找到，使用第一个节点（环形结构）
-            if idx == len(self.sorted_keys):
-                idx = 0
-            
-            # 找到对应的后端
-            backend_id = self.hash_ring[self.sorted_keys[idx]]
-            backend = self.get_backend(backend_id)
-            
-            # 如果后端不健康，尝试找下一个健康的后端
-            if backend and not backend.is_healthy:
-                for i in range(1, len(self.sorted_keys)):
-                    next_idx = (idx + i) % len(self.sorted_keys)
-                    next_backend_id = self.hash_ring[self.sorted_keys[next_idx]]
-                    next_backend = self.get_backend(next_backend_id)
-                    if next_backend and next_backend.is_healthy:
-                        return next_backend
-                return None  # 没有健康的后端
-            
-            return backend
+            return snapshot.healthy[0] if snapshot.healthy else None
+        
+        # 成员、健康状态变化都会产生新的快照版本，引擎在此按需增量同步，
+        # 批量添加后端时只会同步一次
+        self.engine.sync(snapshot)
+        return self.engine.lookup(hash64(client_ip), snapshot)
+    
+    def next_backends(self, client_ips: Sequence[Optional[str]]) -> List[Optional[Backend]]:
+        """批量获取后端服务，整批只同步一次哈希引擎"""
+        snapshot = self.get_snapshot()
+        if not snapshot.healthy:
+            return [None] * len(client_ips)
+        
+        self.engine.sync(snapshot)
+        lookup = self.engine.lookup
+        first = snapshot.healthy[0]
+        return [lookup(hash64(ip), snapshot) if ip else first for ip in client_ips]
+    
+    def get_ring_status(self) -> Dict[str, any]:
+        """获取哈希环状态（用于调试）"""
+        self.engine.sync(self.get_snapshot())
+        return self.engine.get_status()
+
+class BoundedConsistentHashBalancer(ConsistentHashBalancer):
+    """有界负载一致性哈希负载均衡器
+    
+    在ketama哈希环上查找时，如果目标后端的活跃连接数已达到
+    (1+epsilon) × 平均负载的上限，则沿环继续找下一个后端。
+    既保留了缓存亲和性，又避免热点客户端把单个后端压垮。
+    """
+    
+    def __init__(self, virtual_nodes: int = 150, epsilon: float = 0.25):
+        super().__init__(virtual_nodes=virtual_nodes, hash_engine='ketama')
+        if epsilon < 0:
+            raise ValueError("epsilon must be non-negative")
+        self.epsilon = epsilon
+        self._loads: Dict[str, int] = {}  # backend_id -> 已计入总负载的连接数
+        self._total_load = 0
+        self._load_backends: Tuple[Backend, ...] = ()
+        self._load_version = -1
+    
+    def _ensure_load_index(self, snapshot: PoolSnapshot):
+        """快照版本变化时重新统计健康后端的总负载"""
+        if self._load_version == snapshot.version:
+            return
+        with self._lock:
+            if self._load_version == snapshot.version:
+                return
+            for backend in self._load_backends:
+                backend.remove_active_listener(self)
+            for backend in snapshot.healthy:
+                backend.add_active_listener(self)
+            self._loads = {b.id: b.active_connections for b in snapshot.healthy}
+            self._total_load = sum(self._loads.values())
+            self._load_backends = snapshot.healthy
+            self._load_version = snapshot.version
+    
+    def _on_active_changed(self, backend: Backend):
+        """Backend活跃连接数变化回调，增量维护总负载"""
+        with self._lock:
+            old = self._loads.get(backend.id)
+            if old is None:
+                return
+            current = backend.active_connections
+            self._loads[backend.id] = current
+            self._total_load += current - old
+    
+    def get_load_capacity(self, snapshot: Optional[PoolSnapshot] = None, pending: int = 0) -> int:
+        """计算单个后端允许的最大活跃连接数
+        
+        pending 为批量选择中已经分配、尚未建立的连接数，计入总负载。
+        """
+        if snapshot is None:
+            snapshot = self.get_snapshot()
+        if not snapshot.healthy:
+            return 0
+        self._ensure_load_index(snapshot)
+        average = (self._total_load + pending + 1) / len(snapshot.healthy)
+        return math.ceil(average * (1 + self.epsilon))
+    
+    def next_backend(self, client_ip: str = None) -> Optional[Backend]:
+        """沿哈希环选择第一个未超过负载上限的健康后端"""
+        snapshot = self.get_snapshot()
+        if not client_ip:
+            return snapshot.healthy[0] if snapshot.healthy else None
+        if not snapshot.healthy:
+            return None
+        
+        self.engine.sync(snapshot)
+        capacity = self.get_load_capacity(snapshot)
+        
+        for backend in self.engine.iter_owners(hash64(client_ip)):
+            if backend.id in snapshot.index and backend.active_connections < capacity:
+                return backend
+        
+        # 负载统计与实际连接数存在短暂偏差时，退回到普通一致性哈希的结果
+        return self.engine.lookup(hash64(client_ip), snapshot)
+    
+    def next_backends(self, client_ips: Sequence[Optional[str]]) -> List[Optional[Backend]]:
+        """批量获取后端服务
+        
+        整批只同步一次哈希引擎；已经分给某个后端的请求按多一个连接计入它的
+        负载和总负载，再按同样的上限选择下一个，与逐个选择并建立连接的结果一致。
+        """
+        snapshot = self.get_snapshot()
+        if not snapshot.healthy:
+            return [None] * len(client_ips)
+        
+        self.engine.sync(snapshot)
+        first = snapshot.healthy[0]
+        result = []
+        pending: Dict[str, int] = {}  # backend_id -> 本批已分配的连接数
+        for index, client_ip in enumerate(client_ips):
+            selected = None
+            if not client_ip:
+                selected = first
+            else:
+                key = hash64(client_ip)
+                capacity = self.get_load_capacity(snapshot, index)
+                for backend in self.engine.iter_owners(key):
+                    if (backend.id in snapshot.index and
+                            backend.active_connections + pending.get(backend.id, 0) < capacity):
+                        selected = backend
+                        break
+                if selected is None:
+                    selected = self.engine.lookup(key, snapshot)
+            result.append(selected)
+            pending[selected.id] = pending.get(selected.id, 0) + 1
+        return result
     
     def get_ring_status(self) -> Dict[str, any]:
         """获取哈希环状态（用于调试）"""
-        with self._ring_lock:
-            backend_distribution = {}
-            for backend_id in self.hash_ring.values():
-                backend_distribution[backend_id] = backend_distribution.get(backend_id, 0) + 1
-            
-            return {
-                'total_virtual_nodes': len(self.hash_ring),
-                'virtual_nodes_per_backend': self.virtual_nodes,
-                'backend_distribution': backend_distribution,
-                'ring_size': len(self.sorted_keys)
-            }
\ No newline at end of file
+        status = super().get_ring_status()
+        status['epsilon'] = self.epsilon
+        status['load_capacity'] = self.get_load_capacity()
+        status['total_load'] = self._total_load
+        return status
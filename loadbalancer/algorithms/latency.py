@@ -0,0 +1,183 @@
+from typing import Dict, List, Sequence
+from array import array
+from bisect import bisect_right
+from itertools import accumulate
+import math
+import threading
+
+class LogHistogram:
+    """对数分桶的流式分位数直方图（HDR风格）
+    
+    第i个桶覆盖 (gamma^(i-1), gamma^i]，相对误差不超过 relative_accuracy。
+    桶的数量只取决于取值范围和精度，与样本数无关，插入和删除都是O(1)，
+    分位数查询只需对固定数量的桶做一次累加。
+    """
+    
+    def __init__(self,
+                 relative_accuracy: float = 0.02,
+                 min_value: float = 0.01,
+                 max_value: float = 1e6):
+        """
+        Args:
+            relative_accuracy: 分位数的相对误差
+            min_value: 可区分的最小值，更小的值都落在第一个桶
+            max_value: 可区分的最大值，更大的值都落在最后一个桶
+        """
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self._offset = math.ceil(math.log(min_value) / self._log_gamma)
+        size = math.ceil(math.log(max_value) / self._log_gamma) - self._offset + 1
+        self.counts = array('I', bytes(4 * size))
+        self.count = 0
+    
+    def _bucket(self, value: float) -> int:
+        """计算取值所在的桶"""
+        if value <= 0:
+            return 0
+        index = math.ceil(math.log(value) / self._log_gamma) - self._offset
+        if index < 0:
+            return 0
+        if index >= len(self.counts):
+            return len(self.counts) - 1
+        return index
+    
+    def _value(self, bucket: int) -> float:
+        """桶的代表值（使相对误差最小）"""
+        return 2 * self.gamma ** (bucket + self._offset) / (self.gamma + 1)
+    
+    def add(self, value: float):
+        """添加一个样本"""
+        self.counts[self._bucket(value)] += 1
+        self.count += 1
+    
+    def remove(self, value: float):
+        """移除一个之前添加过的样本"""
+        bucket = self._bucket(value)
+        if self.counts[bucket] > 0:
+            self.counts[bucket] -= 1
+            self.count -= 1
+    
+    def clear(self):
+        """清空直方图"""
+        self.counts = array('I', bytes(4 * len(self.counts)))
+        self.count = 0
+    
+    def quantiles(self, qs: Sequence[float]) -> List[float]:
+        """批量计算分位数，qs中的取值范围为[0, 1]"""
+        if self.count == 0:
+            return [0.0] * len(qs)
+        cumulative = list(accumulate(self.counts))
+        result = []
+        for q in qs:
+            rank = q * (self.count - 1)
+            bucket = bisect_right(cumulative, rank)
+            result.append(self._value(min(bucket, len(cumulative) - 1)))
+        return result
+    
+    def quantile(self, q: float) -> float:
+        """计算单个分位数"""
+        return self.quantiles((q,))[0]
+
+class ResponseTimeTracker:
+    """响应时间跟踪器
+    
+    最近 max_samples 个样本保存在定长的 array('d') 环形缓冲区中，插入为O(1)；
+    同时维护一个与窗口内容一致的对数直方图，用于计算 p50/p95/p99。
+    """
+    
+    PERCENTILES = (0.5, 0.95, 0.99)
+    
+    def __init__(self, max_samples: int = 100):
+        self.max_samples = max_samples
+        self._samples = array('d', bytes(8 * max_samples))
+        self._next = 0  # 下一个写入位置
+        self._size = 0  # 窗口内的样本数
+        self.histogram = LogHistogram()
+        self.total_time = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+    
+    @property
+    def response_times(self) -> List[float]:
+        """窗口内的样本（按时间从旧到新）"""
+        with self._lock:
+            if self._size < self.max_samples:
+                return self._samples[:self._size].tolist()
+            return (self._samples[self._next:] + self._samples[:self._next]).tolist()
+    
+    def add_response_time(self, response_time_ms: float):
+        """添加响应时间样本"""
+        with self._lock:
+            if self._size >= self.max_samples:
+                # 覆盖最旧的样本
+                removed = self._samples[self._next]
+                self.total_time -= removed
+                self.histogram.remove(removed)
+            else:
+                self._size += 1
+            
+            self._samples[self._next] = response_time_ms
+            self._next = (self._next + 1) % self.max_samples
+            self.total_time += response_time_ms
+            self.histogram.add(response_time_ms)
+            self.count += 1
+    
+    def get_average(self) -> float:
+        """获取平均响应时间"""
+        with self._lock:
+            if self._size == 0:
+                return 100.0  # 默认值
+            return self.total_time / self._size
+    
+    def get_percentile(self, q: float) -> float:
+        """获取窗口内的分位数（q取值范围为[0, 1]）"""
+        with self._lock:
+            if self._size == 0:
+                return 0.0
+            value = self.histogram.quantile(q)
+            window = self._samples[:self._size]
+            # 直方图给出的是桶的代表值，限制在实际观测范围内
+            return min(max(value, min(window)), max(window))
+    
+    def get_percentiles(self) -> Dict[str, float]:
+        """获取 p50/p95/p99"""
+        with self._lock:
+            return self._percentiles()
+    
+    def _percentiles(self) -> Dict[str, float]:
+        if self._size == 0:
+            return {'p50': 0, 'p95': 0, 'p99': 0}
+        window = self._samples[:self._size]
+        low, high = min(window), max(window)
+        values = self.histogram.quantiles(self.PERCENTILES)
+        return {
+            f"p{round(q * 100)}": min(max(v, low), high)
+            for q, v in zip(self.PERCENTILES, values)
+        }
+    
+    def get_stats(self) -> Dict[str, float]:
+        """获取详细统计信息"""
+        with self._lock:
+            if self._size == 0:
+                return {'average': 100.0, 'count': 0, 'min': 0, 'max': 0,
+                        'p50': 0, 'p95': 0, 'p99': 0}
+            
+            window = self._samples[:self._size]
+            stats = {
+                'average': self.total_time / self._size,
+                'count': self._size,
+                'min': min(window),
+                'max': max(window)
+            }
+            stats.update(self._percentiles())
+            return stats
+    
+    def clear(self):
+        """清空统计"""
+        with self._lock:
+            self._next = 0
+            self._size = 0
+            self.histogram.clear()
+            self.total_time = 0.0
+            self.count = 0
@@ -1,50 +1,101 @@
-from algorithms.base import LoadBalancer, Backend
-from typing import Optional, Dict
+from algorithms.base import LoadBalancer, Backend, PoolSnapshot
+from algorithms.heap import IndexedMinHeap
+from algorithms.latency import ResponseTimeTracker
+from typing import Optional, Dict, Tuple, Any, List, Sequence
 import threading
 import time
 
 class LeastConnectionsBalancer(LoadBalancer):
-    """最少连接负载均衡器"""
+    """最少连接负载均衡器
     
-    def next_backend(self, client_ip: str = None) -> Optional[Backend]:
-        """使用最少连接算法获取后端服务"""
-        backends = self.get_healthy_backends()
-        if not backends:
-            return None
+    健康的后端保存在按连接数排序的索引最小堆中，Backend的活跃连接数
+    变化时原地调整堆，选择时直接取堆顶，不再每次扫描所有后端。
+    """
+    
+    def __init__(self):
+        super().__init__()
+        self._heap = IndexedMinHeap()
+        self._indexed_backends: Tuple[Backend, ...] = ()
+        self._index_version = -1
+        self._orders: Dict[str, int] = {}  # backend_id -> 快照中的顺序，用于打破平局
+    
+    def _priority(self, backend: Backend, pending: int = 0) -> Any:
+        """计算后端在堆中的优先级（越小越优先）
         
-        # 找到连接数最少的后端服务
-        min_connections = float('inf')
-        selected = None
+        处于慢启动的后端按 (连接数 + 1 - 系数) / 系数 排序，相当于把
+        下一个连接按 1/系数 个计算；系数为1时就是连接数本身。
+        pending 为本批已经分给该后端、尚未建立的连接数。
+        """
+        warmup = backend.warmup
+        return ((backend.active_connections + pending + 1 - warmup) / warmup, self._orders[backend.id])
+    
+    def _ensure_index(self, snapshot: PoolSnapshot):
+        """快照版本变化时重建连接数索引（调用方需持有 self._lock）"""
+        if self._index_version == snapshot.version:
+            return
         
-        for backend in backends:
-            if backend.active_connections < min_connections:
-                min_connections = backend.active_connections
-                selected = backend
+        for backend in self._indexed_backends:
+            backend.remove_active_listener(self)
         
-        return selected
-
-class WeightedLeastConnectionsBalancer(LoadBalancer):
-    """加权最少连接负载均衡器"""
+        self._orders = dict(snapshot.index)
+        self._indexed_backends = snapshot.healthy
+        for backend in snapshot.healthy:
+            backend.add_active_listener(self)
+        
+        self._heap.build([
+            (self._priority(backend), backend.id, backend)
+            for backend in snapshot.healthy
+        ])
+        self._index_version = snapshot.version
+    
+    def _on_active_changed(self, backend: Backend):
+        """Backend活跃连接数变化回调"""
+        with self._lock:
+            if backend.id in self._heap:
+                self._heap.update(backend.id, self._priority(backend))
     
     def next_backend(self, client_ip: str = None) -> Optional[Backend]:
-        """使用加权最少连接算法获取后端服务"""
-        backends = self.get_healthy_backends()
-        if not backends:
+        """使用最少连接算法获取后端服务"""
+        snapshot = self.get_snapshot()
+        if not snapshot.healthy:
             return None
         
-        # 计算每个后端的连接数与权重的比值，选择比值最小的
-        min_ratio = float('inf')
-        selected = None
+        with self._lock:
+            self._ensure_index(snapshot)
+            return self._heap.peek()
+    
+    def next_backends(self, client_ips: Sequence[Optional[str]]) -> List[Optional[Backend]]:
+        """批量获取后端服务
         
-        for backend in backends:
-            weight = max(backend.weight, 1)  # 避免除零错误
-            ratio = backend.active_connections / weight
-            
-            if ratio < min_ratio:
-                min_ratio = ratio
-                selected = backend
+        选择本身不改变连接数，整批只加锁一次：每选中一个后端就按多一个
+        连接临时调高它在堆中的优先级，再选下一个，结束后恢复为实际连接数，
+        避免整批请求都落到同一个后端上。
+        """
+        snapshot = self.get_snapshot()
+        if not snapshot.healthy:
+            return [None] * len(client_ips)
         
-        return selected
+        result = []
+        pending: Dict[str, int] = {}  # backend_id -> 本批已分配的连接数
+        with self._lock:
+            self._ensure_index(snapshot)
+            for _ in client_ips:
+                backend = self._heap.peek()
+                result.append(backend)
+                pending[backend.id] = pending.get(backend.id, 0) + 1
+                self._heap.update(backend.id, self._priority(backend, pending[backend.id]))
+            for backend in set(result):
+                self._heap.update(backend.id, self._priority(backend))
+        return result
+
+class WeightedLeastConnectionsBalancer(LeastConnectionsBalancer):
+    """加权最少连接负载均衡器"""
+    
+    def _priority(self, backend: Backend, pending: int = 0) -> Any:
+        """按连接数与权重的比值排序（慢启动时使用有效权重）"""
+        weight = max(backend.weight, 1)  # 避免除零错误
+        warmup = backend.warmup
+        return ((backend.active_connections + pending + 1 - warmup) / (weight * warmup), self._orders[backend.id])
 
 class FastestResponseBalancer(LoadBalancer):
     """最快响应时间负载均衡器
@@ -56,45 +107,71 @@ class FastestResponseBalancer(LoadBalancer):
         super().__init__()
         self.connection_weight = connection_weight
         self.response_time_weight = response_time_weight
-        self.response_times: Dict[str, 'ResponseTimeTracker'] = {}
+        self.response_times: Dict[str, ResponseTimeTracker] = {}
         self._tracker_lock = threading.Lock()
     
+    def _select(self, backends: Sequence[Backend], pending: Optional[Dict[str, int]] = None) -> Backend:
+        """选择综合得分最低的后端（调用方需持有 self._tracker_lock）
+        
+        pending 为批量选择中已经分给各后端、尚未建立的连接数，计入连接数。
+        """
+        pending = pending or {}
+        connections = {b.id: b.active_connections + pending.get(b.id, 0) for b in backends}
+        
+        # 最大连接数和最大响应时间与具体后端无关，只需计算一次
+        max_connections = max(connections.values(), default=1)
+        
+        averages = {}
+        for backend in backends:
+            tracker = self.response_times.get(backend.id)
+            if tracker is None:
+                tracker = self.response_times[backend.id] = ResponseTimeTracker()
+            averages[backend.id] = tracker.get_average()
+        max_response_time = max(averages.values(), default=100)
+        
+        min_score = float('inf')
+        selected = None
+        for backend in backends:
+            # 获取连接数得分（标准化到0-1）
+            connection_score = connections[backend.id] / max_connections if max_connections > 0 else 0
+            
+            # 获取响应时间得分（标准化到0-1）
+            avg_response_time = averages[backend.id]
+            response_time_score = avg_response_time / max_response_time if max_response_time > 0 else 0
+            
+            # 计算综合得分（得分越低越好）
+            score = (connection_score * self.connection_weight + 
+                    response_time_score * self.response_time_weight)
+            
+            if score < min_score:
+                min_score = score
+                selected = backend
+        
+        return selected
+    
     def next_backend(self, client_ip: str = None) -> Optional[Backend]:
         """选择连接数少且响应时间快的后端服务"""
         backends = self.get_healthy_backends()
         if not backends:
             return None
         
-        min_score = float('inf')
-        selected = None
-        
         with self._tracker_lock:
-            for backend in backends:
-                # 获取连接数得分（标准化到0-1）
-                max_connections = max((b.active_connections for b in backends), default=1)
-                connection_score = backend.active_connections / max_connections if max_connections > 0 else 0
-                
-                # 获取响应时间得分（标准化到0-1）
-                if backend.id not in self.response_times:
-                    self.response_times[backend.id] = ResponseTimeTracker()
-                
-                avg_response_time = self.response_times[backend.id].get_average()
-                max_response_time = max((
-                    self.response_times.get(b.id, ResponseTimeTracker()).get_average() 
-                    for b in backends
-                ), default=100)
-                
-                response_time_score = avg_response_time / max_response_time if max_response_time > 0 else 0
-                
-                # 计算综合得分（得分越低越好）
-                score = (connection_score * self.connection_weight + 
-                        response_time_score * self.response_time_weight)
-                
-                if score < min_score:
-                    min_score = score
-                    selected = backend
+            return self._select(backends)
+    
+    def next_backends(self, client_ips: Sequence[Optional[str]]) -> List[Optional[Backend]]:
+        """批量获取后端服务，已经分给某个后端的请求按多一个连接计入它的得分"""
+        backends = self.get_healthy_backends()
+        if not backends:
+            return [None] * len(client_ips)
         
-        return selected
+        result = []
+        pending: Dict[str, int] = {}  # backend_id -> 本批已分配的连接数
+        with self._tracker_lock:
+            for _ in client_ips:
+                backend = self._select(backends, pending)
+                result.append(backend)
+                pending[backend.id] = pending.get(backend.id, 0) + 1
+        return result
     
     def update_response_time(self, backend_id: str, response_time_ms: float):
         """更新后端服务的响应时间"""
@@ -107,52 +184,10 @@ class FastestResponseBalancer(LoadBalancer):
         """获取响应时间统计信息"""
         with self._tracker_lock:
             if backend_id not in self.response_times:
-                return {'average': 0, 'count': 0, 'min': 0, 'max': 0}
+                return {'average': 0, 'count': 0, 'min': 0, 'max': 0, 'p50': 0, 'p95': 0, 'p99': 0}
             return self.response_times[backend_id].get_stats()
     
     def clear_response_time_stats(self):
         """清空响应时间统计"""
         with self._tracker_lock:
-            self.response_times.clear()
-
-class ResponseTimeTracker:
-    """响应时间跟踪器"""
-    
-    def __init__(self, max_samples: int = 100):
-        self.max_samples = max_samples
-        self.response_times = []
-        self.total_time = 0
-        self.count = 0
-        self._lock = threading.Lock()
-    
-    def add_response_time(self, response_time_ms: float):
-        """添加响应时间样本"""
-        with self._lock:
-            if len(self.response_times) >= self.max_samples:
-                # 移除最旧的样本
-                removed = self.response_times.pop(0)
-                self.total_time -= removed
-            
-            self.response_times.append(response_time_ms)
-            self.total_time += response_time_ms
-            self.count += 1
-    
-    def get_average(self) -> float:
-        """获取平均响应时间"""
-        with self._lock:
-            if not self.response_times:
-                return 100.0  # 默认值
-            return self.total_time / len(self.response_times)
-    
-    def get_stats(self) -> Dict[str, float]:
-        """获取详细统计信息"""
-        with self._lock:
-            if not self.response_times:
-                return {'average': 100.0, 'count': 0, 'min': 0, 'max': 0}
-            
-            return {
-                'average': self.total_time / len(self.response_times),
-                'count': len(self.response_times),
-                'min': min(self.response_times),
-                'max': max(self.response_times)
-            }
\ No newline at end of file
+            self.response_times.clear()
\ No newline at end of file
@@ -0,0 +1,156 @@
+from algorithms.base import LoadBalancer, Backend, PoolSnapshot
+from typing import Optional, Dict, Tuple, List, Sequence, Deque
+from collections import deque
+import time
+
+class LeastOutstandingLatencyBalancer(LoadBalancer):
+    """最少在途延迟负载均衡器
+    
+    通过 Backend 的活跃连接数钩子记录每个在途请求的开始时间，并用EWMA
+    估计每个后端的服务时间，选择新请求预计完成时间最短的后端：
+    
+        预计完成时间 = 服务时间 + Σ max(服务时间, 已运行时间)
+    
+    每个在途请求至少按一个服务时间计；已经超时的请求按已运行时间计，
+    因此卡在慢请求上的后端即使连接数不多也会被避开。
+    """
+    
+    def __init__(self, smoothing: float = 0.3, default_latency: float = 100.0):
+        """
+        Args:
+            smoothing: 服务时间EWMA的平滑系数，越大越偏向最近的样本
+            default_latency: 还没有响应时间样本时的默认服务时间（毫秒）
+        """
+        super().__init__()
+        self.smoothing = smoothing
+        self.default_latency = default_latency
+        self.service_times: Dict[str, float] = {}  # backend_id -> 服务时间EWMA（毫秒）
+        self._inflight: Dict[str, Deque[float]] = {}  # backend_id -> 在途请求的开始时间（升序）
+        self._tracked_backends: Tuple[Backend, ...] = ()
+        self._tracked_version = -1
+    
+    def _ensure_tracking(self, snapshot: PoolSnapshot):
+        """快照版本变化时重新注册活跃连接数监听（调用方需持有 self._lock）"""
+        if self._tracked_version == snapshot.version:
+            return
+        
+        for backend in self._tracked_backends:
+            backend.remove_active_listener(self)
+        
+        now = time.monotonic()
+        inflight = {}
+        for backend in snapshot.healthy:
+            starts = self._inflight.get(backend.id)
+            if starts is None:
+                # 注册之前已经在途的请求无法知道开始时间，按现在计
+                starts = deque([now] * backend.active_connections)
+            inflight[backend.id] = starts
+            backend.add_active_listener(self)
+        
+        self._inflight = inflight
+        self._tracked_backends = snapshot.healthy
+        self._tracked_version = snapshot.version
+    
+    def _on_active_changed(self, backend: Backend):
+        """Backend活跃连接数变化回调
+        
+        钩子只告诉我们连接数变了，并不知道完成的是哪个请求，这里按
+        先进先出处理：请求增加时记录开始时间，减少时移除最早的记录。
+        """
+        with self._lock:
+            starts = self._inflight.get(backend.id)
+            if starts is None:
+                return
+            active = backend.active_connections
+            if len(starts) < active:
+                now = time.monotonic()
+                while len(starts) < active:
+                    starts.append(now)
+            while len(starts) > active:
+                starts.popleft()
+    
+    def _expected_completion(self, backend: Backend, now: float, pending: int = 0) -> float:
+        """计算新请求在该后端的预计完成时间（毫秒，调用方需持有 self._lock）
+        
+        处于慢启动的后端按系数放大预计完成时间。pending 为本批已经分给
+        该后端、尚未开始的请求数，每个按一个服务时间计。
+        """
+        service_time = self.service_times.get(backend.id, self.default_latency)
+        starts = self._inflight.get(backend.id)
+        if not starts:
+            return service_time * (pending + 1) / backend.warmup
+        
+        cost = service_time * (len(starts) + pending + 1)
+        # 开始时间升序排列，超时的请求都在队首，遇到第一个未超时的即可停止
+        deadline = now - service_time / 1000.0
+        for start in starts:
+            if start >= deadline:
+                break
+            cost += (now - start) * 1000.0 - service_time
+        return cost / backend.warmup
+    
+    def _select(self, snapshot: PoolSnapshot, pending: Optional[Dict[str, int]] = None) -> Backend:
+        """选择预计完成时间最短的后端（调用方需持有 self._lock）"""
+        self._ensure_tracking(snapshot)
+        now = time.monotonic()
+        selected = None
+        min_cost = float('inf')
+        for backend in snapshot.healthy:
+            cost = self._expected_completion(backend, now, pending.get(backend.id, 0) if pending else 0)
+            if cost < min_cost:
+                min_cost = cost
+                selected = backend
+        return selected
+    
+    def next_backend(self, client_ip: str = None) -> Optional[Backend]:
+        """选择预计完成时间最短的后端服务"""
+        snapshot = self.get_snapshot()
+        if not snapshot.healthy:
+            return None
+        
+        with self._lock:
+            return self._select(snapshot)
+    
+    def next_backends(self, client_ips: Sequence[Optional[str]]) -> List[Optional[Backend]]:
+        """批量获取后端服务
+        
+        选择本身不改变在途请求，整批只加锁一次：已经分给某个后端的请求
+        按多一个在途请求计入它的预计完成时间，再选下一个，避免整批请求
+        都落到同一个后端上。
+        """
+        snapshot = self.get_snapshot()
+        if not snapshot.healthy:
+            return [None] * len(client_ips)
+        
+        result = []
+        pending: Dict[str, int] = {}  # backend_id -> 本批已分配的请求数
+        with self._lock:
+            for _ in client_ips:
+                backend = self._select(snapshot, pending)
+                result.append(backend)
+                pending[backend.id] = pending.get(backend.id, 0) + 1
+        return result
+    
+    def update_response_time(self, backend_id: str, response_time_ms: float):
+        """更新后端服务的服务时间EWMA"""
+        with self._lock:
+            current = self.service_times.get(backend_id)
+            if current is None:
+                self.service_times[backend_id] = response_time_ms
+            else:
+                self.service_times[backend_id] = current + self.smoothing * (response_time_ms - current)
+    
+    def get_latency_stats(self) -> Dict[str, Dict[str, float]]:
+        """获取各后端的服务时间、在途请求数和预计完成时间（用于调试）"""
+        snapshot = self.get_snapshot()
+        now = time.monotonic()
+        with self._lock:
+            self._ensure_tracking(snapshot)
+            return {
+                backend.id: {
+                    'service_time': self.service_times.get(backend.id, self.default_latency),
+                    'outstanding': len(self._inflight.get(backend.id, ())),
+                    'expected_completion': self._expected_completion(backend, now)
+                }
+                for backend in snapshot.healthy
+            }
\ No newline at end of file
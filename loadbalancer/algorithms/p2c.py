@@ -0,0 +1,138 @@
+from algorithms.base import LoadBalancer, Backend
+from typing import Optional, Dict, List, Sequence
+import math
+import random
+import threading
+import time
+
+class PeakEWMA:
+    """峰值指数加权移动平均延迟
+    
+    新样本高于当前值时直接跳到该值（对尾延迟立即敏感），低于当前值时
+    按距离上次观测的时间指数衰减地靠近，读取时也会随时间衰减，使一次
+    抖动后被冷落的后端能逐渐恢复。
+    """
+    
+    __slots__ = ('decay_time', '_cost', '_stamp', '_lock')
+    
+    def __init__(self, decay_time: float = 10.0, initial_cost: float = 0.0):
+        """
+        Args:
+            decay_time: 衰减时间常数（秒）
+            initial_cost: 初始延迟（毫秒），为0时第一个样本直接成为当前值
+        """
+        self.decay_time = decay_time
+        self._cost = initial_cost
+        self._stamp = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def observe(self, response_time_ms: float):
+        """记录一次响应时间样本"""
+        now = time.monotonic()
+        with self._lock:
+            if response_time_ms > self._cost:
+                self._cost = response_time_ms
+            else:
+                w = math.exp(-(now - self._stamp) / self.decay_time)
+                self._cost = self._cost * w + response_time_ms * (1 - w)
+            self._stamp = now
+    
+    def get(self, now: Optional[float] = None) -> float:
+        """获取当前延迟估计（毫秒）"""
+        if now is None:
+            now = time.monotonic()
+        elapsed = now - self._stamp
+        if elapsed <= 0:
+            return self._cost
+        return self._cost * math.exp(-elapsed / self.decay_time)
+
+class P2CEWMABalancer(LoadBalancer):
+    """两次随机选择（Power of Two Choices）+ 峰值EWMA负载均衡器
+    
+    每次随机抽取两个健康后端，选择 峰值EWMA延迟 × (活跃连接数+1)
+    较小的一个，单次选择为O(1)。
+    """
+    
+    def __init__(self, decay_time: float = 10.0, default_latency: float = 100.0):
+        super().__init__()
+        self.decay_time = decay_time
+        self.default_latency = default_latency
+        self.latencies: Dict[str, PeakEWMA] = {}  # backend_id -> PeakEWMA
+        self._latency_lock = threading.Lock()
+        self._random = random.Random()
+    
+    def _score(self, backend: Backend, now: float, pending: int = 0) -> float:
+        """计算后端得分（越小越好），处于慢启动的后端按系数放大得分
+        
+        pending 为批量选择中已经分给该后端、尚未建立的连接数。
+        """
+        tracker = self.latencies.get(backend.id)
+        latency = tracker.get(now) if tracker is not None else self.default_latency
+        return latency * (backend.active_connections + pending + 1) / backend.warmup
+    
+    def next_backend(self, client_ip: str = None) -> Optional[Backend]:
+        """随机抽取两个后端并选择得分较低的一个"""
+        backends = self.get_healthy_backends()
+        count = len(backends)
+        if count == 0:
+            return None
+        if count == 1:
+            return backends[0]
+        
+        # 抽取两个不同的下标
+        i = self._random.randrange(count)
+        j = self._random.randrange(count - 1)
+        if j >= i:
+            j += 1
+        
+        first, second = backends[i], backends[j]
+        now = time.monotonic()
+        if self._score(second, now) < self._score(first, now):
+            return second
+        return first
+    
+    def next_backends(self, client_ips: Sequence[Optional[str]]) -> List[Optional[Backend]]:
+        """批量获取后端服务，整批共享一次快照和时间戳
+        
+        每选中一个后端就按多一个连接重新计算它的得分，再抽取下一对。
+        """
+        backends = self.get_healthy_backends()
+        count = len(backends)
+        if count <= 1:
+            return [backends[0] if backends else None] * len(client_ips)
+        
+        now = time.monotonic()
+        randrange = self._random.randrange
+        scores = {}
+        pending: Dict[int, int] = {}  # 下标 -> 本批已分配的连接数
+        result = []
+        for _ in range(len(client_ips)):
+            i = randrange(count)
+            j = randrange(count - 1)
+            if j >= i:
+                j += 1
+            if i not in scores:
+                scores[i] = self._score(backends[i], now)
+            if j not in scores:
+                scores[j] = self._score(backends[j], now)
+            selected = j if scores[j] < scores[i] else i
+            result.append(backends[selected])
+            pending[selected] = pending.get(selected, 0) + 1
+            scores[selected] = self._score(backends[selected], now, pending[selected])
+        return result
+    
+    def update_response_time(self, backend_id: str, response_time_ms: float):
+        """更新后端服务的响应时间"""
+        tracker = self.latencies.get(backend_id)
+        if tracker is None:
+            with self._latency_lock:
+                tracker = self.latencies.get(backend_id)
+                if tracker is None:
+                    tracker = PeakEWMA(self.decay_time)
+                    self.latencies[backend_id] = tracker
+        tracker.observe(response_time_ms)
+    
+    def get_latency_stats(self) -> Dict[str, float]:
+        """获取各后端当前的峰值EWMA延迟（用于调试）"""
+        now = time.monotonic()
+        return {backend_id: tracker.get(now) for backend_id, tracker in list(self.latencies.items())}
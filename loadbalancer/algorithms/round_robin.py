@@ -1,5 +1,5 @@
 from algorithms.base import LoadBalancer, Backend
-from typing import Optional
+from typing import Optional, List, Sequence
 import threading
 
 class RoundRobinBalancer(LoadBalancer):
@@ -20,6 +20,18 @@ class RoundRobinBalancer(LoadBalancer):
             self.current_index = (self.current_index + 1) % len(backends)
             return backend
     
+    def next_backends(self, client_ips: Sequence[Optional[str]]) -> List[Optional[Backend]]:
+        """批量轮询，一次加锁预留整批位置"""
+        backends = self.get_healthy_backends()
+        if not backends:
+            return [None] * len(client_ips)
+        
+        count = len(backends)
+        with self._lock:
+            start = self.current_index % count
+            self.current_index = (start + len(client_ips)) % count
+        return [backends[(start + i) % count] for i in range(len(client_ips))]
+    
     def reset(self):
         """重置轮询计数器"""
         with self._lock:
@@ -0,0 +1,181 @@
+from algorithms.base import Backend
+from typing import Optional, Dict, List, Sequence, Tuple
+from array import array
+from functools import reduce, lru_cache
+import itertools
+from itertools import islice
+import math
+import threading
+
+# 调度序列的最大长度，超过后退回到逐次计算的方式，避免构建过大的序列
+DEFAULT_MAX_SCHEDULE_SIZE = 1 << 16
+
+# 缓存的调度序列个数，健康状态来回切换时可以复用之前的序列
+SEQUENCE_CACHE_SIZE = 16
+
+# 有后端处于慢启动时，有效权重乘以该系数后取整作为调度权重
+WARMUP_WEIGHT_SCALE = 100
+
+def smooth_weighted_sequence(weights: Sequence[int]) -> array:
+    """计算一个完整周期的nginx平滑加权轮询序列
+    
+    每一步给所有后端的当前权重加上配置权重，选出当前权重最大的后端
+    （相同时取靠前的），再减去总权重。经过 sum(weights) 步后所有
+    当前权重回到0，所以序列以此为周期重复。
+    
+    Args:
+        weights: 已经约去最大公约数的非负权重
+    
+    Returns:
+        由后端下标组成的序列
+    """
+    total = sum(weights)
+    sequence = array('I')
+    current = [0] * len(weights)
+    indexes = range(len(weights))
+    
+    for _ in range(total):
+        selected = 0
+        max_current = None
+        for i in indexes:
+            current[i] += weights[i]
+            if max_current is None or current[i] > max_current:
+                max_current = current[i]
+                selected = i
+        current[selected] -= total
+        sequence.append(selected)
+    
+    return sequence
+
+@lru_cache(maxsize=SEQUENCE_CACHE_SIZE)
+def cached_sequence(weights: Tuple[int, ...]) -> array:
+    """按权重缓存的调度序列，返回的数组不能修改"""
+    return smooth_weighted_sequence(weights)
+
+class SmoothWeightedSchedule:
+    """平滑加权轮询调度表
+    
+    在成员或权重变化时预先计算完整的调度周期，之后每次选择只是一次
+    原子的计数器自增和数组下标访问，时间复杂度O(1)。
+    
+    传入 previous 时延续之前的调度状态：成员和权重都没有变化时共用同一个
+    计数器，完全不影响选择顺序；否则从新周期中相同的相对位置继续，
+    而不是回到周期开头。序列是周期性的，从任意位置开始的每个完整周期中
+    各后端被选中的次数都与权重一致，所以频繁发布快照不会让流量偏向周期
+    开头的后端。
+    """
+    
+    def __init__(self, version: int, backends: Tuple[Backend, ...],
+                 max_size: int = DEFAULT_MAX_SCHEDULE_SIZE,
+                 previous: Optional['SmoothWeightedSchedule'] = None):
+        self.version = version
+        self.backends = backends
+        
+        # 有后端处于慢启动时按放大后的有效权重调度，否则直接使用配置权重
+        if all(b.warmup >= 1 for b in backends):
+            self.scale = 1
+            weights = [max(b.weight, 0) for b in backends]
+        else:
+            self.scale = WARMUP_WEIGHT_SCALE
+            weights = [max(round(b.effective_weight * self.scale), 0) for b in backends]
+        # 权重同比缩放不改变选择序列，约去最大公约数可以缩短周期
+        self.gcd = reduce(math.gcd, weights, 0) or 1
+        self.weights = [w // self.gcd for w in weights]
+        self.total_weight = sum(self.weights)
+        
+        if previous is not None and self._same_weights(previous):
+            # 只是版本号变化：共用序列和计数器
+            self.sequence = previous.sequence
+            self._counter = previous._counter
+            self._last = previous._last
+            self._current = previous._current
+            self._lock = previous._lock
+            return
+        
+        # 权重全为0时与原实现一致，始终返回第一个后端
+        if not backends or self.total_weight == 0:
+            self.sequence: Optional[array] = array('I', [0]) if backends else None
+        elif self.total_weight <= max_size:
+            self.sequence = cached_sequence(tuple(self.weights))
+        else:
+            self.sequence = None
+        
+        start = 0
+        if previous is not None and previous.sequence is not None and self.sequence is not None:
+            old_size = len(previous.sequence)
+            start = (previous._last + 1) % old_size * len(self.sequence) // old_size
+        self._counter = itertools.count(start)
+        self._last = start - 1
+        
+        # 序列过长时逐次计算当前权重，沿用仍在池中的后端之前的当前权重（与nginx一致）
+        self._current: List[int] = [0] * len(backends)
+        if previous is not None and previous.sequence is None and self.sequence is None:
+            carried = previous.get_current_weights()
+            for i, b in enumerate(backends):
+                self._current[i] = carried.get(b.id, 0) * self.scale // self.gcd
+        self._lock = threading.Lock()
+    
+    def _same_weights(self, other: 'SmoothWeightedSchedule') -> bool:
+        """成员和调度权重是否与 other 完全相同"""
+        return (
+            self.scale == other.scale
+            and self.gcd == other.gcd
+            and self.weights == other.weights
+            and len(self.backends) == len(other.backends)
+            and all(a is b for a, b in zip(self.backends, other.backends))
+        )
+    
+    def next(self) -> Optional[Backend]:
+        """取调度序列中的下一个后端"""
+        sequence = self.sequence
+        if sequence is not None:
+            i = next(self._counter)
+            self._last = i
+            return self.backends[sequence[i % len(sequence)]]
+        
+        if not self.backends:
+            return None
+        
+        with self._lock:
+            selected = 0
+            max_current = None
+            current = self._current
+            for i, weight in enumerate(self.weights):
+                current[i] += weight
+                if max_current is None or current[i] > max_current:
+                    max_current = current[i]
+                    selected = i
+            current[selected] -= self.total_weight
+            return self.backends[selected]
+    
+    def next_many(self, count: int) -> List[Optional[Backend]]:
+        """连续取出 count 个后端"""
+        sequence = self.sequence
+        if sequence is None:
+            return [self.next() for _ in range(count)]
+        
+        # islice在C层面连续推进计数器，整批位置是连续的
+        positions = list(islice(self._counter, count))
+        if positions:
+            self._last = positions[-1]
+        size = len(sequence)
+        backends = self.backends
+        return [backends[sequence[i % size]] for i in positions]
+    
+    def get_current_weights(self) -> Dict[str, int]:
+        """获取当前权重状态（按原始权重单位换算）"""
+        if self.sequence is None:
+            with self._lock:
+                current = list(self._current)
+        else:
+            current = [0] * len(self.backends)
+            steps = 0
+            if self._last >= 0 and self.total_weight > 0:
+                steps = self._last % len(self.sequence) + 1
+            for step in range(steps):
+                selected = self.sequence[step]
+                for i, weight in enumerate(self.weights):
+                    current[i] += weight
+                current[selected] -= self.total_weight
+        
+        return {b.id: current[i] * self.gcd // self.scale for i, b in enumerate(self.backends)}
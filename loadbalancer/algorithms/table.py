@@ -0,0 +1,140 @@
+from typing import Dict, Iterable, List
+from array import array
+import threading
+from algorithms.counters import DEFAULT_SHARDS, current_shard
+
+class BackendTable:
+    """后端状态的列式存储（struct-of-arrays）
+    
+    每个后端占用一个槽位，各项计数器按列保存在连续的 array 中，
+    Backend 只是按槽位读写这些列的轻量视图。统计汇总时直接对列求和，
+    活跃连接数等需要随时读取的列使用按槽位分段的锁；请求数、响应时间、
+    错误数这类只累加的计数器按线程分片（见 SHARDED_COLUMNS），请求路径上
+    只与同一分片的线程竞争，读取时再合并。
+    """
+    
+    # 列名 -> array类型码
+    COLUMNS = {
+        'active': 'q',
+        'healthy': 'b',
+        'weight': 'q',
+        'last_seen': 'd',
+        'warmup': 'd',
+    }
+    
+    # 只累加、很少读取的计数器按线程分片保存，每个分片一组列，读取时合并
+    SHARDED_COLUMNS = {
+        'total_requests': 'q',
+        'total_response_time': 'd',
+        'error_count': 'q',
+    }
+    
+    LOCK_STRIPES = 64
+    
+    def __init__(self, capacity: int = 64, shards: int = DEFAULT_SHARDS):
+        self.capacity = 0
+        self.columns: Dict[str, array] = {name: array(code) for name, code in self.COLUMNS.items()}
+        self.shards = shards
+        self.sharded_columns: List[Dict[str, array]] = [
+            {name: array(code) for name, code in self.SHARDED_COLUMNS.items()}
+            for _ in range(shards)
+        ]
+        self._shard_locks = [threading.Lock() for _ in range(shards)]
+        self._free: List[int] = []
+        self._lock = threading.Lock()
+        self._stripes = [threading.Lock() for _ in range(self.LOCK_STRIPES)]
+        self._grow(capacity)
+        
+        # 常用列直接作为属性，省去一次字典查找
+        self.active = self.columns['active']
+        self.healthy = self.columns['healthy']
+        self.weight = self.columns['weight']
+        self.last_seen = self.columns['last_seen']
+        self.warmup = self.columns['warmup']
+    
+    def _grow(self, capacity: int):
+        """扩容到指定槽位数（调用方需持有 self._lock）"""
+        extra = capacity - self.capacity
+        if extra <= 0:
+            return
+        for column in self._all_columns():
+            column.frombytes(bytes(column.itemsize * extra))
+        self._free.extend(reversed(range(self.capacity, capacity)))
+        self.capacity = capacity
+    
+    def allocate(self) -> int:
+        """分配一个槽位，所有列初始化为0"""
+        with self._lock:
+            if not self._free:
+                self._grow(max(self.capacity * 2, 64))
+            return self._free.pop()
+    
+    def release(self, slot: int):
+        """释放槽位"""
+        with self._lock:
+            for column in self._all_columns():
+                column[slot] = 0
+            self._free.append(slot)
+    
+    def _all_columns(self) -> List[array]:
+        columns = list(self.columns.values())
+        for shard in self.sharded_columns:
+            columns.extend(shard.values())
+        return columns
+    
+    def lock(self, slot: int) -> threading.Lock:
+        """获取槽位所在分段的锁"""
+        return self._stripes[slot % self.LOCK_STRIPES]
+    
+    def add(self, column: str, slot: int, value=1):
+        """在当前线程的分片上累加计数器"""
+        shard = current_shard(self.shards)
+        with self._shard_locks[shard]:
+            self.sharded_columns[shard][column][slot] += value
+    
+    def add_response(self, slot: int, response_time_ms: float):
+        """记录一次请求及其响应时间"""
+        shard = current_shard(self.shards)
+        with self._shard_locks[shard]:
+            columns = self.sharded_columns[shard]
+            columns['total_requests'][slot] += 1
+            columns['total_response_time'][slot] += response_time_ms
+    
+    def get(self, column: str, slot: int):
+        """读取单个槽位的值，分片计数器会合并所有分片"""
+        if column in self.columns:
+            return self.columns[column][slot]
+        return sum(shard[column][slot] for shard in self.sharded_columns)
+    
+    def values(self, column: str, slots: Iterable[int]) -> List[float]:
+        """读取多个槽位的值"""
+        slots = list(slots)
+        if column in self.columns:
+            return list(map(self.columns[column].__getitem__, slots))
+        totals = [0] * len(slots)
+        for shard in self.sharded_columns:
+            values = shard[column]
+            for i, slot in enumerate(slots):
+                totals[i] += values[slot]
+        return totals
+    
+    def sum(self, column: str, slots: Iterable[int]) -> float:
+        """对指定槽位的某一列求和"""
+        slots = list(slots)
+        if column in self.columns:
+            return sum(map(self.columns[column].__getitem__, slots))
+        return sum(
+            sum(map(shard[column].__getitem__, slots))
+            for shard in self.sharded_columns
+        )
+    
+    def size(self) -> int:
+        """已分配的槽位数"""
+        with self._lock:
+            return self.capacity - len(self._free)
+
+_default_table = BackendTable()
+
+def default_table() -> BackendTable:
+    """获取进程内共享的默认后端表"""
+    return _default_table
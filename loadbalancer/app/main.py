@@ -12,10 +12,8 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from balancer.http_proxy import HTTPProxy, RouteConfig
+from algorithms import LoadBalancerFactory
 from algorithms.round_robin import RoundRobinBalancer
-from algorithms.weighted import WeightedRoundRobinBalancer
-from algorithms.ip_hash import IPHashBalancer
-from algorithms.least_connections import LeastConnectionsBalancer
 from algorithms.base import Backend
 from discovery.registry import InMemoryServiceRegistry, ServiceInstance, ServiceStatus
 from discovery.health import HTTPHealthChecker
@@ -28,6 +26,35 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+def default_backends():
+    """后端服务器列表（示例）"""
+    return [
+        Backend('backend1', 'localhost', 8001, weight=1),
+        Backend('backend2', 'localhost', 8002, weight=2),
+        Backend('backend3', 'localhost', 8003, weight=1),
+    ]
+
+
+def create_health_checker(backends, check_interval):
+    """创建服务注册表和健康检查器，并把后端加入检查"""
+    registry = InMemoryServiceRegistry()
+    health_checker = HTTPHealthChecker(registry, check_interval=check_interval)
+    
+    for backend in backends:
+        instance = ServiceInstance(
+            id=backend.id,
+            name='web-service',
+            host=backend.host,
+            port=backend.port,
+            weight=backend.weight,
+            status=ServiceStatus.HEALTHY
+        )
+        registry.register(instance)
+        health_checker.add_instance(instance)
+    
+    return registry, health_checker
+
+
 def create_app(config=None):
     """创建Flask应用"""
     app = Flask(__name__)
@@ -38,7 +65,12 @@ def create_app(config=None):
         'HEALTH_CHECK_INTERVAL': 30,
         'REQUEST_TIMEOUT': 30,
         'ENABLE_ACCESS_LOG': True,
-        'SESSION_TIMEOUT': 3600
+        'SESSION_TIMEOUT': 3600,
+        'SLOW_START_WINDOW': 0,  # 慢启动时长（秒），0表示不启用
+        'MAX_BODY_SIZE': None,  # 请求体大小上限（字节），None表示不限制
+        'BODY_SPOOL_SIZE': 1024 * 1024,  # 请求体超过该大小时缓冲到临时文件
+        'HEDGE_WORKERS': 64,  # 同时在途的对冲请求上限
+        'HEALTH_CHECK_ENABLED': True  # worker模式下由父进程统一做健康检查
     }
     
     if config:
@@ -47,23 +79,13 @@ def create_app(config=None):
     app.config.update(default_config)
     
     # 创建后端服务器列表（示例）
-    backends = [
-        Backend('backend1', 'localhost', 8001, weight=1),
-        Backend('backend2', 'localhost', 8002, weight=2),
-        Backend('backend3', 'localhost', 8003, weight=1),
-    ]
+    backends = default_backends()
     
     # 创建负载均衡器
     algorithm = app.config['LOAD_BALANCER_ALGORITHM']
-    if algorithm == 'round_robin':
-        lb = RoundRobinBalancer()
-    elif algorithm == 'weighted_round_robin':
-        lb = WeightedRoundRobinBalancer()
-    elif algorithm == 'ip_hash':
-        lb = IPHashBalancer()
-    elif algorithm == 'least_connections':
-        lb = LeastConnectionsBalancer()
-    else:
+    try:
+        lb = LoadBalancerFactory.create(algorithm)
+    except ValueError:
         logger.warning(f"Unknown algorithm {algorithm}, using round_robin")
         lb = RoundRobinBalancer()
     
@@ -73,31 +95,24 @@ def create_app(config=None):
     
     logger.info(f"Created load balancer: {lb.__class__.__name__} with {len(backends)} backends")
     
-    # 创建服务注册表和健康检查器
-    registry = InMemoryServiceRegistry()
-    health_checker = HTTPHealthChecker(registry, check_interval=app.config['HEALTH_CHECK_INTERVAL'])
+    # 初始后端加入之后再启用慢启动，只对之后新增或恢复的后端生效
+    if app.config['SLOW_START_WINDOW'] > 0:
+        lb.enable_slow_start(window=app.config['SLOW_START_WINDOW'])
     
-    # 添加实例到健康检查器并启动
-    for backend in backends:
-        instance = ServiceInstance(
-            id=backend.id,
-            name='web-service',
-            host=backend.host,
-            port=backend.port,
-            weight=backend.weight,
-            status=ServiceStatus.HEALTHY
-        )
-        registry.register(instance)
-        health_checker.add_instance(instance)
+    # 创建服务注册表和健康检查器
+    registry, health_checker = create_health_checker(backends, app.config['HEALTH_CHECK_INTERVAL'])
     
     # 启动健康检查
-    health_checker.start()
+    if app.config['HEALTH_CHECK_ENABLED']:
+        health_checker.start()
     
     # 创建HTTP代理
     http_proxy = HTTPProxy(app, lb)
     http_proxy.set_registry(registry, 'web-service')
     http_proxy.set_request_timeout(app.config['REQUEST_TIMEOUT'])
     http_proxy.enable_access_log(app.config['ENABLE_ACCESS_LOG'])
+    http_proxy.set_body_limits(app.config['MAX_BODY_SIZE'], app.config['BODY_SPOOL_SIZE'])
+    http_proxy.set_hedge_workers(app.config['HEDGE_WORKERS'])
     
     # 配置路由规则（示例）
     api_route = RouteConfig(
@@ -123,6 +138,9 @@ def create_app(config=None):
     )
     http_proxy.set_default_route(default_route)
     
+    app.extensions['load_balancer'] = lb
+    app.extensions['http_proxy'] = http_proxy
+    
     # 添加管理接口
     @app.route('/lb/config')
     def get_config():
@@ -196,6 +214,38 @@ def create_app(config=None):
     return app
 
 
+def run_workers(host, port, workers, config):
+    """多进程模式：worker通过SO_REUSEPORT共同监听端口，父进程负责健康检查"""
+    from werkzeug.serving import make_server
+    from balancer.workers import WorkerSupervisor
+    
+    def worker_main(context):
+        app = create_app(dict(config, HEALTH_CHECK_ENABLED=False))
+        app.extensions['http_proxy'].set_worker_context(context)
+        
+        sock = context.listen(host, port)
+        server = make_server(host, port, app, threaded=True, fd=sock.fileno())
+        sock.close()
+        logger.info(f"Worker {context.index} (pid {os.getpid()}) serving on {host}:{port}")
+        server.serve_forever()
+    
+    backends = default_backends()
+    supervisor = WorkerSupervisor(worker_main, workers, backends)
+    
+    # 先fork出worker，再在父进程中启动健康检查线程
+    _, health_checker = create_health_checker(
+        backends, config.get('HEALTH_CHECK_INTERVAL', 30)
+    )
+    health_checker.set_health_changed_callback(supervisor.set_backend_health)
+    supervisor.start()
+    health_checker.start()
+    
+    try:
+        supervisor.wait()
+    finally:
+        health_checker.stop()
+
+
 def main():
     """主函数"""
     import argparse
@@ -203,9 +253,11 @@ def main():
     parser = argparse.ArgumentParser(description='Flask Load Balancer')
     parser.add_argument('--host', default='0.0.0.0', help='Host to bind to')
     parser.add_argument('--port', type=int, default=8080, help='Port to bind to')
-    parser.add_argument('--algorithm', choices=['round_robin', 'weighted_round_robin', 'ip_hash', 'least_connections'],
+    parser.add_argument('--algorithm', choices=LoadBalancerFactory.get_available_algorithms(),
                        default='round_robin', help='Load balancing algorithm')
     parser.add_argument('--debug', action='store_true', help='Enable debug mode')
+    parser.add_argument('--workers', type=int, default=1,
+                       help='Number of worker processes sharing the port via SO_REUSEPORT')
     
     args = parser.parse_args()
     
@@ -215,6 +267,11 @@ def main():
         'DEBUG': args.debug
     }
     
+    if args.workers > 1:
+        logger.info(f"Starting Flask Load Balancer on {args.host}:{args.port} with {args.workers} workers")
+        run_workers(args.host, args.port, args.workers, config)
+        return
+    
     # 创建应用
     app = create_app(config)
     
@@ -0,0 +1,895 @@
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from http import HTTPStatus
+from http.cookies import SimpleCookie
+from typing import Deque, Dict, List, Optional, Tuple, Any
+from algorithms.base import LoadBalancer, Backend
+from algorithms.counters import StripedCounter
+from balancer.route import RouteConfig, RouteTable, HeaderPlan
+from middleware.session import SessionManager
+from middleware.circuit_breaker import CircuitBreaker
+from middleware.rate_limiter import TokenBucketRateLimiter
+
+logger = logging.getLogger(__name__)
+
+# 由异步代理自己处理、不原样转发给后端的请求头（请求体重新分帧、100-continue）
+LOCAL_REQUEST_HEADERS = frozenset(('transfer-encoding', 'expect'))
+
+# 请求头（请求行+头部）的最大长度
+MAX_HEAD_SIZE = 64 * 1024
+
+def _reason(status: int) -> str:
+    """状态码对应的原因短语"""
+    try:
+        return HTTPStatus(status).phrase
+    except ValueError:
+        return ''
+
+class HTTPError(Exception):
+    """请求格式错误，直接以对应状态码回复客户端"""
+    
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+class _ResponseStarted(Exception):
+    """响应头已经发给客户端之后出现的错误"""
+
+class _ClientError(Exception):
+    """客户端一侧的错误（断开连接、读取超时、请求体不完整），不计入后端的失败"""
+
+class UpstreamPoolFull(Exception):
+    """等待后端连接名额超时：本地连接数已满，不是后端故障"""
+
+class _ClientReader:
+    """客户端流的读取包装，自带超时，并把读取错误转换为 _ClientError"""
+    
+    def __init__(self, reader: asyncio.StreamReader, timeout: Optional[float]):
+        self._reader = reader
+        self._timeout = timeout
+    
+    async def _call(self, coro):
+        try:
+            return await asyncio.wait_for(coro, self._timeout)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, OSError) as e:
+            raise _ClientError(f"{type(e).__name__}: {e}") from e
+    
+    async def read(self, n: int) -> bytes:
+        """读取至多n字节；只用于读取请求体，此时还有数据未到达，读到EOF即客户端提前断开"""
+        data = await self._call(self._reader.read(n))
+        if n and not data:
+            raise _ClientError("Client closed connection before end of body")
+        return data
+    
+    def readuntil(self, separator: bytes):
+        return self._call(self._reader.readuntil(separator))
+    
+    def readexactly(self, n: int):
+        return self._call(self._reader.readexactly(n))
+
+class _ClientWriter:
+    """客户端流的写入包装，把发送错误转换为 _ClientError"""
+    
+    def __init__(self, writer: asyncio.StreamWriter):
+        self._writer = writer
+    
+    def write(self, data: bytes):
+        self._writer.write(data)
+    
+    async def drain(self):
+        try:
+            await self._writer.drain()
+        except OSError as e:
+            raise _ClientError(f"{type(e).__name__}: {e}") from e
+
+class Headers:
+    """保持顺序、允许重复、不区分大小写查找的HTTP头部列表"""
+    
+    def __init__(self, items: Optional[List[Tuple[str, str]]] = None):
+        self.items: List[Tuple[str, str]] = items or []
+    
+    def get(self, name: str, default: Optional[str] = None) -> Optional[str]:
+        name = name.lower()
+        for key, value in self.items:
+            if key.lower() == name:
+                return value
+        return default
+    
+    def get_all(self, name: str) -> List[str]:
+        name = name.lower()
+        return [value for key, value in self.items if key.lower() == name]
+    
+    def remove(self, name: str):
+        name = name.lower()
+        self.items = [(k, v) for k, v in self.items if k.lower() != name]
+    
+    def set(self, name: str, value: str):
+        self.remove(name)
+        self.items.append((name, value))
+    
+    def tokens(self, name: str) -> List[str]:
+        """逗号分隔的头部取值（小写），如 Connection、Transfer-Encoding"""
+        result = []
+        for value in self.get_all(name):
+            result.extend(t.strip().lower() for t in value.split(',') if t.strip())
+        return result
+
+class ProxyRequest:
+    """客户端请求
+    
+    属性与SessionManager使用的Flask请求对象保持一致（headers、cookies、
+    remote_addr），会话保持可以直接复用。
+    """
+    
+    def __init__(self, method: str, target: str, version: str, headers: Headers, remote_addr: str):
+        self.method = method
+        self.target = target
+        self.version = version
+        self.headers = headers
+        self.remote_addr = remote_addr
+        self.path, _, query = target.partition('?')
+        self.query_string = query.encode('latin-1')
+        self.host = headers.get('Host', '')
+        self.scheme = 'http'
+        self._cookies: Optional[Dict[str, str]] = None
+    
+    @property
+    def cookies(self) -> Dict[str, str]:
+        if self._cookies is None:
+            cookie = SimpleCookie()
+            for value in self.headers.get_all('Cookie'):
+                try:
+                    cookie.load(value)
+                except Exception:
+                    pass
+            self._cookies = {key: morsel.value for key, morsel in cookie.items()}
+        return self._cookies
+    
+    @property
+    def keep_alive(self) -> bool:
+        """客户端是否希望保持连接"""
+        connection = self.headers.tokens('Connection')
+        if self.version == 'HTTP/1.0':
+            return 'keep-alive' in connection
+        return 'close' not in connection
+
+class UpstreamConnection:
+    """到后端的一条连接"""
+    
+    __slots__ = ('reader', 'writer', 'backend_id', 'last_used')
+    
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, backend_id: str):
+        self.reader = reader
+        self.writer = writer
+        self.backend_id = backend_id
+        self.last_used = time.monotonic()
+    
+    def is_usable(self, now: float, idle_timeout: float) -> bool:
+        """空闲连接是否还能复用（对端没有关闭且没有空闲过久）"""
+        return (not self.writer.is_closing() and not self.reader.at_eof()
+                and now - self.last_used < idle_timeout)
+    
+    def close(self):
+        try:
+            self.writer.close()
+        except Exception:
+            pass
+
+class UpstreamPool:
+    """按后端划分的有界keep-alive连接池
+    
+    每个后端同时使用的连接数不超过 max_connections，超出时排队等待；
+    归还的连接最多保留 max_idle 个空闲连接，按后进先出复用。
+    """
+    
+    def __init__(self,
+                 max_connections: int = 100,
+                 max_idle: int = 32,
+                 idle_timeout: float = 60.0,
+                 connect_timeout: float = 10.0):
+        self.max_connections = max_connections
+        self.max_idle = max_idle
+        self.idle_timeout = idle_timeout
+        self.connect_timeout = connect_timeout
+        self._idle: Dict[str, Deque[UpstreamConnection]] = {}
+        self._limits: Dict[str, asyncio.Semaphore] = {}
+        self._in_use: Dict[str, int] = {}
+    
+    async def acquire(self, backend: Backend) -> Tuple[UpstreamConnection, bool]:
+        """获取一条到后端的连接，返回 (连接, 是否为复用的空闲连接)"""
+        semaphore = self._limits.get(backend.id)
+        if semaphore is None:
+            semaphore = self._limits[backend.id] = asyncio.Semaphore(self.max_connections)
+        try:
+            await asyncio.wait_for(semaphore.acquire(), self.connect_timeout)
+        except asyncio.TimeoutError:
+            raise UpstreamPoolFull(
+                f"No free upstream connection to {backend.address} within {self.connect_timeout}s"
+            ) from None
+        
+        try:
+            idle = self._idle.get(backend.id)
+            now = time.monotonic()
+            while idle:
+                conn = idle.pop()
+                if conn.is_usable(now, self.idle_timeout):
+                    self._in_use[backend.id] = self._in_use.get(backend.id, 0) + 1
+                    return conn, True
+                conn.close()
+            
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(backend.host, backend.port),
+                self.connect_timeout
+            )
+        except BaseException:
+            semaphore.release()
+            raise
+        
+        self._in_use[backend.id] = self._in_use.get(backend.id, 0) + 1
+        return UpstreamConnection(reader, writer, backend.id), False
+    
+    def release(self, conn: UpstreamConnection, reusable: bool):
+        """归还连接，不可复用或空闲连接已满时直接关闭"""
+        backend_id = conn.backend_id
+        self._in_use[backend_id] -= 1
+        self._limits[backend_id].release()
+        
+        idle = self._idle.get(backend_id)
+        if idle is None:
+            idle = self._idle[backend_id] = deque()
+        
+        conn.last_used = time.monotonic()
+        if reusable and len(idle) < self.max_idle and conn.is_usable(conn.last_used, self.idle_timeout):
+            idle.append(conn)
+        else:
+            conn.close()
+    
+    def close_backend(self, backend_id: str):
+        """关闭某个后端的所有空闲连接"""
+        for conn in self._idle.pop(backend_id, ()):
+            conn.close()
+    
+    def close_all(self):
+        """关闭所有空闲连接"""
+        for backend_id in list(self._idle):
+            self.close_backend(backend_id)
+    
+    def get_stats(self) -> Dict[str, Dict[str, int]]:
+        """获取各后端的连接池状态"""
+        return {
+            backend_id: {
+                'in_use': self._in_use.get(backend_id, 0),
+                'idle': len(self._idle.get(backend_id, ()))
+            }
+            for backend_id in set(self._in_use) | set(self._idle)
+        }
+
+def _parse_head(data: bytes) -> Tuple[str, List[Tuple[str, str]]]:
+    """解析请求头或响应头，返回 (首行, 头部列表)"""
+    lines = data.decode('latin-1').split('\r\n')
+    headers = []
+    for line in lines[1:]:
+        if not line:
+            continue
+        name, sep, value = line.partition(':')
+        if not sep or not name or name != name.strip():
+            raise HTTPError(400, "Malformed header")
+        headers.append((name, value.strip()))
+    return lines[0], headers
+
+def _body_framing(headers: Headers) -> Tuple[str, int]:
+    """确定消息体的分帧方式，返回 ('chunked' | 'length' | 'none', 长度)"""
+    transfer_encoding = headers.tokens('Transfer-Encoding')
+    if transfer_encoding:
+        if transfer_encoding[-1] != 'chunked':
+            raise HTTPError(501, "Unsupported transfer encoding")
+        return 'chunked', 0
+    
+    lengths = {v.strip() for v in headers.get_all('Content-Length')}
+    if not lengths:
+        return 'none', 0
+    if len(lengths) != 1:
+        raise HTTPError(400, "Conflicting Content-Length")
+    value = lengths.pop()
+    if not value.isdigit():
+        raise HTTPError(400, "Invalid Content-Length")
+    return 'length', int(value)
+
+async def _read_head(reader: asyncio.StreamReader, timeout: Optional[float]) -> Optional[bytes]:
+    """读取到空行为止的消息头，连接在两个消息之间被关闭时返回None"""
+    try:
+        return await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), timeout)
+    except asyncio.IncompleteReadError as e:
+        if not e.partial:
+            return None
+        raise
+    except asyncio.LimitOverrunError:
+        raise HTTPError(431, "Request header fields too large")
+
+async def _copy_length(reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                       length: int, chunk_size: int, timeout: Optional[float]) -> int:
+    """按Content-Length逐块转发消息体"""
+    remaining = length
+    while remaining > 0:
+        data = await asyncio.wait_for(reader.read(min(chunk_size, remaining)), timeout)
+        if not data:
+            raise ConnectionError("Connection closed before end of body")
+        writer.write(data)
+        await writer.drain()
+        remaining -= len(data)
+    return length
+
+async def _copy_chunked(reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                        chunk_size: int, timeout: Optional[float], dechunk: bool = False) -> int:
+    """逐块转发chunked编码的消息体
+    
+    默认原样保留分块格式；dechunk为True时只转发数据（用于HTTP/1.0客户端）。
+    """
+    total = 0
+    while True:
+        line = await asyncio.wait_for(reader.readuntil(b'\r\n'), timeout)
+        try:
+            size = int(line.split(b';', 1)[0].strip(), 16)
+        except ValueError:
+            raise HTTPError(400, "Invalid chunk size")
+        
+        if size == 0:
+            # 最后一个分块及可能存在的trailer
+            trailer = b''
+            while True:
+                trailer_line = await asyncio.wait_for(reader.readuntil(b'\r\n'), timeout)
+                if trailer_line == b'\r\n':
+                    break
+                trailer += trailer_line
+            if not dechunk:
+                writer.write(b'0\r\n' + trailer + b'\r\n')
+                await writer.drain()
+            return total
+        
+        if not dechunk:
+            writer.write(line)
+        remaining = size
+        while remaining > 0:
+            data = await asyncio.wait_for(reader.read(min(chunk_size, remaining)), timeout)
+            if not data:
+                raise ConnectionError("Connection closed inside chunk")
+            writer.write(data)
+            await writer.drain()
+            remaining -= len(data)
+        total += size
+        
+        crlf = await asyncio.wait_for(reader.readexactly(2), timeout)
+        if crlf != b'\r\n':
+            raise HTTPError(400, "Invalid chunk terminator")
+        if not dechunk:
+            writer.write(crlf)
+
+async def _copy_until_eof(reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                          chunk_size: int, timeout: Optional[float]) -> int:
+    """转发以关闭连接结束的消息体"""
+    total = 0
+    while True:
+        data = await asyncio.wait_for(reader.read(chunk_size), timeout)
+        if not data:
+            return total
+        writer.write(data)
+        await writer.drain()
+        total += len(data)
+
+class AsyncHTTPProxy:
+    """基于asyncio的HTTP反向代理
+    
+    与 HTTPProxy 使用相同的 LoadBalancer、RouteConfig、熔断器、限流器和
+    会话管理器，但不依赖Flask：直接在asyncio流上解析HTTP/1.1，请求体和
+    响应体都逐块转发、不在内存中缓冲，到每个后端的连接由有界的keep-alive
+    连接池复用。所有客户端连接都在同一个事件循环中处理，不再每个请求
+    占用一个线程。
+    """
+    
+    def __init__(self,
+                 load_balancer: LoadBalancer,
+                 host: str = '0.0.0.0',
+                 port: int = 8080,
+                 route_table: Optional[RouteTable] = None,
+                 circuit_breaker: Optional[CircuitBreaker] = None,
+                 rate_limiter: Optional[TokenBucketRateLimiter] = None,
+                 session_manager: Optional[SessionManager] = None,
+                 max_connections_per_backend: int = 100,
+                 max_idle_per_backend: int = 32,
+                 chunk_size: int = 64 * 1024):
+        self.load_balancer = load_balancer
+        self.host = host
+        self.port = port
+        self.route_table = route_table or RouteTable()
+        self._default_header_plan = HeaderPlan()  # 没有匹配路由的请求使用
+        
+        # 中间件可以与 HTTPProxy 共用
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+        self.rate_limiter = rate_limiter or TokenBucketRateLimiter(capacity=100, refill_rate=10.0)
+        self.session_manager = session_manager or SessionManager()
+        
+        # 配置选项
+        self.request_timeout = 30
+        self.keepalive_timeout = 75
+        self.access_log_enabled = True
+        self.chunk_size = chunk_size
+        
+        self.upstream_pool = UpstreamPool(
+            max_connections=max_connections_per_backend,
+            max_idle=max_idle_per_backend,
+            connect_timeout=10.0
+        )
+        
+        # 统计信息
+        self.counters = StripedCounter((
+            'total_requests', 'successful_requests', 'failed_requests', 'total_response_time'
+        ))
+        self.active_clients = 0
+        
+        self._server: Optional[asyncio.AbstractServer] = None
+    
+    @classmethod
+    def from_http_proxy(cls, http_proxy, host: str = '0.0.0.0', port: int = 8080, **kwargs) -> 'AsyncHTTPProxy':
+        """复用已有 HTTPProxy 的负载均衡器、路由和中间件创建异步代理"""
+        proxy = cls(
+            http_proxy.load_balancer,
+            host=host,
+            port=port,
+            route_table=http_proxy.route_table,
+            circuit_breaker=http_proxy.circuit_breaker,
+            rate_limiter=http_proxy.rate_limiter,
+            session_manager=http_proxy.session_manager,
+            **kwargs
+        )
+        proxy.request_timeout = http_proxy.request_timeout
+        proxy.access_log_enabled = http_proxy.access_log_enabled
+        return proxy
+    
+    def add_route(self, path: str, config: RouteConfig):
+        """添加路由规则"""
+        self.route_table.add(path, config)
+        logger.info(f"Added route: {path} -> {config.service_name}")
+    
+    def set_default_route(self, config: RouteConfig):
+        """设置默认路由"""
+        self.route_table.set_default(config)
+        logger.info("Set default route")
+    
+    def set_request_timeout(self, timeout: int):
+        """设置请求超时时间"""
+        self.request_timeout = timeout
+    
+    def enable_access_log(self, enable: bool):
+        """启用/禁用访问日志"""
+        self.access_log_enabled = enable
+    
+    async def start(self):
+        """开始监听"""
+        if self._server is not None:
+            raise RuntimeError("Async HTTP proxy is already running")
+        self._server = await asyncio.start_server(
+            self._handle_client, self.host, self.port,
+            limit=MAX_HEAD_SIZE, backlog=1024, reuse_address=True
+        )
+        logger.info(f"Async HTTP proxy started on {self.host}:{self.port}")
+    
+    async def serve_forever(self):
+        """开始监听并一直运行"""
+        if self._server is None:
+            await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+    
+    async def stop(self):
+        """停止监听并关闭空闲的后端连接"""
+        if self._server is None:
+            return
+        self._server.close()
+        await self._server.wait_closed()
+        self._server = None
+        self.upstream_pool.close_all()
+        logger.info("Async HTTP proxy stopped")
+    
+    def run(self):
+        """在当前线程中运行事件循环（阻塞）"""
+        try:
+            asyncio.run(self.serve_forever())
+        except KeyboardInterrupt:
+            pass
+    
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """处理一个客户端连接上的所有请求"""
+        peer = writer.get_extra_info('peername')
+        remote_addr = peer[0] if peer else '127.0.0.1'
+        self.active_clients += 1
+        
+        try:
+            while True:
+                try:
+                    head = await _read_head(reader, self.keepalive_timeout)
+                    if head is None:
+                        break
+                    request = self._parse_request(head, remote_addr)
+                except HTTPError as e:
+                    await self._send_error(writer, e.status, e.message, keep_alive=False)
+                    break
+                
+                keep_alive = await self._handle_request(request, reader, writer)
+                if not keep_alive:
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except Exception as e:
+            logger.error(f"Error handling client {remote_addr}: {e}")
+        finally:
+            self.active_clients -= 1
+            writer.close()
+    
+    def _parse_request(self, head: bytes, remote_addr: str) -> ProxyRequest:
+        """解析请求行和请求头"""
+        request_line, items = _parse_head(head)
+        parts = request_line.split(' ')
+        if len(parts) != 3 or not parts[2].startswith('HTTP/1.'):
+            raise HTTPError(400, "Malformed request line")
+        method, target, version = parts
+        return ProxyRequest(method, target, version, Headers(items), remote_addr)
+    
+    def _header_plan(self, route_config: Optional[RouteConfig]) -> HeaderPlan:
+        """获取路由的头部改写计划"""
+        if route_config is None:
+            return self._default_header_plan
+        plan = route_config.header_plan
+        if plan is None:
+            # 没有通过add_route添加的路由，按需编译
+            plan = route_config.header_plan = HeaderPlan(route_config)
+        return plan
+    
+    def _get_client_ip(self, request: ProxyRequest) -> str:
+        """获取客户端真实IP"""
+        xff = request.headers.get('X-Forwarded-For')
+        if xff:
+            return xff.split(',')[0].strip()
+        
+        xri = request.headers.get('X-Real-IP')
+        if xri:
+            return xri
+        
+        return request.remote_addr or '127.0.0.1'
+    
+    async def _handle_request(self, request: ProxyRequest, reader: asyncio.StreamReader,
+                              writer: asyncio.StreamWriter) -> bool:
+        """处理单个请求，返回客户端连接是否可以继续使用"""
+        start_time = time.time()
+        client_ip = self._get_client_ip(request)
+        self.counters.add('total_requests')
+        
+        try:
+            framing, length = _body_framing(request.headers)
+        except HTTPError as e:
+            await self._send_error(writer, e.status, e.message, keep_alive=False)
+            return False
+        keep_alive = request.keep_alive
+        # 请求体尚未读取时提前回复，需要关闭连接以免把请求体当作下一个请求
+        body_pending = framing != 'none'
+        
+        try:
+            # 管理接口
+            if request.path.startswith('/lb/'):
+                handled = await self._handle_management(request, writer, keep_alive and not body_pending)
+                if handled:
+                    return keep_alive and not body_pending
+            
+            # 应用限流
+            if not self.rate_limiter.allow_request(client_ip):
+                await self._send_error(writer, 429, "Rate limit exceeded", keep_alive and not body_pending)
+                return keep_alive and not body_pending
+            
+            # 检查熔断器
+            if not self.circuit_breaker.can_execute():
+                await self._send_error(writer, 503, "Service temporarily unavailable", keep_alive and not body_pending)
+                return keep_alive and not body_pending
+            
+            # 选择路由和负载均衡器
+            route_config, lb = self.route_table.select(request.path, self.load_balancer)
+            
+            # 选择后端服务
+            backend = lb.next_backend(client_ip)
+            if not backend:
+                self.circuit_breaker.record_failure()
+                await self._send_error(writer, 503, "No healthy backend available", keep_alive and not body_pending)
+                return keep_alive and not body_pending
+            
+            # 处理会话保持
+            if route_config and route_config.enable_session_affinity:
+                session_backend = self.session_manager.get_backend_for_session(
+                    request, self.load_balancer
+                )
+                if session_backend and session_backend.is_healthy:
+                    backend = session_backend
+            
+            # 增加后端活跃连接数
+            backend.increment_active()
+            try:
+                keep_alive = await self._proxy(
+                    request, reader, writer, backend, route_config, framing, length, keep_alive
+                )
+                
+                # 更新会话绑定
+                if route_config and route_config.enable_session_affinity:
+                    self.session_manager.bind_session_to_backend(request, backend)
+                
+                # 记录成功
+                self.circuit_breaker.record_success()
+                
+                # 更新响应时间统计（包含完整传输响应体的时间）
+                response_time = (time.time() - start_time) * 1000
+                backend.update_response_time(response_time)
+                if hasattr(lb, 'update_response_time'):
+                    lb.update_response_time(backend.id, response_time)
+                
+                self.counters.add_many({
+                    'successful_requests': 1,
+                    'total_response_time': response_time
+                })
+                return keep_alive
+            finally:
+                backend.decrement_active()
+        
+        except _ClientError as e:
+            # 客户端断开或发送请求体超时，不计入后端的失败
+            logger.info(f"Client aborted request {request.path}: {e}")
+            self.counters.add('failed_requests')
+            return False
+        
+        except UpstreamPoolFull as e:
+            # 本地连接数已满，后端本身没有出错
+            logger.warning(f"Error handling request {request.path}: {e}")
+            self.counters.add('failed_requests')
+            await self._send_error(writer, 503, "Upstream connection limit reached", keep_alive=False)
+            return False
+        
+        except _ResponseStarted as e:
+            # 响应头已经发出，只能断开客户端连接
+            logger.error(f"Error streaming response for {request.path}: {e.__cause__}")
+            self.circuit_breaker.record_failure()
+            self.counters.add('failed_requests')
+            return False
+        
+        except (asyncio.TimeoutError, HTTPError, OSError, asyncio.IncompleteReadError) as e:
+            logger.error(f"Error handling request {request.path}: {e}")
+            # 客户端请求格式错误（4xx）不是后端的失败
+            if not isinstance(e, HTTPError) or e.status >= 500:
+                self.circuit_breaker.record_failure()
+            self.counters.add('failed_requests')
+            status = e.status if isinstance(e, HTTPError) else 500
+            message = e.message if isinstance(e, HTTPError) else "Internal server error"
+            await self._send_error(writer, status, message, keep_alive=False)
+            return False
+        
+        finally:
+            # 记录访问日志
+            if self.access_log_enabled:
+                response_time = (time.time() - start_time) * 1000
+                logger.info(f"{request.method} {request.path} {client_ip} {response_time:.2f}ms")
+    
+    async def _proxy(self, request: ProxyRequest, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                     backend: Backend, route_config: Optional[RouteConfig],
+                     framing: str, length: int, keep_alive: bool) -> bool:
+        """把请求转发到后端并把响应流式返回给客户端，返回客户端连接是否可以继续使用"""
+        head = self._build_request_head(request, backend, route_config, framing)
+        expect_continue = '100-continue' in request.headers.tokens('Expect')
+        # 读取请求体时客户端一侧的错误单独区分，超时由包装自己处理
+        client_reader = _ClientReader(reader, self.request_timeout)
+        
+        while True:
+            try:
+                conn, reused = await self.upstream_pool.acquire(backend)
+            except (OSError, asyncio.TimeoutError) as e:
+                logger.error(f"Proxy request failed to {backend.address}: {e}")
+                backend.mark_error()
+                # 标记后端为不健康
+                if isinstance(e, ConnectionError):
+                    backend.set_healthy(False)
+                raise
+            
+            reusable = False
+            try:
+                conn.writer.write(head)
+                if framing != 'none':
+                    if expect_continue:
+                        writer.write(b'HTTP/1.1 100 Continue\r\n\r\n')
+                        expect_continue = False
+                    if framing == 'length':
+                        await _copy_length(client_reader, conn.writer, length, self.chunk_size, None)
+                    else:
+                        await _copy_chunked(client_reader, conn.writer, self.chunk_size, None)
+                await conn.writer.drain()
+                
+                status, version, items = await self._read_response_head(conn)
+            except (OSError, asyncio.IncompleteReadError) as e:
+                self.upstream_pool.release(conn, False)
+                # 复用的空闲连接可能已被后端关闭，没有请求体时换一条新连接重试一次
+                if reused and framing == 'none':
+                    continue
+                logger.error(f"Proxy request failed to {backend.address}: {e}")
+                backend.mark_error()
+                raise
+            except BaseException:
+                self.upstream_pool.release(conn, False)
+                raise
+            
+            try:
+                reusable, keep_alive = await self._relay_response(
+                    request, writer, conn, backend, route_config, status, version, items, keep_alive
+                )
+                return keep_alive
+            finally:
+                self.upstream_pool.release(conn, reusable)
+    
+    def _build_request_head(self, request: ProxyRequest, backend: Backend,
+                            route_config: Optional[RouteConfig], framing: str) -> bytes:
+        """构建发给后端的请求头"""
+        # 与同步代理共用头部改写计划：跳过逐跳头部和Connection中列出的头部，
+        # 设置代理相关头部并应用路由的头部配置
+        extra_drop = frozenset(request.headers.tokens('Connection')) | LOCAL_REQUEST_HEADERS
+        headers = Headers(self._header_plan(route_config).request_items(
+            request.headers.items, self._get_client_ip(request), request.host, request.scheme, extra_drop
+        ))
+        
+        if framing == 'chunked':
+            headers.remove('Content-Length')
+            headers.set('Transfer-Encoding', 'chunked')
+        headers.set('Connection', 'keep-alive')
+        
+        # 应用路径重写
+        path = request.path
+        if route_config and route_config.rewrite_path:
+            path = route_config.rewrite_path
+        target = '/' + path.lstrip('/')
+        if request.query_string:
+            target += '?' + request.query_string.decode('latin-1')
+        
+        lines = [f"{request.method} {target} HTTP/1.1"]
+        lines.extend(f"{name}: {value}" for name, value in headers.items)
+        return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+    
+    async def _read_response_head(self, conn: UpstreamConnection) -> Tuple[int, str, List[Tuple[str, str]]]:
+        """读取后端响应头，跳过1xx中间响应"""
+        while True:
+            head = await _read_head(conn.reader, self.request_timeout)
+            if head is None:
+                raise ConnectionError("Upstream closed connection")
+            status_line, items = _parse_head(head)
+            parts = status_line.split(' ', 2)
+            if len(parts) < 2 or not parts[1].isdigit():
+                raise HTTPError(502, "Bad gateway")
+            status = int(parts[1])
+            if 100 <= status < 200:
+                continue
+            return status, parts[0], items
+    
+    async def _relay_response(self, request: ProxyRequest, writer: asyncio.StreamWriter,
+                              conn: UpstreamConnection, backend: Backend,
+                              route_config: Optional[RouteConfig], status: int, version: str,
+                              items: List[Tuple[str, str]], keep_alive: bool) -> Tuple[bool, bool]:
+        """把后端响应转发给客户端，返回 (后端连接是否可复用, 客户端连接是否可继续使用)"""
+        upstream_headers = Headers(items)
+        upstream_keep_alive = (
+            'close' not in upstream_headers.tokens('Connection') and version != 'HTTP/1.0'
+        )
+        
+        if request.method == 'HEAD' or status in (204, 304):
+            framing, length = 'none', 0
+        else:
+            framing, length = _body_framing(upstream_headers)
+            if framing == 'none':
+                framing = 'eof'
+        
+        # 准备响应头：跳过逐跳头部，添加负载均衡器信息并应用CORS配置
+        headers = Headers(self._header_plan(route_config).response_items(
+            items, backend.address, frozenset(upstream_headers.tokens('Connection'))
+        ))
+        
+        # 确定发给客户端的分帧方式
+        dechunk = False
+        if framing == 'chunked':
+            if request.version == 'HTTP/1.0':
+                dechunk = True
+                keep_alive = False
+            else:
+                headers.set('Transfer-Encoding', 'chunked')
+        elif framing == 'eof':
+            keep_alive = False
+        
+        headers.set('Connection', 'keep-alive' if keep_alive else 'close')
+        
+        lines = [f"HTTP/1.1 {status} {_reason(status)}"]
+        lines.extend(f"{name}: {value}" for name, value in headers.items)
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+        
+        # 发给客户端时的错误单独区分，只有读取后端出错才算后端的失败
+        client_writer = _ClientWriter(writer)
+        try:
+            if framing == 'length':
+                await _copy_length(conn.reader, client_writer, length, self.chunk_size, self.request_timeout)
+            elif framing == 'chunked':
+                await _copy_chunked(conn.reader, client_writer, self.chunk_size, self.request_timeout, dechunk)
+            elif framing == 'eof':
+                await _copy_until_eof(conn.reader, client_writer, self.chunk_size, self.request_timeout)
+            await client_writer.drain()
+        except _ClientError:
+            raise
+        except Exception as e:
+            raise _ResponseStarted() from e
+        
+        return upstream_keep_alive and framing != 'eof', keep_alive
+    
+    async def _send_error(self, writer: asyncio.StreamWriter, status: int, message: str, keep_alive: bool):
+        """回复简单的文本响应"""
+        await self._send_response(writer, status, message.encode(), 'text/plain; charset=utf-8', keep_alive)
+    
+    async def _send_response(self, writer: asyncio.StreamWriter, status: int, body: bytes,
+                             content_type: str, keep_alive: bool):
+        """回复完整的响应"""
+        head = (
+            f"HTTP/1.1 {status} {_reason(status)}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        ).encode('latin-1')
+        try:
+            writer.write(head + body)
+            await writer.drain()
+        except (OSError, ConnectionError):
+            pass
+    
+    async def _handle_management(self, request: ProxyRequest, writer: asyncio.StreamWriter,
+                                 keep_alive: bool) -> bool:
+        """处理 /lb/ 下的管理接口，返回是否已处理"""
+        if request.path == '/lb/health':
+            data: Any = {
+                'status': 'healthy',
+                'load_balancer': self.load_balancer.__class__.__name__,
+                'timestamp': time.time()
+            }
+        elif request.path == '/lb/stats':
+            data = self.get_stats()
+        elif request.path == '/lb/backends':
+            data = [backend.to_dict() for backend in self.load_balancer.get_all_backends()]
+        else:
+            return False
+        
+        body = json.dumps(data).encode()
+        await self._send_response(writer, 200, body, 'application/json', keep_alive)
+        return True
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取统计信息"""
+        stats = self.counters.snapshot()
+        total_requests = stats['total_requests']
+        successful_requests = stats['successful_requests']
+        avg_response_time = (
+            stats['total_response_time'] / successful_requests
+            if successful_requests > 0 else 0
+        )
+        
+        return {
+            'load_balancer': self.load_balancer.__class__.__name__,
+            'total_requests': total_requests,
+            'successful_requests': successful_requests,
+            'failed_requests': stats['failed_requests'],
+            'success_rate': (
+                successful_requests / total_requests
+                if total_requests > 0 else 0
+            ),
+            'average_response_time': avg_response_time,
+            'active_clients': self.active_clients,
+            'upstream_pool': self.upstream_pool.get_stats(),
+            'circuit_breaker': self.circuit_breaker.get_stats(),
+            'rate_limiter': self.rate_limiter.get_stats(),
+            'backends': self.load_balancer.get_stats()
+        }
\ No newline at end of file
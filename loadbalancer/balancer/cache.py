@@ -0,0 +1,608 @@
+"""
+响应缓存
+按字节数限制大小的内存LRU，可选磁盘二级缓存，遵循Cache-Control语义，
+支持ETag/Last-Modified条件请求、stale-while-revalidate和并发未命中合并
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+from typing import Dict, List, Optional, Tuple, Callable, Any
+from algorithms.counters import StripedCounter
+
+logger = logging.getLogger(__name__)
+
+# 允许缓存的状态码（RFC 7231 中默认可缓存的状态码）
+CACHEABLE_STATUS = {200, 203, 204, 300, 301, 308, 404, 405, 410, 414, 501}
+
+# 不写入缓存的响应头：逐跳头部由代理重新生成，Age在返回时重新计算
+UNCACHED_HEADERS = {
+    'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization',
+    'te', 'trailers', 'transfer-encoding', 'upgrade', 'age'
+}
+
+def parse_cache_control(value: Optional[str]) -> Dict[str, Optional[str]]:
+    """解析Cache-Control头部，返回 指令名(小写) -> 参数"""
+    directives: Dict[str, Optional[str]] = {}
+    if not value:
+        return directives
+    for part in value.split(','):
+        name, sep, arg = part.strip().partition('=')
+        if not name:
+            continue
+        directives[name.strip().lower()] = arg.strip().strip('"') if sep else None
+    return directives
+
+def _seconds(value: Optional[str]) -> int:
+    """把秒数参数转换为整数，非法值按0处理"""
+    try:
+        return max(int(value), 0)
+    except (TypeError, ValueError):
+        return 0
+
+def _header(headers: List[Tuple[str, str]], name: str) -> Optional[str]:
+    """在头部列表中按名称查找（不区分大小写）"""
+    name = name.lower()
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+    return None
+
+def _strip_weak(etag: str) -> str:
+    """ETag弱比较：去掉 W/ 前缀"""
+    etag = etag.strip()
+    return etag[2:] if etag.startswith('W/') else etag
+
+class CachedResponse:
+    """缓存中的一个响应"""
+    
+    def __init__(self, status: int, headers: List[Tuple[str, str]], body: bytes,
+                 backend: str = '', stored_at: Optional[float] = None,
+                 upstream_age: int = 0, max_age: float = 0, stale_while_revalidate: float = 0,
+                 cacheable: bool = False, default_ttl: float = 0):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.backend = backend  # 产生该响应的后端地址
+        self.stored_at = time.time() if stored_at is None else stored_at
+        self.upstream_age = upstream_age  # 后端返回的Age
+        self.max_age = max_age
+        self.stale_while_revalidate = stale_while_revalidate
+        self.cacheable = cacheable
+        self.default_ttl = default_ttl  # 后端没有给出新鲜度时使用的路由默认TTL
+        self.etag = _header(headers, 'ETag')
+        self.last_modified = _header(headers, 'Last-Modified')
+        vary = _header(headers, 'Vary') or ''
+        self.vary_headers = tuple(h.strip().lower() for h in vary.split(',') if h.strip())
+        self.vary: Dict[str, str] = {}  # 写入缓存时请求中Vary头部的取值
+    
+    @classmethod
+    def from_upstream(cls, status: int, headers: List[Tuple[str, str]], body: bytes,
+                      backend: str = '', default_ttl: float = 0) -> 'CachedResponse':
+        """根据后端响应创建，并按Cache-Control等头部计算新鲜度和可缓存性"""
+        now = time.time()
+        cache_control = parse_cache_control(_header(headers, 'Cache-Control'))
+        upstream_age = _seconds(_header(headers, 'Age'))
+        
+        if 's-maxage' in cache_control:
+            max_age = _seconds(cache_control['s-maxage'])
+        elif 'max-age' in cache_control:
+            max_age = _seconds(cache_control['max-age'])
+        elif _header(headers, 'Expires') is not None:
+            max_age = 0
+            try:
+                expires = parsedate_to_datetime(_header(headers, 'Expires')).timestamp()
+                date_header = _header(headers, 'Date')
+                date = parsedate_to_datetime(date_header).timestamp() if date_header else now
+                max_age = max(expires - date, 0)
+            except (TypeError, ValueError):
+                pass
+        else:
+            max_age = default_ttl
+        
+        # no-cache 允许存储，但每次使用前都必须重新验证
+        if 'no-cache' in cache_control:
+            max_age = 0
+        
+        vary = _header(headers, 'Vary') or ''
+        cacheable = (
+            status in CACHEABLE_STATUS
+            and 'no-store' not in cache_control
+            and 'private' not in cache_control
+            and _header(headers, 'Set-Cookie') is None
+            and vary.strip() != '*'
+        )
+        # 既不新鲜又无法重新验证的响应没有缓存价值
+        if max_age <= 0 and _header(headers, 'ETag') is None and _header(headers, 'Last-Modified') is None:
+            cacheable = False
+        
+        stored_headers = [(k, v) for k, v in headers if k.lower() not in UNCACHED_HEADERS]
+        return cls(
+            status, stored_headers, body, backend,
+            stored_at=now,
+            upstream_age=upstream_age,
+            max_age=max_age,
+            stale_while_revalidate=_seconds(cache_control.get('stale-while-revalidate')),
+            cacheable=cacheable,
+            default_ttl=default_ttl
+        )
+    
+    @property
+    def size(self) -> int:
+        """占用的字节数（估算）"""
+        return len(self.body) + sum(len(k) + len(v) for k, v in self.headers) + 256
+    
+    def age(self, now: Optional[float] = None) -> float:
+        """当前年龄（秒）"""
+        now = time.time() if now is None else now
+        return self.upstream_age + max(now - self.stored_at, 0)
+    
+    def is_fresh(self, now: Optional[float] = None) -> bool:
+        """是否仍然新鲜"""
+        return self.age(now) < self.max_age
+    
+    def can_serve_stale(self, now: Optional[float] = None) -> bool:
+        """是否处于stale-while-revalidate窗口内"""
+        return self.age(now) < self.max_age + self.stale_while_revalidate
+    
+    def validators(self) -> Dict[str, str]:
+        """重新验证时使用的条件请求头"""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+    
+    def matches(self, request_headers: Dict[str, str]) -> bool:
+        """请求的Vary头部取值是否与写入缓存时一致（request_headers 的键为小写）"""
+        for name in self.vary_headers:
+            if request_headers.get(name, '') != self.vary.get(name, ''):
+                return False
+        return True
+    
+    def not_modified(self, if_none_match: Optional[str]) -> bool:
+        """客户端的If-None-Match是否与该响应的ETag匹配"""
+        if not if_none_match or not self.etag:
+            return False
+        if if_none_match.strip() == '*':
+            return True
+        etag = _strip_weak(self.etag)
+        return any(_strip_weak(tag) == etag for tag in if_none_match.split(','))
+    
+    def refresh(self, headers: List[Tuple[str, str]]) -> 'CachedResponse':
+        """用304响应的头部更新缓存响应，返回新的缓存项"""
+        # 304响应的长度、编码头部描述的是空响应体，不能覆盖缓存的值
+        headers = [(k, v) for k, v in headers if k.lower() not in ('content-length', 'content-encoding')]
+        updated = {k.lower() for k, _ in headers}
+        merged = [(k, v) for k, v in self.headers if k.lower() not in updated] + list(headers)
+        entry = CachedResponse.from_upstream(self.status, merged, self.body, self.backend, self.default_ttl)
+        entry.vary = self.vary
+        return entry
+    
+    def to_bytes(self) -> bytes:
+        """序列化为 元数据JSON + 换行 + 响应体"""
+        meta = {
+            'status': self.status,
+            'headers': self.headers,
+            'backend': self.backend,
+            'stored_at': self.stored_at,
+            'upstream_age': self.upstream_age,
+            'max_age': self.max_age,
+            'stale_while_revalidate': self.stale_while_revalidate,
+            'cacheable': self.cacheable,
+            'default_ttl': self.default_ttl,
+            'vary': self.vary
+        }
+        return json.dumps(meta).encode() + b'\n' + self.body
+    
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'CachedResponse':
+        """从 to_bytes 的结果反序列化"""
+        meta_line, _, body = data.partition(b'\n')
+        meta = json.loads(meta_line)
+        entry = cls(
+            meta['status'], [tuple(h) for h in meta['headers']], body, meta['backend'],
+            stored_at=meta['stored_at'],
+            upstream_age=meta['upstream_age'],
+            max_age=meta['max_age'],
+            stale_while_revalidate=meta['stale_while_revalidate'],
+            cacheable=meta['cacheable'],
+            default_ttl=meta['default_ttl']
+        )
+        entry.vary = meta['vary']
+        return entry
+
+class DiskCache:
+    """磁盘二级缓存
+    
+    内存缓存淘汰的响应写入磁盘，每个响应一个文件，按总字节数做LRU淘汰。
+    启动时扫描目录重建索引，重启后仍可命中。
+    """
+    
+    SUFFIX = '.cache'
+    
+    def __init__(self, directory: str, max_bytes: int = 1024 * 1024 * 1024):
+        """
+        Args:
+            directory: 缓存目录
+            max_bytes: 磁盘缓存的最大字节数
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._index: 'OrderedDict[str, int]' = OrderedDict()  # key -> 文件大小
+        self._bytes = 0
+        self._lock = threading.Lock()
+        
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+    
+    def _path(self, key: str) -> str:
+        """缓存键对应的文件路径"""
+        return os.path.join(self.directory, hashlib.sha256(key.encode()).hexdigest() + self.SUFFIX)
+    
+    def _load_index(self):
+        """扫描缓存目录，按修改时间重建LRU索引"""
+        files = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(self.SUFFIX):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                with open(path, 'rb') as f:
+                    key = json.loads(f.readline()).get('key')
+                stat = os.stat(path)
+            except (OSError, ValueError):
+                continue
+            if key and self._path(key) == path:
+                files.append((stat.st_mtime, key, stat.st_size))
+        
+        for _, key, size in sorted(files):
+            self._index[key] = size
+            self._bytes += size
+        self._evict()
+    
+    def _evict(self):
+        """淘汰最久未使用的文件直到不超过上限（调用方需持有 self._lock 或处于初始化阶段）"""
+        while self._bytes > self.max_bytes and self._index:
+            key, size = self._index.popitem(last=False)
+            self._bytes -= size
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+    
+    def save(self, key: str, entry: CachedResponse):
+        """写入一个响应"""
+        meta = json.dumps({'key': key}).encode() + b'\n'
+        data = meta + entry.to_bytes()
+        if len(data) > self.max_bytes:
+            return
+        
+        path = self._path(key)
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Failed to write cache file {path}: {e}")
+            return
+        
+        with self._lock:
+            self._bytes -= self._index.pop(key, 0)
+            self._index[key] = len(data)
+            self._bytes += len(data)
+            self._evict()
+    
+    def load(self, key: str) -> Optional[CachedResponse]:
+        """读取一个响应，不存在时返回None"""
+        with self._lock:
+            if key not in self._index:
+                return None
+            self._index.move_to_end(key)
+        
+        try:
+            with open(self._path(key), 'rb') as f:
+                f.readline()  # 跳过键
+                return CachedResponse.from_bytes(f.read())
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Failed to read cache file for {key}: {e}")
+            self.remove(key)
+            return None
+    
+    def remove(self, key: str):
+        """删除一个响应"""
+        with self._lock:
+            size = self._index.pop(key, None)
+            if size is None:
+                return
+            self._bytes -= size
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+    
+    def clear(self):
+        """清空磁盘缓存"""
+        with self._lock:
+            keys = list(self._index)
+        for key in keys:
+            self.remove(key)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取统计信息"""
+        with self._lock:
+            return {
+                'directory': self.directory,
+                'entries': len(self._index),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes
+            }
+
+class _Flight:
+    """正在进行中的后端请求，同一个键的并发未命中共享其结果"""
+    
+    __slots__ = ('event', 'entry', 'error')
+    
+    def __init__(self):
+        self.event = threading.Event()
+        self.entry: Optional[CachedResponse] = None
+        self.error: Optional[Exception] = None
+
+# 加载函数：参数为条件请求头，返回后端的响应
+Loader = Callable[[Dict[str, str]], CachedResponse]
+
+class ResponseCache:
+    """共享响应缓存
+    
+    - 内存中按字节数限制大小的LRU，淘汰的响应可写入磁盘二级缓存
+    - 新鲜的响应直接返回；过期但处于stale-while-revalidate窗口内的响应
+      直接返回，同时在后台重新验证
+    - 过期的响应带上If-None-Match/If-Modified-Since重新验证，304时沿用缓存的响应体
+    - 同一个键的并发未命中只向后端发出一个请求，其余请求等待并共享结果，
+      后台重新验证也与之合并，同一时间每个键最多一个
+    - 带Vary的响应按请求中Vary列出的头部取值分别缓存，每种取值一个变体
+    """
+    
+    def __init__(self,
+                 max_bytes: int = 64 * 1024 * 1024,
+                 max_entry_bytes: int = 8 * 1024 * 1024,
+                 disk_dir: Optional[str] = None,
+                 disk_max_bytes: int = 1024 * 1024 * 1024):
+        """
+        Args:
+            max_bytes: 内存缓存的最大字节数
+            max_entry_bytes: 单个响应的最大字节数，超过的响应不缓存
+            disk_dir: 磁盘缓存目录，为None时不使用磁盘缓存
+            disk_max_bytes: 磁盘缓存的最大字节数
+        """
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.disk = DiskCache(disk_dir, disk_max_bytes) if disk_dir else None
+        
+        self._entries: 'OrderedDict[str, CachedResponse]' = OrderedDict()
+        self._bytes = 0
+        self._flights: Dict[str, _Flight] = {}
+        self._vary_names: Dict[str, Tuple[str, ...]] = {}  # 缓存键 -> 最近一次响应的Vary头部名
+        self._lock = threading.Lock()
+        
+        self.counters = StripedCounter((
+            'hits', 'stale_hits', 'misses', 'coalesced', 'revalidated',
+            'stores', 'evictions', 'errors'
+        ))
+    
+    def get(self, key: str, loader: Loader, request_headers: Dict[str, str],
+            timeout: Optional[float] = None) -> Tuple[CachedResponse, str]:
+        """按缓存语义取得响应
+        
+        Args:
+            key: 缓存键
+            loader: 向后端发起请求的函数
+            request_headers: 客户端请求头（键为小写），用于匹配Vary
+            timeout: 等待其他请求的结果的超时时间
+        
+        Returns:
+            (响应, 缓存状态)，缓存状态为 HIT/STALE/MISS/REVALIDATED/COALESCED
+        """
+        now = time.time()
+        entry = self.lookup(key, request_headers)
+        if entry is not None:
+            if entry.is_fresh(now):
+                self.counters.add('hits')
+                return entry, 'HIT'
+            if entry.can_serve_stale(now):
+                self.counters.add('stale_hits')
+                self.revalidate(key, loader, request_headers, entry)
+                return entry, 'STALE'
+        
+        return self.fetch(key, loader, request_headers, stale=entry, timeout=timeout)
+    
+    def _variant_key(self, key: str, request_headers: Dict[str, str]) -> str:
+        """按该键已知的Vary头部，把请求中这些头部的取值加入缓存键"""
+        names = self._vary_names.get(key)
+        if not names:
+            return key
+        return key + ''.join(f"\n{name}:{request_headers.get(name, '')}" for name in names)
+    
+    def lookup(self, key: str, request_headers: Dict[str, str]) -> Optional[CachedResponse]:
+        """查找缓存的响应（不论是否新鲜）"""
+        key = self._variant_key(key, request_headers)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        
+        if entry is None and self.disk is not None:
+            entry = self.disk.load(key)
+            if entry is not None:
+                self._store_memory(key, entry)
+        
+        if entry is not None and not entry.matches(request_headers):
+            return None
+        return entry
+    
+    def store(self, key: str, entry: CachedResponse) -> bool:
+        """写入缓存（按响应的Vary存为对应的变体），不可缓存或过大的响应返回False"""
+        if not entry.cacheable or entry.size > self.max_entry_bytes:
+            return False
+        if entry.vary_headers:
+            self._vary_names[key] = entry.vary_headers
+            key += ''.join(f"\n{name}:{entry.vary.get(name, '')}" for name in entry.vary_headers)
+        elif key in self._vary_names:
+            del self._vary_names[key]
+        self._store_memory(key, entry)
+        self.counters.add('stores')
+        return True
+    
+    def _store_memory(self, key: str, entry: CachedResponse):
+        """写入内存缓存，淘汰的响应写入磁盘"""
+        evicted = []
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old.size
+            self._entries[key] = entry
+            self._bytes += entry.size
+            while self._bytes > self.max_bytes and self._entries:
+                evicted_key, evicted_entry = self._entries.popitem(last=False)
+                self._bytes -= evicted_entry.size
+                evicted.append((evicted_key, evicted_entry))
+        
+        if evicted:
+            self.counters.add('evictions', len(evicted))
+            if self.disk is not None:
+                for evicted_key, evicted_entry in evicted:
+                    self.disk.save(evicted_key, evicted_entry)
+    
+    def fetch(self, key: str, loader: Loader, request_headers: Dict[str, str],
+              stale: Optional[CachedResponse] = None,
+              timeout: Optional[float] = None) -> Tuple[CachedResponse, str]:
+        """向后端请求并写入缓存，同一个键的并发请求合并为一个"""
+        flight_key = self._variant_key(key, request_headers)
+        with self._lock:
+            flight = self._flights.get(flight_key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[flight_key] = _Flight()
+        
+        if not leader:
+            if flight.event.wait(timeout):
+                if flight.error is not None:
+                    raise flight.error
+                entry = flight.entry
+                # 只共享可缓存且Vary匹配的响应，其他情况各自请求后端
+                if entry is not None and entry.cacheable and entry.matches(request_headers):
+                    self.counters.add('coalesced')
+                    return entry, 'COALESCED'
+            return self._load(key, loader, request_headers, stale)
+        
+        return self._lead(key, flight_key, flight, loader, request_headers, stale)
+    
+    def _lead(self, key: str, flight_key: str, flight: _Flight, loader: Loader,
+              request_headers: Dict[str, str],
+              stale: Optional[CachedResponse]) -> Tuple[CachedResponse, str]:
+        """作为 flight 的发起者请求后端，结束后唤醒等待的请求"""
+        try:
+            entry, status = self._load(key, loader, request_headers, stale)
+            flight.entry = entry
+            return entry, status
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(flight_key, None)
+            flight.event.set()
+    
+    def _load(self, key: str, loader: Loader, request_headers: Dict[str, str],
+              stale: Optional[CachedResponse]) -> Tuple[CachedResponse, str]:
+        """调用加载函数，处理304重新验证并写入缓存"""
+        response = loader(stale.validators() if stale is not None else {})
+        
+        if response.status == 304 and stale is not None:
+            entry = stale.refresh(response.headers)
+            self.store(key, entry)
+            self.counters.add('revalidated')
+            return entry, 'REVALIDATED'
+        
+        response.vary = {name: request_headers.get(name, '') for name in response.vary_headers}
+        self.store(key, response)
+        self.counters.add('misses')
+        return response, 'MISS'
+    
+    def revalidate(self, key: str, loader: Loader, request_headers: Dict[str, str],
+                   stale: CachedResponse):
+        """在后台线程中重新验证过期的响应
+        
+        启动线程前就登记为进行中的请求，同一个键的其他过期命中和未命中都与之合并。
+        """
+        flight_key = self._variant_key(key, request_headers)
+        with self._lock:
+            if flight_key in self._flights:
+                return
+            flight = self._flights[flight_key] = _Flight()
+        
+        thread = threading.Thread(
+            target=self._revalidate,
+            args=(key, flight_key, flight, loader, dict(request_headers), stale),
+            daemon=True
+        )
+        thread.start()
+    
+    def _revalidate(self, key: str, flight_key: str, flight: _Flight, loader: Loader,
+                    request_headers: Dict[str, str], stale: CachedResponse):
+        """后台重新验证，失败时保留旧的响应"""
+        try:
+            self._lead(key, flight_key, flight, loader, request_headers, stale)
+        except Exception as e:
+            self.counters.add('errors')
+            logger.warning(f"Background revalidation of {key} failed: {e}")
+    
+    def invalidate(self, key: str):
+        """删除一个缓存键的响应，包括它的所有Vary变体"""
+        self._vary_names.pop(key, None)
+        prefix = key + '\n'
+        with self._lock:
+            keys = [k for k in self._entries if k == key or k.startswith(prefix)]
+            for k in keys:
+                self._bytes -= self._entries.pop(k).size
+        if self.disk is not None:
+            with self.disk._lock:
+                disk_keys = [k for k in self.disk._index if k == key or k.startswith(prefix)]
+            for k in disk_keys:
+                self.disk.remove(k)
+    
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+            self._vary_names.clear()
+            self._bytes = 0
+        if self.disk is not None:
+            self.disk.clear()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取统计信息"""
+        stats = self.counters.snapshot()
+        lookups = stats['hits'] + stats['stale_hits'] + stats['misses'] + stats['coalesced'] + stats['revalidated']
+        with self._lock:
+            stats.update({
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'in_flight': len(self._flights)
+            })
+        stats['hit_rate'] = (
+            (stats['hits'] + stats['stale_hits'] + stats['coalesced']) / lookups
+            if lookups > 0 else 0
+        )
+        if self.disk is not None:
+            stats['disk'] = self.disk.get_stats()
+        return stats
@@ -0,0 +1,575 @@
+import os
+import time
+import errno
+import socket
+import logging
+import selectors
+import threading
+from typing import Optional, Dict, Any, List, Set, Union
+from algorithms.base import LoadBalancer, Backend
+from balancer.tcp_proxy import TCPProxy
+from balancer.timer_wheel import TimerWheel
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+EVENT_READ = selectors.EVENT_READ
+EVENT_WRITE = selectors.EVENT_WRITE
+
+# 检查连接超时和空闲超时的间隔（秒）
+SWEEP_INTERVAL = 1.0
+
+# 每次监听socket可读时最多accept的连接数，避免新连接饿死已有连接
+ACCEPT_BATCH = 64
+
+# selector中区分监听socket和唤醒socket的标记
+_LISTENER = object()
+_WAKEUP = object()
+
+def _raise_fd_limit():
+    """把打开文件数的软限制提高到硬限制（每个代理连接占用两个fd）"""
+    if resource is None:
+        return
+    try:
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if hard != resource.RLIM_INFINITY and soft < hard:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ValueError, OSError) as e:
+        logger.warning(f"Failed to raise file descriptor limit: {e}")
+
+class EventLoopTCPProxy(TCPProxy):
+    """基于selectors（epoll/kqueue）的TCP代理
+    
+    TCPProxy为每个连接使用三个线程；这里每个事件循环线程用一个selector驱动
+    所有客户端/后端socket对，连接数只受文件描述符数量限制。
+    
+    默认每个CPU核心一个事件循环。支持SO_REUSEPORT时每个循环有自己的监听
+    socket，由内核分配新连接；否则所有循环共享同一个非阻塞监听socket。
+    后端选择、活跃连接数、统计信息和配置项都与 TCPProxy 相同。
+    """
+    
+    def __init__(self,
+                 listen_host: str = '0.0.0.0',
+                 listen_port: int = 8080,
+                 load_balancer: LoadBalancer = None,
+                 loops: Optional[int] = None):
+        """
+        Args:
+            loops: 事件循环数，默认为CPU核数
+        """
+        super().__init__(listen_host, listen_port, load_balancer)
+        self.loop_count = loops or os.cpu_count() or 1
+        self.max_connections = 65536
+        self.loops: List['EventLoop'] = []
+        self.listeners: List[socket.socket] = []
+        
+        # 所有事件循环共享的连接数，用于 max_connections 限制
+        self._connection_count = 0
+        self._count_lock = threading.Lock()
+    
+    def start(self):
+        """启动TCP代理"""
+        if self.is_running:
+            raise RuntimeError("TCP proxy is already running")
+        
+        _raise_fd_limit()
+        try:
+            self.listeners = self._create_listeners()
+            self.server_socket = self.listeners[0]
+            self.is_running = True
+            
+            if self.upstream_pool:
+                self.upstream_pool.start()
+            
+            for i in range(self.loop_count):
+                loop = EventLoop(self, self.listeners[i % len(self.listeners)], i)
+                self.loops.append(loop)
+                loop.start()
+            
+            logger.info(
+                f"TCP proxy started on {self.listen_host}:{self.listen_port} "
+                f"with {self.loop_count} event loops ({len(self.listeners)} listeners)"
+            )
+        
+        except Exception as e:
+            self.stop()
+            raise RuntimeError(f"Failed to start TCP proxy: {e}")
+    
+    def _create_listeners(self) -> List[socket.socket]:
+        """创建监听socket"""
+        # worker模式下其他进程也在监听同一端口，必须设置SO_REUSEPORT
+        reuse_port = (self.loop_count > 1 or self.worker_context is not None) and hasattr(socket, 'SO_REUSEPORT')
+        count = self.loop_count if reuse_port else 1
+        listeners = []
+        try:
+            for _ in range(count):
+                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                listeners.append(sock)
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                if reuse_port:
+                    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+                sock.bind((self.listen_host, self.listen_port))
+                sock.listen(1024)
+                sock.setblocking(False)
+                # 端口为0时，其余监听socket绑定到第一个分配到的端口
+                self.listen_port = sock.getsockname()[1]
+        except OSError:
+            for sock in listeners:
+                sock.close()
+            raise
+        return listeners
+    
+    def stop(self):
+        """停止TCP代理，各事件循环退出时关闭自己的连接"""
+        self.is_running = False
+        
+        for loop in self.loops:
+            loop.wakeup()
+        for loop in self.loops:
+            if loop is not threading.current_thread():
+                loop.join(timeout=5)
+        self.loops = []
+        
+        for sock in self.listeners:
+            sock.close()
+        self.listeners = []
+        self.server_socket = None
+        
+        if self.upstream_pool:
+            self.upstream_pool.stop()
+        
+        logger.info("TCP proxy stopped")
+    
+    def set_idle_timeout(self, timeout: int):
+        """设置空闲超时时间（秒），已有连接按新的超时时间重新调度"""
+        self.idle_timeout = timeout
+        for loop in self.loops:
+            for conn in loop.timers.items():
+                if not conn.connecting:
+                    loop.timers.schedule(conn, conn.last_active + timeout)
+    
+    def _reserve_connection(self) -> bool:
+        """占用一个连接名额，达到 max_connections 时返回False"""
+        with self._count_lock:
+            if self._connection_count >= self.max_connections:
+                return False
+            self._connection_count += 1
+            return True
+    
+    def _release_connection(self):
+        """释放一个连接名额"""
+        with self._count_lock:
+            self._connection_count -= 1
+    
+    def get_connection_count(self) -> int:
+        """当前连接数"""
+        return self._connection_count
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取统计信息"""
+        stats = super().get_stats()
+        stats.update({
+            'engine': 'selectors',
+            'selector': selectors.DefaultSelector.__name__,
+            'loops': self.loop_count,
+            'listeners': len(self.listeners),
+            'connections_per_loop': [len(loop.connections) for loop in self.loops]
+        })
+        return stats
+
+class EventLoop(threading.Thread):
+    """事件循环线程，驱动分配到本循环的所有连接"""
+    
+    def __init__(self, proxy: EventLoopTCPProxy, listener: socket.socket, index: int):
+        super().__init__(name=f"tcp-event-loop-{index}", daemon=True)
+        self.proxy = proxy
+        self.listener = listener
+        self.selector = selectors.DefaultSelector()
+        self.connections: Set['EventConnection'] = set()
+        
+        # 连接超时和空闲超时的时间轮，每个连接在其中只有一个条目
+        self.timers = TimerWheel(tick=SWEEP_INTERVAL)
+        
+        # 用于从其他线程唤醒select
+        self._wakeup_reader, self._wakeup_writer = socket.socketpair()
+        self._wakeup_reader.setblocking(False)
+        self._wakeup_writer.setblocking(False)
+    
+    def wakeup(self):
+        """唤醒事件循环"""
+        try:
+            self._wakeup_writer.send(b'\0')
+        except OSError:
+            pass
+    
+    def run(self):
+        selector = self.selector
+        selector.register(self.listener, EVENT_READ, _LISTENER)
+        selector.register(self._wakeup_reader, EVENT_READ, _WAKEUP)
+        next_sweep = time.monotonic() + SWEEP_INTERVAL
+        
+        try:
+            while self.proxy.is_running:
+                for key, mask in selector.select(SWEEP_INTERVAL):
+                    data = key.data
+                    if data is _LISTENER:
+                        self._accept()
+                    elif data is _WAKEUP:
+                        self._drain_wakeup()
+                    else:
+                        data.handle(key.fileobj, mask)
+                
+                now = time.monotonic()
+                if now >= next_sweep:
+                    self._sweep(now)
+                    next_sweep = now + SWEEP_INTERVAL
+        
+        except Exception as e:
+            logger.error(f"Error in {self.name}: {e}")
+        
+        finally:
+            for conn in list(self.connections):
+                conn.close()
+            selector.close()
+            self._wakeup_reader.close()
+            self._wakeup_writer.close()
+    
+    def _drain_wakeup(self):
+        try:
+            while self._wakeup_reader.recv(4096):
+                pass
+        except (BlockingIOError, InterruptedError):
+            pass
+    
+    def _accept(self):
+        """接受新连接"""
+        proxy = self.proxy
+        for _ in range(ACCEPT_BATCH):
+            try:
+                client_socket, client_addr = self.listener.accept()
+            except (BlockingIOError, InterruptedError):
+                # 共享监听socket时，其他循环可能已经取走了连接
+                return
+            except OSError as e:
+                if proxy.is_running:
+                    logger.error(f"Error accepting connection: {e}")
+                return
+            
+            if not proxy._reserve_connection():
+                logger.warning(f"Max connections reached ({proxy.max_connections}), rejecting {client_addr}")
+                client_socket.close()
+                continue
+            
+            self._open(client_socket, client_addr)
+    
+    def _open(self, client_socket: socket.socket, client_addr):
+        """为新连接选择后端并发起非阻塞连接"""
+        proxy = self.proxy
+        conn_id = f"{client_addr[0]}:{client_addr[1]}->{proxy.listen_host}:{proxy.listen_port}"
+        
+        client_socket.setblocking(False)
+        connection = EventConnection(self, conn_id, client_socket, client_addr[0])
+        if not connection.connect_next():
+            logger.warning(f"No healthy backend available for {conn_id}")
+            client_socket.close()
+            proxy._release_connection()
+            return
+        
+        self.connections.add(connection)
+        proxy.counters.add_many({'total_connections': 1, 'active_connections': 1})
+        connection.update_interest()
+    
+    def _sweep(self, now: float):
+        """处理时间轮中到期的连接：连接超时的关闭，空闲超时的关闭，其余重新调度"""
+        idle_timeout = self.proxy.idle_timeout
+        for conn in self.timers.advance(now):
+            if conn.is_closed:
+                continue
+            
+            if conn.connecting:
+                if now >= conn.connect_deadline:
+                    conn.connect_failed("timed out")
+                    if not conn.is_closed:
+                        conn.update_interest()
+                else:
+                    self.timers.schedule(conn, conn.connect_deadline)
+                continue
+            
+            # 到期时才检查活跃时间，期间有过数据的连接按新的截止时间重新调度
+            deadline = conn.last_active + idle_timeout
+            if deadline <= now:
+                logger.info(f"Closed idle connection: {conn.conn_id}")
+                conn.close()
+            else:
+                self.timers.schedule(conn, deadline)
+
+class EventConnection:
+    """事件循环中的一对客户端/后端socket
+    
+    每个方向最多缓存一块未发出的数据；有待发送数据时暂停读取来源socket，
+    由对端的接收窗口形成背压，内存占用与传输量无关。
+    一端关闭写方向后，把剩余数据发完再关闭另一端的写方向（半关闭）。
+    """
+    
+    __slots__ = ('loop', 'conn_id', 'client_socket', 'client_ip', 'backend_socket', 'backend', 'tried',
+                 'to_client', 'to_backend', 'client_eof', 'backend_eof',
+                 'client_shutdown', 'backend_shutdown', 'connecting', 'connect_deadline',
+                 'last_active', 'bytes_received', 'bytes_sent', 'is_closed',
+                 '_client_events', '_backend_events')
+    
+    def __init__(self, loop: EventLoop, conn_id: str, client_socket: socket.socket, client_ip: str):
+        self.loop = loop
+        self.conn_id = conn_id
+        self.client_socket = client_socket
+        self.client_ip = client_ip
+        self.backend_socket: Optional[socket.socket] = None  # 由 connect_next 设置
+        self.backend: Optional[Backend] = None
+        self.tried: List[Backend] = []  # 已尝试过的后端
+        
+        self.to_client: Union[bytes, memoryview] = b''  # 待发给客户端的数据
+        self.to_backend: Union[bytes, memoryview] = b''  # 待发给后端的数据
+        self.client_eof = False  # 客户端已关闭写方向
+        self.backend_eof = False  # 后端已关闭写方向
+        self.client_shutdown = False  # 已关闭发往客户端的写方向
+        self.backend_shutdown = False  # 已关闭发往后端的写方向
+        
+        self.connecting = True
+        self.connect_deadline = 0.0
+        self.last_active = time.monotonic()
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        self.is_closed = False
+        
+        self._client_events = 0
+        self._backend_events = 0
+    
+    def handle(self, sock: socket.socket, mask: int):
+        """处理socket事件"""
+        try:
+            if sock is self.backend_socket:
+                if self.connecting:
+                    self._finish_connect()
+                else:
+                    if mask & EVENT_WRITE:
+                        self.to_backend = self._send(self.backend_socket, self.to_backend)
+                    if mask & EVENT_READ and not self.is_closed:
+                        self._read(self.backend_socket, self.client_socket, to_client=True)
+            else:
+                if mask & EVENT_WRITE:
+                    self.to_client = self._send(self.client_socket, self.to_client)
+                if mask & EVENT_READ and not self.is_closed:
+                    self._read(self.client_socket, self.backend_socket, to_client=False)
+            
+            if not self.is_closed:
+                self._check_shutdown()
+            if not self.is_closed:
+                self.update_interest()
+        
+        except Exception as e:
+            logger.error(f"Error in proxy data for {self.conn_id}: {e}")
+            self.close()
+    
+    def connect_next(self) -> bool:
+        """连接下一个还没有尝试过的后端，优先使用预热池中的连接
+        
+        Returns:
+            是否已有可用或正在建立的后端连接；返回False时原有的后端连接保持不变
+        """
+        proxy = self.loop.proxy
+        while len(self.tried) < proxy.connect_attempts:
+            backend = proxy._next_untried_backend(self.client_ip, self.tried)
+            if backend is None:
+                return False
+            self.tried.append(backend)
+            
+            backend_socket = proxy.upstream_pool.acquire(backend) if proxy.upstream_pool else None
+            if backend_socket:
+                backend_socket.setblocking(False)
+                self._use_backend(backend, backend_socket, connecting=False)
+                return True
+            
+            backend_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            backend_socket.setblocking(False)
+            try:
+                err = backend_socket.connect_ex((backend.host, backend.port))
+            except OSError as e:
+                err = e.errno
+            
+            if err in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+                self._use_backend(backend, backend_socket, connecting=True)
+                return True
+            
+            logger.error(f"Error connecting {self.conn_id} to {backend.address}: {os.strerror(err)}")
+            backend.mark_error()
+            backend_socket.close()
+        return False
+    
+    def connect_failed(self, reason: str):
+        """连接当前后端失败：标记错误并换下一个后端，没有可换的后端时关闭连接"""
+        logger.error(f"Error connecting {self.conn_id} to {self.backend.address}: {reason}")
+        self.backend.mark_error()
+        if not self.connect_next():
+            self.close()
+    
+    def _use_backend(self, backend: Backend, backend_socket: socket.socket, connecting: bool):
+        """切换到新的后端连接，释放之前失败的后端连接"""
+        if self.backend_socket is not None:
+            if self._backend_events:
+                self.loop.selector.unregister(self.backend_socket)
+                self._backend_events = 0
+            self.backend_socket.close()
+            self.backend.decrement_active()
+        
+        # 增加后端活跃连接数
+        backend.increment_active()
+        self.backend = backend
+        self.backend_socket = backend_socket
+        self.connecting = connecting
+        if connecting:
+            self.connect_deadline = time.monotonic() + self.loop.proxy.connect_timeout
+            self.loop.timers.schedule(self, self.connect_deadline)
+        else:
+            self._connected()
+    
+    def _connected(self):
+        self.last_active = time.monotonic()
+        self.loop.timers.schedule(self, self.last_active + self.loop.proxy.idle_timeout)
+        logger.debug(f"New connection {self.conn_id} proxied to {self.backend.address}")
+    
+    def _finish_connect(self):
+        """非阻塞连接完成"""
+        err = self.backend_socket.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if err:
+            self.connect_failed(os.strerror(err))
+            return
+        
+        self.connecting = False
+        self._connected()
+    
+    def _read(self, source: socket.socket, destination: socket.socket, to_client: bool):
+        """从来源读取一块数据并尽量直接发出，发不完的部分留待可写时发送"""
+        try:
+            data = source.recv(self.loop.proxy.buffer_size)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            self.close()
+            return
+        
+        if not data:
+            if to_client:
+                self.backend_eof = True
+            else:
+                self.client_eof = True
+            return
+        
+        self.last_active = time.monotonic()
+        if to_client:
+            self.bytes_sent += len(data)
+            self.to_client = self._send(destination, data)
+        else:
+            self.bytes_received += len(data)
+            self.to_backend = self._send(destination, data)
+    
+    def _send(self, destination: socket.socket, data: Union[bytes, memoryview]) -> Union[bytes, memoryview]:
+        """发送数据，返回未发出的部分"""
+        if not data:
+            return b''
+        try:
+            sent = destination.send(data)
+        except (BlockingIOError, InterruptedError):
+            return data
+        except OSError:
+            self.close()
+            return b''
+        
+        if sent == len(data):
+            return b''
+        return memoryview(data)[sent:]
+    
+    def _check_shutdown(self):
+        """转发半关闭；两个方向都结束后关闭连接"""
+        if self.client_eof and not self.to_backend and not self.backend_shutdown:
+            self.backend_shutdown = True
+            self._shutdown_write(self.backend_socket)
+        if self.backend_eof and not self.to_client and not self.client_shutdown:
+            self.client_shutdown = True
+            self._shutdown_write(self.client_socket)
+        if self.client_shutdown and self.backend_shutdown:
+            self.close()
+    
+    @staticmethod
+    def _shutdown_write(sock: socket.socket):
+        try:
+            sock.shutdown(socket.SHUT_WR)
+        except OSError:
+            pass
+    
+    def update_interest(self):
+        """根据连接状态更新两个socket关注的事件"""
+        if self.connecting:
+            client_events = 0
+            backend_events = EVENT_WRITE
+        else:
+            # 有待发送的数据时暂停读取来源，形成背压
+            client_events = (
+                (EVENT_READ if not self.client_eof and not self.to_backend else 0)
+                | (EVENT_WRITE if self.to_client else 0)
+            )
+            backend_events = (
+                (EVENT_READ if not self.backend_eof and not self.to_client else 0)
+                | (EVENT_WRITE if self.to_backend else 0)
+            )
+        
+        self._client_events = self._register(self.client_socket, self._client_events, client_events)
+        self._backend_events = self._register(self.backend_socket, self._backend_events, backend_events)
+    
+    def _register(self, sock: socket.socket, current: int, events: int) -> int:
+        """在selector中注册、修改或注销socket"""
+        if events != current:
+            selector = self.loop.selector
+            if current == 0:
+                selector.register(sock, events, self)
+            elif events == 0:
+                selector.unregister(sock)
+            else:
+                selector.modify(sock, events, self)
+        return events
+    
+    def close(self):
+        """关闭连接"""
+        if self.is_closed:
+            return
+        self.is_closed = True
+        
+        selector = self.loop.selector
+        for sock, events in ((self.client_socket, self._client_events),
+                             (self.backend_socket, self._backend_events)):
+            if events:
+                try:
+                    selector.unregister(sock)
+                except (KeyError, ValueError):
+                    pass
+            try:
+                sock.close()
+            except OSError:
+                pass
+        self._client_events = self._backend_events = 0
+        
+        self.loop.connections.discard(self)
+        self.loop.timers.cancel(self)
+        proxy = self.loop.proxy
+        proxy._release_connection()
+        proxy.counters.add_many({
+            'active_connections': -1,
+            'total_bytes_received': self.bytes_received,
+            'total_bytes_sent': self.bytes_sent
+        })
+        
+        # 减少后端活跃连接数
+        self.backend.decrement_active()
+        logger.debug(f"Connection {self.conn_id} closed")
\ No newline at end of file
@@ -1,19 +1,99 @@
 from flask import Flask, request, Response, jsonify, g
 import requests
 import logging
-from typing import Dict, List, Optional, Any, Callable
+from typing import Dict, List, Optional, Any, Callable, Tuple
 from urllib.parse import urljoin, urlparse
 import time
+import heapq
+import itertools
+import tempfile
 import threading
+from concurrent.futures import ThreadPoolExecutor, Future
 from flask import Flask, request, Response, jsonify
 from algorithms.base import LoadBalancer, Backend
+from algorithms.counters import StripedCounter
+from balancer.route import RouteConfig, RouteTable, HeaderPlan
+from balancer.cache import ResponseCache, CachedResponse
+from balancer.workers import WorkerContext
 from discovery.registry import ServiceRegistry
 from middleware.session import SessionManager
 from middleware.circuit_breaker import CircuitBreaker
 from middleware.rate_limiter import TokenBucketRateLimiter
+from middleware.retry import RetryBudget, IDEMPOTENT_METHODS, SAFE_METHODS
 
 logger = logging.getLogger(__name__)
 
+# 根据p95计算对冲等待时间所需的最少样本数
+HEDGE_MIN_SAMPLES = 20
+
+# 发送对冲请求的线程池默认大小，即同时在途的对冲请求上限
+DEFAULT_HEDGE_WORKERS = 64
+
+# 请求体默认在内存中缓冲的最大字节数，超过后写入临时文件
+DEFAULT_BODY_SPOOL_SIZE = 1024 * 1024
+
+# 读取和转发请求体时每块的大小
+BODY_CHUNK_SIZE = 64 * 1024
+
+class _DelayedCalls:
+    """单个后台线程按到期时间调用函数，用于在等待时间到达后发出对冲请求"""
+    
+    def __init__(self, name: str):
+        self.name = name
+        self._heap: List[Tuple[float, int, List[Optional[Callable[[], None]]]]] = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+    
+    def call_later(self, delay: float, func: Callable[[], None]) -> List[Optional[Callable[[], None]]]:
+        """delay 秒后调用 func，返回可传给 cancel 的句柄"""
+        handle = [func]
+        with self._cond:
+            heapq.heappush(self._heap, (time.monotonic() + delay, next(self._seq), handle))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True, name=self.name)
+                self._thread.start()
+            self._cond.notify()
+        return handle
+    
+    @staticmethod
+    def cancel(handle: List[Optional[Callable[[], None]]]):
+        """取消尚未执行的调用"""
+        handle[0] = None
+    
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if not self._heap:
+                        self._cond.wait()
+                        continue
+                    deadline, _, handle = self._heap[0]
+                    remaining = deadline - time.monotonic()
+                    if handle[0] is None or remaining <= 0:
+                        heapq.heappop(self._heap)
+                        if handle[0] is not None:
+                            break
+                        continue
+                    self._cond.wait(remaining)
+            
+            func = handle[0]
+            if func is not None:
+                try:
+                    func()
+                except Exception as e:
+                    logger.error(f"Error in {self.name}: {e}")
+
+class _NoHealthyBackend(Exception):
+    """缓存加载时没有可用的后端"""
+
+class RequestBodyTooLarge(Exception):
+    """请求体超过路由允许的大小"""
+    
+    def __init__(self, limit: int):
+        super().__init__(f"Request body exceeds {limit} bytes")
+        self.limit = limit
+
 class HTTPProxy:
     """HTTP反向代理负载均衡器"""
     
@@ -24,20 +104,22 @@ class HTTPProxy:
         self.service_name: Optional[str] = None
         
         # 路由配置
-        self.routes: Dict[str, 'RouteConfig'] = {}
-        self.default_route: Optional['RouteConfig'] = None
+        self.route_table = RouteTable()
+        self.routes: Dict[str, RouteConfig] = self.route_table.routes
+        self._default_header_plan = HeaderPlan()  # 没有匹配路由的请求使用
         
-        # 统计信息
-        self.total_requests = 0
-        self.successful_requests = 0
-        self.failed_requests = 0
-        self.total_response_time = 0
-        self.stats_lock = threading.Lock()
+        # 统计信息（按线程分片累加，读取时合并）
+        self.counters = StripedCounter((
+            'total_requests', 'successful_requests', 'failed_requests', 'total_response_time',
+            'retries', 'hedged_requests', 'hedge_wins'
+        ))
         
         # 配置选项
         self.request_timeout = 30
         self.access_log_enabled = True
         self.session_timeout = 3600  # 1小时
+        self.max_body_size: Optional[int] = None  # 请求体大小上限，None表示不限制
+        self.body_spool_size = DEFAULT_BODY_SPOOL_SIZE
         
         # HTTP会话
         self.session = requests.Session()
@@ -48,6 +130,17 @@ class HTTPProxy:
         self.circuit_breaker = CircuitBreaker()
         self.rate_limiter = TokenBucketRateLimiter(capacity=100, refill_rate=10.0)
         
+        # 响应缓存（仅对开启了 cache 的路由生效）
+        self.response_cache = ResponseCache()
+        
+        # 首个请求在处理请求的线程中发送，只有对冲的那一份在线程池中发送
+        self.hedge_executor = ThreadPoolExecutor(max_workers=DEFAULT_HEDGE_WORKERS, thread_name_prefix='hedge')
+        self.hedge_slots = threading.BoundedSemaphore(DEFAULT_HEDGE_WORKERS)  # 线程都在忙时不排队
+        self.hedge_timer = _DelayedCalls('hedge-timer')
+        
+        # 多进程worker模式下的上下文（见 balancer.workers）
+        self.worker_context: Optional[WorkerContext] = None
+        
         # 注册Flask路由处理器
         self._register_routes()
     
@@ -56,22 +149,52 @@ class HTTPProxy:
         self.registry = registry
         self.service_name = service_name
     
-    def add_route(self, path: str, config: 'RouteConfig'):
+    @property
+    def default_route(self) -> Optional[RouteConfig]:
+        """默认路由"""
+        return self.route_table.default_route
+    
+    def add_route(self, path: str, config: RouteConfig):
         """添加路由规则"""
-        config.path = path
-        self.routes[path] = config
+        self.route_table.add(path, config)
+        if self.worker_context and config.load_balancer:
+            self.worker_context.attach(config.load_balancer)
         logger.info(f"Added route: {path} -> {config.service_name}")
     
-    def set_default_route(self, config: 'RouteConfig'):
+    def set_default_route(self, config: RouteConfig):
         """设置默认路由"""
-        self.default_route = config
+        self.route_table.set_default(config)
         logger.info("Set default route")
     
+    def set_response_cache(self, cache: ResponseCache):
+        """设置响应缓存，例如使用不同的大小或启用磁盘缓存"""
+        self.response_cache = cache
+    
     def set_request_timeout(self, timeout: int):
         """设置请求超时时间"""
         self.request_timeout = timeout
         self.session.timeout = timeout
     
+    def set_body_limits(self, max_body_size: Optional[int], spool_size: int = DEFAULT_BODY_SPOOL_SIZE):
+        """设置请求体大小上限和内存缓冲大小（路由可以单独覆盖）"""
+        self.max_body_size = max_body_size
+        self.body_spool_size = spool_size
+    
+    def set_hedge_workers(self, workers: int):
+        """设置发送对冲请求的线程数，线程都在忙时不再发出新的对冲请求"""
+        old_executor = self.hedge_executor
+        self.hedge_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='hedge')
+        self.hedge_slots = threading.BoundedSemaphore(workers)
+        old_executor.shutdown(wait=False)
+    
+    def set_worker_context(self, context: WorkerContext):
+        """在worker进程中运行：后端状态从父进程同步，统计信息汇总所有worker"""
+        self.worker_context = context
+        context.attach(self.load_balancer, self.counters)
+        for config in list(self.routes.values()):
+            if config.load_balancer:
+                context.attach(config.load_balancer)
+    
     def enable_access_log(self, enable: bool):
         """启用/禁用访问日志"""
         self.access_log_enabled = enable
@@ -109,10 +232,10 @@ class HTTPProxy:
     def _handle_request(self, path: str) -> Response:
         """处理HTTP请求"""
         start_time = time.time()
+        streaming = False  # 流式响应在传输结束时才记录统计和访问日志
         
         # 更新请求计数
-        with self.stats_lock:
-            self.total_requests += 1
+        self.counters.add('total_requests')
         
         try:
             # 获取客户端IP
@@ -129,6 +252,15 @@ class HTTPProxy:
             # 选择路由和负载均衡器
             route_config, lb = self._select_route(request.path)
             
+            # 声明的请求体长度超过上限时直接拒绝，不占用后端
+            limit = self._body_limit(route_config)
+            if limit is not None and (request.content_length or 0) > limit:
+                return Response("Request body too large", status=413)
+            
+            # 可缓存的请求先查询响应缓存，命中时不需要选择后端
+            if self._use_cache(route_config):
+                return self._handle_cached_request(path, route_config, lb, client_ip, start_time)
+            
             # 选择后端服务
             backend = lb.next_backend(client_ip)
             if not backend:
@@ -147,14 +279,26 @@ class HTTPProxy:
             backend.increment_active()
             
             try:
-                # 构建目标URL
-                target_url = self._build_target_url(backend, path, route_config)
-                
                 # 准备请求头
-                headers = self._prepare_headers(route_config)
+                headers = self._prepare_headers(route_config, client_ip)
                 
-                # 发起代理请求
-                response = self._make_proxy_request(target_url, headers, backend)
+                # 发起代理请求（失败时可能换其他后端重试，backend为实际完成请求的后端）
+                response, backend = self._forward_request(lb, backend, path, headers, route_config, client_ip)
+                
+                # 流式转发：连接数、响应时间和访问日志在响应体传输结束后记录
+                if route_config and route_config.stream:
+                    if route_config.enable_session_affinity:
+                        self.session_manager.bind_session_to_backend(request, backend)
+                    
+                    log_line = f"{request.method} {request.path} {client_ip}"
+                    flask_response = self._create_streaming_response(
+                        response, route_config, backend,
+                        lambda completed, error: self._finish_stream(
+                            lb, backend, start_time, log_line, completed, error
+                        )
+                    )
+                    streaming = True
+                    return flask_response
                 
                 # 应用响应处理
                 flask_response = self._create_flask_response(response, route_config, backend)
@@ -168,33 +312,160 @@ class HTTPProxy:
                 
                 # 更新响应时间统计
                 response_time = (time.time() - start_time) * 1000  # 毫秒
-                if hasattr(self.load_balancer, 'update_response_time'):
-                    self.load_balancer.update_response_time(backend.id, response_time)
+                backend.update_response_time(response_time)
+                if hasattr(lb, 'update_response_time'):
+                    lb.update_response_time(backend.id, response_time)
                 
-                with self.stats_lock:
-                    self.successful_requests += 1
-                    self.total_response_time += response_time
+                self.counters.add_many({
+                    'successful_requests': 1,
+                    'total_response_time': response_time
+                })
                 
                 return flask_response
                 
             finally:
-                backend.decrement_active()
+                if not streaming:
+                    backend.decrement_active()
+        
+        except RequestBodyTooLarge:
+            # chunked请求体在读取过程中超过上限
+            return Response("Request body too large", status=413)
         
         except Exception as e:
             logger.error(f"Error handling request {request.path}: {e}")
             self.circuit_breaker.record_failure()
             
-            with self.stats_lock:
-                self.failed_requests += 1
+            self.counters.add('failed_requests')
             
             return Response("Internal server error", status=500)
         
         finally:
             # 记录访问日志
-            if self.access_log_enabled:
+            if self.access_log_enabled and not streaming:
                 response_time = (time.time() - start_time) * 1000
                 logger.info(f"{request.method} {request.path} {client_ip} {response_time:.2f}ms")
     
+    def _finish_stream(self, lb: LoadBalancer, backend: Backend, start_time: float,
+                       log_line: str, completed: bool, error: Optional[Exception]):
+        """流式响应传输结束时记录统计信息和访问日志"""
+        backend.decrement_active()
+        response_time = (time.time() - start_time) * 1000
+        
+        if completed:
+            self.circuit_breaker.record_success()
+            backend.update_response_time(response_time)
+            if hasattr(lb, 'update_response_time'):
+                lb.update_response_time(backend.id, response_time)
+            self.counters.add_many({
+                'successful_requests': 1,
+                'total_response_time': response_time
+            })
+        elif error is not None:
+            # 后端在传输途中出错
+            logger.error(f"Error streaming response from {backend.address}: {error}")
+            backend.mark_error()
+            self.circuit_breaker.record_failure()
+            self.counters.add('failed_requests')
+        else:
+            # 客户端提前断开，不计入后端的失败
+            self.counters.add('failed_requests')
+        
+        if self.access_log_enabled:
+            logger.info(f"{log_line} {response_time:.2f}ms")
+    
+    def _use_cache(self, route_config: Optional[RouteConfig]) -> bool:
+        """当前请求是否可以使用共享响应缓存"""
+        if not route_config or not route_config.cache or route_config.stream:
+            return False
+        # 带身份信息的请求可能得到按用户生成的响应，不经过共享缓存
+        if request.method != 'GET' or 'Authorization' in request.headers or 'Cookie' in request.headers:
+            return False
+        # 客户端要求不使用缓存
+        cache_control = request.headers.get('Cache-Control', '').lower()
+        return 'no-store' not in cache_control and 'no-cache' not in cache_control
+    
+    def _handle_cached_request(self, path: str, route_config: RouteConfig, lb: LoadBalancer,
+                               client_ip: str, start_time: float) -> Response:
+        """通过响应缓存处理GET请求
+        
+        缓存的响应由所有客户端共享，因此这里不做会话保持。
+        """
+        key = f"{request.host}{request.full_path}"
+        request_headers = {k.lower(): v for k, v in request.headers.items()}
+        loader = self._cache_loader(
+            lb, self._build_target_path(path, route_config), self._prepare_headers(route_config, client_ip),
+            client_ip, route_config.cache_ttl
+        )
+        
+        try:
+            entry, cache_status = self.response_cache.get(
+                key, loader, request_headers, timeout=self.request_timeout
+            )
+        except _NoHealthyBackend:
+            self.counters.add('failed_requests')
+            return Response("No healthy backend available", status=503)
+        
+        response_time = (time.time() - start_time) * 1000
+        self.counters.add_many({
+            'successful_requests': 1,
+            'total_response_time': response_time
+        })
+        
+        headers = self._header_plan(route_config).response_headers(entry.headers, entry.backend)
+        headers['Age'] = str(int(entry.age()))
+        headers['X-Cache'] = cache_status
+        
+        # 客户端持有的版本仍然有效
+        if entry.not_modified(request.headers.get('If-None-Match')):
+            return Response(b'', status=304, headers=headers)
+        
+        return Response(entry.body, status=entry.status, headers=headers)
+    
+    def _cache_loader(self, lb: LoadBalancer, target_path: str, headers: Dict[str, str],
+                      client_ip: str, default_ttl: float) -> Callable[[Dict[str, str]], CachedResponse]:
+        """创建向后端获取可缓存响应的函数
+        
+        加载函数可能在后台线程中执行（stale-while-revalidate），
+        所以只使用这里捕获的参数，不访问Flask的request对象。
+        """
+        # 客户端的条件请求由缓存自己应答，后端必须返回完整的响应体
+        headers = {
+            k: v for k, v in headers.items()
+            if k.lower() not in ('if-none-match', 'if-modified-since')
+        }
+        
+        def load(conditional: Dict[str, str]) -> CachedResponse:
+            backend = lb.next_backend(client_ip)
+            if not backend:
+                self.circuit_breaker.record_failure()
+                raise _NoHealthyBackend()
+            
+            backend.increment_active()
+            start_time = time.time()
+            try:
+                response = self._send_request(
+                    'GET', f"http://{backend.address}/{target_path.lstrip('/')}",
+                    {**headers, **conditional}, None, backend, stream=True
+                )
+                # 按原样缓存响应体（不解压Content-Encoding），与缓存的头部保持一致
+                body = response.raw.read(decode_content=False)
+                response.close()
+            finally:
+                backend.decrement_active()
+            
+            self.circuit_breaker.record_success()
+            response_time = (time.time() - start_time) * 1000
+            backend.update_response_time(response_time)
+            if hasattr(lb, 'update_response_time'):
+                lb.update_response_time(backend.id, response_time)
+            
+            return CachedResponse.from_upstream(
+                response.status_code, list(response.headers.items()), body,
+                backend.address, default_ttl
+            )
+        
+        return load
+    
     def _get_client_ip(self) -> str:
         """获取客户端真实IP"""
         # 检查X-Forwarded-For头部
@@ -212,32 +483,15 @@ class HTTPProxy:
     
     def _select_route(self, path: str) -> tuple:
         """选择路由和负载均衡器"""
-        # 精确匹配
-        if path in self.routes:
-            route = self.routes[path]
-            return route, route.load_balancer or self.load_balancer
-        
-        # 前缀匹配
-        best_match = None
-        max_len = 0
-        
-        for route_path, route in self.routes.items():
-            if path.startswith(route_path) and len(route_path) > max_len:
-                best_match = route
-                max_len = len(route_path)
-        
-        if best_match:
-            return best_match, best_match.load_balancer or self.load_balancer
-        
-        # 使用默认路由
-        if self.default_route:
-            return self.default_route, self.default_route.load_balancer or self.load_balancer
-        
-        # 使用全局负载均衡器
-        return None, self.load_balancer
+        return self.route_table.select(path, self.load_balancer)
     
     def _build_target_url(self, backend: Backend, path: str, route_config: Optional['RouteConfig']) -> str:
         """构建目标URL"""
+        path = self._build_target_path(path, route_config)
+        return f"http://{backend.address}/{path.lstrip('/')}"
+    
+    def _build_target_path(self, path: str, route_config: Optional['RouteConfig']) -> str:
+        """构建转发到后端的路径（含查询参数）"""
         # 应用路径重写
         if route_config and route_config.rewrite_path:
             path = route_config.rewrite_path
@@ -246,132 +500,452 @@ class HTTPProxy:
         if request.query_string:
             path += '?' + request.query_string.decode()
         
-        return f"http://{backend.address}/{path.lstrip('/')}"
+        return path
     
-    def _prepare_headers(self, route_config: Optional['RouteConfig']) -> Dict[str, str]:
+    def _header_plan(self, route_config: Optional[RouteConfig]) -> HeaderPlan:
+        """获取路由的头部改写计划"""
+        if route_config is None:
+            return self._default_header_plan
+        plan = route_config.header_plan
+        if plan is None:
+            # 没有通过add_route添加的路由，按需编译
+            plan = route_config.header_plan = HeaderPlan(route_config)
+        return plan
+    
+    def _prepare_headers(self, route_config: Optional['RouteConfig'],
+                         client_ip: Optional[str] = None) -> Dict[str, str]:
         """准备请求头"""
-        headers = dict(request.headers)
+        if client_ip is None:
+            client_ip = self._get_client_ip()
+        return self._header_plan(route_config).request_headers(
+            request.environ, client_ip, request.host, request.scheme
+        )
+    
+    def _forward_request(self, lb: LoadBalancer, backend: Backend, path: str, headers: Dict[str, str],
+                         route_config: Optional[RouteConfig], client_ip: str) -> Tuple[requests.Response, Backend]:
+        """发起代理请求，按路由配置进行故障转移重试和对冲请求
         
-        # 移除hop-by-hop头部
-        hop_by_hop = {
-            'connection', 'keep-alive', 'proxy-authenticate',
-            'proxy-authorization', 'te', 'trailers', 'upgrade'
-        }
-        headers = {k: v for k, v in headers.items() if k.lower() not in hop_by_hop}
-        
-        # 设置代理相关头部
-        headers['X-Forwarded-For'] = self._get_client_ip()
-        headers['X-Forwarded-Host'] = request.host
-        headers['X-Forwarded-Proto'] = request.scheme
-        headers['X-Real-IP'] = self._get_client_ip()
-        
-        # 应用路由头部配置
-        if route_config:
-            # 添加头部
-            if route_config.add_headers:
-                headers.update(route_config.add_headers)
-            
-            # 移除头部
-            if route_config.remove_headers:
-                for header in route_config.remove_headers:
-                    headers.pop(header, None)
+        调用方已经增加了 backend 的活跃连接数。换到其他后端时活跃连接数随之转移，
+        返回时只有实际完成请求的后端保持计数；抛出异常时计数交还给调用方传入的
+        backend，由调用方统一释放。
+        """
+        budget = route_config.retry_budget if route_config else None
+        if budget is None:
+            target_url = self._build_target_url(backend, path, route_config)
+            return self._make_proxy_request(target_url, headers, backend, route_config), backend
         
-        return headers
+        method = request.method
+        stream = route_config.stream
+        headers, data = self._prepare_request_body(headers, route_config)
+        target_path = self._build_target_path(path, route_config)
+        # 流式请求体只能读取一次，无法重放；缓冲到临时文件的请求体每次从头读取，
+        # 可以依次重试，但不能同时发给两个后端
+        replayable = not stream or data is None
+        
+        def send(target: Backend) -> requests.Response:
+            target_url = f"http://{target.address}/{target_path.lstrip('/')}"
+            return self._send_request(method, target_url, headers, data, target, stream)
+        
+        budget.record_request()
+        retries = route_config.retries if replayable and method in IDEMPOTENT_METHODS else 0
+        hedge_delay = (
+            self._hedge_delay(route_config)
+            if replayable and method in SAFE_METHODS and not isinstance(data, _SpooledBody)
+            else None
+        )
+        tried = [backend]
+        original = backend
+        
+        try:
+            while True:
+                start_time = time.time()
+                try:
+                    if hedge_delay is None:
+                        response, served = send(backend), backend
+                    else:
+                        response, served = self._hedged_request(lb, backend, send, hedge_delay, budget, client_ip, tried)
+                except requests.RequestException:
+                    if retries <= 0:
+                        raise
+                    next_backend = self._next_untried_backend(lb, client_ip, tried)
+                    if next_backend is None or not budget.try_acquire():
+                        raise
+                    
+                    retries -= 1
+                    tried.append(next_backend)
+                    self.counters.add('retries')
+                    logger.warning(f"Retrying {method} {request.path} on {next_backend.address}")
+                    
+                    # 活跃连接数转移到新的后端
+                    backend.decrement_active()
+                    next_backend.increment_active()
+                    backend = next_backend
+                    continue
+                
+                if route_config.response_times is not None:
+                    route_config.response_times.add_response_time((time.time() - start_time) * 1000)
+                return response, served
+        except BaseException:
+            # 重试目标也失败了，释放它的活跃连接数并交还给调用方的后端
+            if backend is not original:
+                backend.decrement_active()
+                original.increment_active()
+            raise
+        finally:
+            if isinstance(data, _SpooledBody):
+                data.close()
     
-    def _make_proxy_request(self, target_url: str, headers: Dict[str, str], backend: Backend) -> requests.Response:
+    def _hedge_delay(self, route_config: RouteConfig) -> Optional[float]:
+        """发出对冲请求前的等待时间（秒），样本不足时不发送对冲请求"""
+        if not route_config.hedge:
+            return None
+        if route_config.hedge_delay is not None:
+            return route_config.hedge_delay / 1000
+        
+        tracker = route_config.response_times
+        if tracker.count < HEDGE_MIN_SAMPLES:
+            return None
+        return tracker.get_percentile(0.95) / 1000
+    
+    def _hedged_request(self, lb: LoadBalancer, backend: Backend,
+                        send: Callable[[Backend], requests.Response], delay: float,
+                        budget: RetryBudget, client_ip: str,
+                        tried: List[Backend]) -> Tuple[requests.Response, Backend]:
+        """发送对冲请求
+        
+        在当前线程中向 backend 发送请求，超过 delay 仍未完成时由定时线程把另一份
+        请求提交到线程池，发给另一个后端。首个请求成功时使用它的响应，对冲请求
+        完成后丢弃；首个请求失败时等待对冲请求的结果。
+        """
+        lock = threading.Lock()
+        primary_done = False
+        hedges: List[Tuple[Future, Backend]] = []
+        
+        def launch():
+            if primary_done:
+                return
+            slots = self.hedge_slots
+            if not slots.acquire(blocking=False):
+                return
+            with lock:
+                hedge_backend = None
+                if not primary_done and budget.try_acquire():
+                    hedge_backend = self._next_untried_backend(lb, client_ip, tried)
+                if hedge_backend is None:
+                    slots.release()
+                    return
+                tried.append(hedge_backend)
+                hedge_backend.increment_active()
+                hedge = self.hedge_executor.submit(send, hedge_backend)
+                hedge.add_done_callback(lambda f: slots.release())
+                hedges.append((hedge, hedge_backend))
+            self.counters.add('hedged_requests')
+        
+        timer = self.hedge_timer.call_later(delay, launch)
+        error: Optional[Exception] = None
+        try:
+            response = send(backend)
+        except Exception as e:
+            response, error = None, e
+        finally:
+            self.hedge_timer.cancel(timer)
+            with lock:
+                primary_done = True
+        
+        if not hedges:
+            if error is not None:
+                raise error
+            return response, backend
+        
+        hedge, hedge_backend = hedges[0]
+        if error is None:
+            hedge.add_done_callback(lambda f: self._discard_attempt(f, hedge_backend))
+            return response, backend
+        
+        try:
+            hedge_response = hedge.result()
+        except Exception:
+            # 两个请求都失败，调用方仍持有 backend 的活跃连接数
+            hedge_backend.decrement_active()
+            raise error
+        
+        # 首个请求失败，活跃连接数转移到对冲请求的后端
+        self.counters.add('hedge_wins')
+        backend.decrement_active()
+        return hedge_response, hedge_backend
+    
+    def _discard_attempt(self, future: Future, backend: Backend):
+        """丢弃对冲中落败的请求，释放它占用的连接和活跃连接数"""
+        if future.exception() is None:
+            future.result().close()
+        backend.decrement_active()
+    
+    def _next_untried_backend(self, lb: LoadBalancer, client_ip: str,
+                              tried: List[Backend]) -> Optional[Backend]:
+        """选择一个还没有尝试过的后端"""
+        for _ in range(3):
+            candidate = lb.next_backend(client_ip)
+            if candidate is None:
+                return None
+            if all(candidate is not b for b in tried):
+                return candidate
+        
+        for candidate in lb.get_healthy_backends():
+            if all(candidate is not b for b in tried):
+                return candidate
+        return None
+    
+    def _make_proxy_request(self, target_url: str, headers: Dict[str, str], backend: Backend,
+                            route_config: Optional[RouteConfig] = None) -> requests.Response:
         """发起代理请求"""
+        headers, data = self._prepare_request_body(headers, route_config)
+        stream = bool(route_config and route_config.stream)
+        try:
+            return self._send_request(request.method, target_url, headers, data, backend, stream)
+        finally:
+            if isinstance(data, _SpooledBody):
+                data.close()
+    
+    def _body_limit(self, route_config: Optional[RouteConfig]) -> Optional[int]:
+        """请求体大小上限"""
+        if route_config and route_config.max_body_size is not None:
+            return route_config.max_body_size
+        return self.max_body_size
+    
+    def _prepare_request_body(self, headers: Dict[str, str],
+                              route_config: Optional[RouteConfig]) -> Tuple[Dict[str, str], Any]:
+        """准备请求体
+        
+        流式路由返回逐块读取的请求体；其他路由先完整缓冲，小的请求体留在内存中，
+        大的写入临时文件。分帧头部由requests根据请求体重新设置。
+        """
+        headers = {
+            k: v for k, v in headers.items()
+            if k.lower() not in ('content-length', 'transfer-encoding')
+        }
+        limit = self._body_limit(route_config)
+        if route_config and route_config.stream:
+            return headers, self._request_body_stream(route_config.chunk_size, limit)
+        
+        spool_size = self.body_spool_size
+        if route_config and route_config.body_spool_size is not None:
+            spool_size = route_config.body_spool_size
+        return headers, self._buffer_request_body(limit, spool_size)
+    
+    def _buffer_request_body(self, limit: Optional[int], spool_size: int) -> Any:
+        """读取完整的请求体
+        
+        不超过 spool_size 的请求体以bytes返回；更大的写入临时文件，
+        返回可以多次从头读取的 _SpooledBody，内存占用与请求体大小无关。
+        """
+        stream = request.stream
+        buffer = bytearray()
+        spool = None
+        total = 0
+        try:
+            while True:
+                chunk = stream.read(BODY_CHUNK_SIZE)
+                if not chunk:
+                    break
+                total += len(chunk)
+                if limit is not None and total > limit:
+                    raise RequestBodyTooLarge(limit)
+                
+                if spool is not None:
+                    spool.write(chunk)
+                    continue
+                buffer += chunk
+                if len(buffer) > spool_size:
+                    spool = tempfile.TemporaryFile()
+                    spool.write(buffer)
+                    buffer = bytearray()
+        except BaseException:
+            if spool is not None:
+                spool.close()
+            raise
+        
+        if spool is None:
+            return bytes(buffer)
+        return _SpooledBody(spool, total, BODY_CHUNK_SIZE)
+    
+    def _send_request(self, method: str, target_url: str, headers: Dict[str, str], data: Any,
+                      backend: Backend, stream: bool) -> requests.Response:
+        """向后端发送请求
+        
+        不访问Flask的request对象，可以在对冲线程池和后台线程中调用。
+        """
         try:
             response = self.session.request(
-                method=request.method,
+                method=method,
                 url=target_url,
                 headers=headers,
-                data=request.get_data(),
+                data=data,
                 allow_redirects=False,
-                timeout=self.request_timeout
+                timeout=self.request_timeout,
+                stream=stream
             )
             return response
             
         except requests.RequestException as e:
             logger.error(f"Proxy request failed to {backend.address}: {e}")
-            # 标记后端为不健康
-            if 'connection' in str(e).lower():
+            backend.mark_error()
+            # 无法建立连接时标记后端为不健康（读超时的后端仍然在线）
+            if isinstance(e, requests.ConnectionError):
                 backend.set_healthy(False)
             raise
     
+    def _request_body_stream(self, chunk_size: int, limit: Optional[int] = None):
+        """把客户端请求体包装成可逐块读取的对象"""
+        length = request.content_length
+        if length:
+            # 长度超过上限的请求在选择后端前已经拒绝
+            return _RequestBodyStream(request.stream, length, chunk_size)
+        if 'chunked' in request.headers.get('Transfer-Encoding', '').lower():
+            # 长度未知，requests会以chunked编码发送
+            return _limited_chunks(request.stream, chunk_size, limit)
+        return None
+    
+    def _create_streaming_response(self, proxy_response: requests.Response, route_config: RouteConfig,
+                                   backend: Backend, on_complete: Callable[[bool, Optional[Exception]], None]) -> Response:
+        """创建流式Flask响应，响应体按 chunk_size 逐块转发"""
+        completed = False
+        error: Optional[Exception] = None
+        
+        def generate():
+            nonlocal completed, error
+            try:
+                # 不解压Content-Encoding，保证转发的字节与Content-Length一致
+                for chunk in proxy_response.raw.stream(route_config.chunk_size, decode_content=False):
+                    yield chunk
+                completed = True
+            except Exception as e:
+                error = e
+                raise
+        
+        def close():
+            # WSGI服务器总会在响应结束时调用，即使生成器从未开始迭代
+            proxy_response.close()
+            on_complete(completed, error)
+        
+        flask_response = Response(
+            generate(),
+            status=proxy_response.status_code,
+            headers=self._prepare_response_headers(proxy_response, route_config, backend)
+        )
+        flask_response.call_on_close(close)
+        return flask_response
+    
     def _create_flask_response(self, proxy_response: requests.Response, 
                              route_config: Optional['RouteConfig'], backend: Backend) -> Response:
         """创建Flask响应"""
-        # 准备响应头
-        response_headers = dict(proxy_response.headers)
-        
-        # 移除hop-by-hop头部
-        hop_by_hop = {
-            'connection', 'keep-alive', 'proxy-authenticate',
-            'proxy-authorization', 'te', 'trailers', 'upgrade',
-            'transfer-encoding'
-        }
-        response_headers = {k: v for k, v in response_headers.items() if k.lower() not in hop_by_hop}
-        
-        # 添加负载均衡器信息
-        response_headers['X-Load-Balancer'] = 'FlaskLB/1.0'
-        response_headers['X-Backend-Server'] = backend.address
-        
-        # 应用CORS配置
-        if route_config and route_config.enable_cors:
-            response_headers.update({
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, Authorization'
-            })
-        
         # 创建Flask响应
         flask_response = Response(
             proxy_response.content,
             status=proxy_response.status_code,
-            headers=response_headers
+            headers=self._prepare_response_headers(proxy_response, route_config, backend)
         )
         
         return flask_response
     
+    def _prepare_response_headers(self, proxy_response: requests.Response,
+                                  route_config: Optional[RouteConfig], backend: Backend) -> Dict[str, str]:
+        """准备响应头"""
+        return self._header_plan(route_config).response_headers(proxy_response.headers.items(), backend.address)
+    
     def get_stats(self) -> Dict[str, Any]:
         """获取统计信息"""
-        with self.stats_lock:
-            avg_response_time = (
-                self.total_response_time / self.successful_requests 
-                if self.successful_requests > 0 else 0
-            )
-            
-            return {
-                'load_balancer': self.load_balancer.__class__.__name__,
-                'total_requests': self.total_requests,
-                'successful_requests': self.successful_requests,
-                'failed_requests': self.failed_requests,
-                'success_rate': (
-                    self.successful_requests / self.total_requests 
-                    if self.total_requests > 0 else 0
-                ),
-                'average_response_time': avg_response_time,
-                'circuit_breaker': self.circuit_breaker.get_stats(),
-                'rate_limiter': self.rate_limiter.get_stats(),
-                'backends': self.load_balancer.get_stats()
-            }
+        stats = self.counters.snapshot()
+        if self.worker_context:
+            stats = self.worker_context.aggregate(stats)
+        total_requests = stats['total_requests']
+        successful_requests = stats['successful_requests']
+        avg_response_time = (
+            stats['total_response_time'] / successful_requests 
+            if successful_requests > 0 else 0
+        )
+        
+        return {
+            'load_balancer': self.load_balancer.__class__.__name__,
+            'total_requests': total_requests,
+            'successful_requests': successful_requests,
+            'failed_requests': stats['failed_requests'],
+            'success_rate': (
+                successful_requests / total_requests 
+                if total_requests > 0 else 0
+            ),
+            'average_response_time': avg_response_time,
+            'retries': stats['retries'],
+            'hedged_requests': stats['hedged_requests'],
+            'hedge_wins': stats['hedge_wins'],
+            'retry_budgets': {
+                path: config.retry_budget.get_stats()
+                for path, config in list(self.routes.items())
+                if config.retry_budget is not None
+            },
+            'circuit_breaker': self.circuit_breaker.get_stats(),
+            'rate_limiter': self.rate_limiter.get_stats(),
+            'cache': self.response_cache.get_stats(),
+            'backends': self.load_balancer.get_stats(),
+            'worker': self.worker_context.get_stats() if self.worker_context else None
+        }
 
-class RouteConfig:
-    """路由配置"""
-    
-    def __init__(self,
-                 service_name: str,
-                 load_balancer: Optional[LoadBalancer] = None,
-                 rewrite_path: Optional[str] = None,
-                 add_headers: Optional[Dict[str, str]] = None,
-                 remove_headers: Optional[List[str]] = None,
-                 enable_cors: bool = False,
-                 enable_session_affinity: bool = False):
-        self.service_name = service_name
-        self.load_balancer = load_balancer
-        self.rewrite_path = rewrite_path
-        self.add_headers = add_headers or {}
-        self.remove_headers = remove_headers or []
-        self.enable_cors = enable_cors
-        self.enable_session_affinity = enable_session_affinity
-        self.path: Optional[str] = None  # 由add_route方法设置
\ No newline at end of file
+class _RequestBodyStream:
+    """长度已知的流式请求体
+    
+    实现 __len__ 让requests设置Content-Length，迭代时从输入流逐块读取。
+    """
+    
+    def __init__(self, stream, length: int, chunk_size: int):
+        self.stream = stream
+        self.length = length
+        self.chunk_size = chunk_size
+    
+    def __len__(self) -> int:
+        return self.length
+    
+    def __iter__(self):
+        remaining = self.length
+        while remaining > 0:
+            chunk = self.stream.read(min(self.chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+def _limited_chunks(stream, chunk_size: int, limit: Optional[int]):
+    """逐块读取长度未知的请求体，累计超过 limit 时抛出 RequestBodyTooLarge"""
+    total = 0
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            return
+        total += len(chunk)
+        if limit is not None and total > limit:
+            raise RequestBodyTooLarge(limit)
+        yield chunk
+
+class _SpooledBody:
+    """写入临时文件的请求体
+    
+    实现 __len__ 让requests设置Content-Length，每次迭代都从文件开头逐块读取，
+    因此失败后可以换一个后端重新发送。
+    """
+    
+    def __init__(self, file, length: int, chunk_size: int):
+        self.file = file
+        self.length = length
+        self.chunk_size = chunk_size
+    
+    def __len__(self) -> int:
+        return self.length
+    
+    def __iter__(self):
+        self.file.seek(0)
+        while True:
+            chunk = self.file.read(self.chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    
+    def close(self):
+        self.file.close()
\ No newline at end of file
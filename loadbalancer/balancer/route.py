@@ -0,0 +1,404 @@
+from typing import Dict, List, Optional, Tuple, Iterable, Any
+import threading
+from algorithms.base import LoadBalancer
+from algorithms.latency import ResponseTimeTracker
+from middleware.retry import RetryBudget
+
+# 请求方向的逐跳头部
+REQUEST_HOP_BY_HOP = frozenset((
+    'connection', 'keep-alive', 'proxy-authenticate',
+    'proxy-authorization', 'te', 'trailers', 'upgrade',
+    'proxy-connection'
+))
+
+# 响应方向的逐跳头部（响应体由WSGI服务器重新分帧）
+RESPONSE_HOP_BY_HOP = REQUEST_HOP_BY_HOP | {'transfer-encoding'}
+
+# 代理为每个请求设置的头部，数字是取值在 (客户端IP, Host, scheme) 中的下标
+FORWARDED_HEADERS = (
+    ('X-Forwarded-For', 0),
+    ('X-Forwarded-Host', 1),
+    ('X-Forwarded-Proto', 2),
+    ('X-Real-IP', 0)
+)
+
+# WSGI environ中不带 HTTP_ 前缀的请求头
+ENVIRON_CONTENT_KEYS = frozenset(('CONTENT_TYPE', 'CONTENT_LENGTH'))
+
+# 每个 HeaderPlan 缓存的 environ键 -> 头部名称 的最大数量，防止任意头部名称撑大缓存
+MAX_ENVIRON_NAMES = 1024
+
+_UNKNOWN = object()
+
+CORS_HEADERS = (
+    ('Access-Control-Allow-Origin', '*'),
+    ('Access-Control-Allow-Methods', 'GET, POST, PUT, DELETE, OPTIONS'),
+    ('Access-Control-Allow-Headers', 'Content-Type, Authorization')
+)
+
+class RouteConfig:
+    """路由配置"""
+    
+    def __init__(self,
+                 service_name: str,
+                 load_balancer: Optional[LoadBalancer] = None,
+                 rewrite_path: Optional[str] = None,
+                 add_headers: Optional[Dict[str, str]] = None,
+                 remove_headers: Optional[List[str]] = None,
+                 enable_cors: bool = False,
+                 enable_session_affinity: bool = False,
+                 stream: bool = False,
+                 chunk_size: int = 64 * 1024,
+                 cache: bool = False,
+                 cache_ttl: float = 0,
+                 retries: int = 0,
+                 retry_budget: float = 0.2,
+                 hedge: bool = False,
+                 hedge_delay: Optional[float] = None,
+                 max_body_size: Optional[int] = None,
+                 body_spool_size: Optional[int] = None):
+        """
+        Args:
+            stream: 是否流式转发请求体和响应体，适合大文件上传下载
+            chunk_size: 流式转发时每块的大小
+            cache: 是否对GET请求使用共享响应缓存（流式路由不缓存）
+            cache_ttl: 后端响应没有给出Cache-Control/Expires时的默认缓存时间（秒），为0时不缓存这类响应
+            retries: 幂等请求失败后换其他后端重试的最大次数
+            retry_budget: 重试和对冲请求占该路由请求数的最大比例
+            hedge: 是否对安全方法发送对冲请求
+            hedge_delay: 发出对冲请求前的等待时间（毫秒），为None时使用该路由响应时间的p95
+            max_body_size: 请求体的最大字节数，超过时返回413，为None时使用代理的全局设置
+            body_spool_size: 请求体在内存中缓冲的最大字节数，超过后写入临时文件，为None时使用代理的全局设置
+        """
+        self.service_name = service_name
+        self.load_balancer = load_balancer
+        self.rewrite_path = rewrite_path
+        self.add_headers = add_headers or {}
+        self.remove_headers = remove_headers or []
+        self.enable_cors = enable_cors
+        self.enable_session_affinity = enable_session_affinity
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.cache = cache
+        self.cache_ttl = cache_ttl
+        self.retries = retries
+        self.hedge = hedge
+        self.hedge_delay = hedge_delay
+        self.max_body_size = max_body_size
+        self.body_spool_size = body_spool_size
+        self.retry_budget: Optional[RetryBudget] = (
+            RetryBudget(ratio=retry_budget) if retries > 0 or hedge else None
+        )
+        self.response_times: Optional[ResponseTimeTracker] = ResponseTimeTracker() if hedge else None
+        self.path: Optional[str] = None  # 由add_route方法设置
+        self.header_plan: Optional['HeaderPlan'] = None  # 由add_route方法编译
+
+class HeaderPlan:
+    """预编译的头部改写计划
+    
+    把路由的 add_headers/remove_headers/enable_cors 和逐跳头部合并成
+    不可变的集合与元组，请求和响应头部各只需遍历一遍、构建一个字典。
+    路由添加后再修改这些配置需要重新调用 add_route。
+    """
+    
+    __slots__ = ('request_drop', 'forwarded', 'request_extra', 'response_drop', 'response_extra',
+                 '_environ_names')
+    
+    def __init__(self, route_config: Optional[RouteConfig] = None):
+        add_headers: Dict[str, str] = {}
+        removed = frozenset()
+        enable_cors = False
+        if route_config is not None:
+            add_headers = route_config.add_headers or {}
+            removed = frozenset(h.lower() for h in route_config.remove_headers or ())
+            enable_cors = route_config.enable_cors
+        
+        # 客户端发来的头部中：逐跳头部、要移除的头部、会被代理覆盖的头部都直接跳过
+        overridden = {h.lower() for h, _ in FORWARDED_HEADERS} | {h.lower() for h in add_headers}
+        self.request_drop = REQUEST_HOP_BY_HOP | removed | overridden
+        # 代理设置的头部按顺序写入，被 remove_headers 移除的不写
+        self.forwarded = tuple((h, i) for h, i in FORWARDED_HEADERS if h.lower() not in removed)
+        self.request_extra = tuple(
+            (name, value) for name, value in add_headers.items() if name.lower() not in removed
+        )
+        
+        response_extra = [('X-Load-Balancer', 'FlaskLB/1.0')]
+        if enable_cors:
+            response_extra.extend(CORS_HEADERS)
+        self.response_extra = tuple(response_extra)
+        self.response_drop = RESPONSE_HOP_BY_HOP | {name.lower() for name, _ in self.response_extra} | {'x-backend-server'}
+        
+        # environ键 -> 头部名称，需要跳过的键映射为None
+        self._environ_names: Dict[str, Optional[str]] = {}
+    
+    def _compile_environ_key(self, key: str) -> Optional[str]:
+        """把environ键转换为头部名称（与werkzeug的EnvironHeaders一致）并缓存"""
+        if key.startswith('HTTP_') and key not in ('HTTP_CONTENT_TYPE', 'HTTP_CONTENT_LENGTH'):
+            name = key[5:].replace('_', '-').title()
+        elif key in ENVIRON_CONTENT_KEYS:
+            name = key.replace('_', '-').title()
+        else:
+            name = None
+        
+        if name is not None and name.lower() in self.request_drop:
+            name = None
+        if len(self._environ_names) < MAX_ENVIRON_NAMES:
+            self._environ_names[key] = name
+        return name
+    
+    def request_headers(self, environ: Dict[str, Any], client_ip: str,
+                        host: str, scheme: str) -> Dict[str, str]:
+        """直接从WSGI environ生成转发给后端的请求头
+        
+        头部名称的转换结果按environ键缓存，每个请求只遍历一遍environ，
+        不再经过 EnvironHeaders 为每个头部重新拼接名称。
+        """
+        names = self._environ_names
+        headers = {}
+        for key, value in environ.items():
+            name = names.get(key, _UNKNOWN)
+            if name is _UNKNOWN:
+                name = self._compile_environ_key(key)
+            # werkzeug会跳过空的Content-Type/Content-Length
+            if name is not None and (value or key not in ENVIRON_CONTENT_KEYS):
+                headers[name] = value
+        
+        values = (client_ip, host, scheme)
+        for name, index in self.forwarded:
+            headers[name] = values[index]
+        headers.update(self.request_extra)
+        return headers
+    
+    def response_headers(self, items: Iterable[Tuple[str, str]], backend_address: str) -> Dict[str, str]:
+        """生成返回给客户端的响应头"""
+        drop = self.response_drop
+        headers = {k: v for k, v in items if k.lower() not in drop}
+        headers.update(self.response_extra)
+        headers['X-Backend-Server'] = backend_address
+        return headers
+    
+    def request_items(self, items: Iterable[Tuple[str, str]], client_ip: str, host: str, scheme: str,
+                      extra_drop: frozenset = frozenset()) -> List[Tuple[str, str]]:
+        """按同样的规则改写保持顺序、允许重复的请求头列表（异步代理使用）
+        
+        extra_drop 为本条消息额外要跳过的头部（小写），如 Connection 中列出的头部。
+        """
+        drop = self.request_drop | extra_drop
+        result = [(k, v) for k, v in items if k.lower() not in drop]
+        values = (client_ip, host, scheme)
+        result.extend((name, values[index]) for name, index in self.forwarded)
+        result.extend(self.request_extra)
+        return result
+    
+    def response_items(self, items: Iterable[Tuple[str, str]], backend_address: str,
+                       extra_drop: frozenset = frozenset()) -> List[Tuple[str, str]]:
+        """生成返回给客户端的响应头列表，保留 Set-Cookie 等重复头部（异步代理使用）"""
+        drop = self.response_drop | extra_drop
+        result = [(k, v) for k, v in items if k.lower() not in drop]
+        result.extend(self.response_extra)
+        result.append(('X-Backend-Server', backend_address))
+        return result
+
+class _RadixNode:
+    """基数树节点"""
+    
+    __slots__ = ('edges', 'key')
+    
+    def __init__(self):
+        self.edges: Dict[str, Tuple[str, '_RadixNode']] = {}  # 边标签首字符 -> (边标签, 子节点)
+        self.key: Optional[str] = None  # 到此节点为止的字符串正好是某条路由时，记录该路由路径
+
+class RadixTree:
+    """按字符压缩的基数树，用于最长前缀匹配
+    
+    查找只沿请求路径走一遍，时间复杂度为O(路径长度)，与路由数量无关。
+    按字符而不是按路径段建树，与 str.startswith 的前缀语义完全一致
+    （例如路由 /api 也匹配 /apix）。
+    """
+    
+    def __init__(self):
+        self.root = _RadixNode()
+    
+    def insert(self, key: str):
+        """插入一个路由路径"""
+        node = self.root
+        i = 0
+        while i < len(key):
+            edge = node.edges.get(key[i])
+            if edge is None:
+                child = _RadixNode()
+                child.key = key
+                node.edges[key[i]] = (key[i:], child)
+                return
+            
+            label, child = edge
+            # 计算公共前缀长度
+            common = 0
+            limit = min(len(label), len(key) - i)
+            while common < limit and label[common] == key[i + common]:
+                common += 1
+            
+            if common < len(label):
+                # 拆分边：label[:common] -> 中间节点 -> label[common:]
+                middle = _RadixNode()
+                middle.edges[label[common]] = (label[common:], child)
+                node.edges[key[i]] = (label[:common], middle)
+                child = middle
+            
+            node = child
+            i += common
+        
+        node.key = key
+    
+    def longest_prefix(self, path: str) -> Optional[str]:
+        """返回作为 path 前缀的最长非空路由路径"""
+        node = self.root
+        best = None
+        i = 0
+        length = len(path)
+        while i < length:
+            edge = node.edges.get(path[i])
+            if edge is None:
+                break
+            label, child = edge
+            if not path.startswith(label, i):
+                break
+            i += len(label)
+            node = child
+            if node.key is not None:
+                best = node.key
+        return best
+
+class _RouteDict(dict):
+    """路由字典，每次修改都会增加版本号，路由表据此判断是否需要重新编译"""
+    
+    def __init__(self):
+        super().__init__()
+        self.version = 0
+    
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.version += 1
+    
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self.version += 1
+    
+    def pop(self, *args):
+        value = super().pop(*args)
+        self.version += 1
+        return value
+    
+    def popitem(self):
+        item = super().popitem()
+        self.version += 1
+        return item
+    
+    def setdefault(self, key, default=None):
+        value = super().setdefault(key, default)
+        self.version += 1
+        return value
+    
+    def update(self, *args, **kwargs):
+        super().update(*args, **kwargs)
+        self.version += 1
+    
+    def clear(self):
+        super().clear()
+        self.version += 1
+
+class RouteTable:
+    """路由表
+    
+    按 精确匹配 -> 最长前缀匹配 -> 默认路由 的顺序选择路由，
+    供Flask代理和asyncio代理共用。路由在添加时编译进基数树，
+    另有一个 路径 -> 路由 的缓存用于热点路径。
+    
+    请求路径上的查找不加锁：基数树和路径缓存作为一个元组整体替换，
+    缓存是普通字典，超过大小时按插入顺序近似淘汰最早的路径。
+    """
+    
+    def __init__(self, cache_size: int = 1024):
+        """
+        Args:
+            cache_size: 路径缓存的大小，为0时不缓存
+        """
+        self.routes: Dict[str, RouteConfig] = _RouteDict()
+        self.default_route: Optional[RouteConfig] = None
+        self.cache_size = cache_size
+        # (基数树, 路径 -> 匹配的路由路径)
+        self._index: Tuple[RadixTree, Dict[str, Optional[str]]] = (RadixTree(), {})
+        self._compiled_version = 0
+        self._lock = threading.Lock()
+    
+    def add(self, path: str, config: RouteConfig):
+        """添加路由规则"""
+        config.path = path
+        config.header_plan = HeaderPlan(config)
+        with self._lock:
+            self.routes[path] = config
+            self._compile()
+    
+    def set_default(self, config: Optional[RouteConfig]):
+        """设置默认路由"""
+        if config is not None:
+            config.header_plan = HeaderPlan(config)
+        self.default_route = config
+    
+    def _compile(self):
+        """重建基数树并换用新的路径缓存（调用方需持有 self._lock）"""
+        version = self.routes.version
+        tree = RadixTree()
+        for route_path in list(self.routes):
+            tree.insert(route_path)
+        self._index = (tree, {})
+        self._compiled_version = version
+    
+    def _lookup(self, path: str) -> Optional[str]:
+        """查找匹配的路由路径"""
+        tree, cache = self._index
+        if self.cache_size <= 0:
+            return tree.longest_prefix(path)
+        
+        key = cache.get(path, _UNKNOWN)
+        if key is not _UNKNOWN:
+            return key
+        
+        key = tree.longest_prefix(path)
+        if len(cache) >= self.cache_size:
+            # 近似淘汰：删除最早插入的路径，并发修改时放弃这次淘汰
+            try:
+                del cache[next(iter(cache))]
+            except (RuntimeError, StopIteration, KeyError):
+                pass
+        cache[path] = key
+        return key
+    
+    def match(self, path: str) -> Optional[RouteConfig]:
+        """查找请求路径对应的路由，没有匹配时返回默认路由"""
+        # 直接修改了 routes 字典（包括替换已有路径的路由）时重新编译
+        if self._compiled_version != self.routes.version:
+            with self._lock:
+                if self._compiled_version != self.routes.version:
+                    self._compile()
+        
+        # 精确匹配
+        route = self.routes.get(path)
+        if route is not None:
+            return route
+        
+        # 最长前缀匹配
+        key = self._lookup(path)
+        if key is not None:
+            route = self.routes.get(key)
+            if route is not None:
+                return route
+        
+        return self.default_route
+    
+    def select(self, path: str, default_lb: LoadBalancer) -> Tuple[Optional[RouteConfig], LoadBalancer]:
+        """选择路由和负载均衡器，路由未指定负载均衡器时使用 default_lb"""
+        route = self.match(path)
+        if route is None:
+            return None, default_lb
+        return route, route.load_balancer or default_lb
\ No newline at end of file
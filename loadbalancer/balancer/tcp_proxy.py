@@ -1,13 +1,28 @@
+import os
+import time
+import errno
 import socket
 import threading
 import select
 import logging
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Tuple
 from algorithms.base import LoadBalancer, Backend
+from algorithms.counters import StripedCounter
 from discovery import ServiceRegistry
+from balancer.workers import WorkerContext
+from balancer.timer_wheel import TimerWheel
+from balancer.upstream_pool import UpstreamPool, connect_backend
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
 
 logger = logging.getLogger(__name__)
 
+# Linux + Python 3.10+ 可以用 os.splice 经管道在内核中转发数据，不经过Python内存
+SPLICE_AVAILABLE = hasattr(os, 'splice')
+
 class TCPProxy:
     """TCP代理负载均衡器"""
     
@@ -30,17 +45,27 @@ class TCPProxy:
         self.connections: Dict[str, 'TCPConnection'] = {}
         self.connections_lock = threading.Lock()
         
+        # 空闲超时：连接按截止时间放入时间轮，清理线程每个tick只处理到期的槽位
+        self.idle_wheel = TimerWheel(tick=1.0)
+        self.stop_event = threading.Event()
+        
         # 配置选项
         self.idle_timeout = 30 * 60  # 30分钟
         self.max_connections = 1000
         self.buffer_size = 32 * 1024  # 32KB
+        self.connect_timeout = 3.0  # 连接单个后端的超时时间（秒）
+        self.connect_attempts = 3  # 连接失败时最多尝试的后端数
+        
+        # 可选的后端连接预热池
+        self.upstream_pool: Optional[UpstreamPool] = None
         
-        # 统计信息
-        self.total_connections = 0
-        self.active_connections = 0
-        self.total_bytes_received = 0
-        self.total_bytes_sent = 0
-        self.stats_lock = threading.Lock()
+        # 统计信息（按线程分片累加，读取时合并）
+        self.counters = StripedCounter((
+            'total_connections', 'active_connections', 'total_bytes_received', 'total_bytes_sent'
+        ))
+        
+        # 多进程worker模式下的上下文（见 balancer.workers）
+        self.worker_context: Optional[WorkerContext] = None
     
     def set_registry(self, registry: ServiceRegistry, service_name: str):
         """设置服务注册表"""
@@ -48,8 +73,10 @@ class TCPProxy:
         self.service_name = service_name
     
     def set_idle_timeout(self, timeout: int):
-        """设置空闲超时时间（秒）"""
+        """设置空闲超时时间（秒），已有连接按新的超时时间重新调度"""
         self.idle_timeout = timeout
+        for conn in self.idle_wheel.items():
+            self.idle_wheel.schedule(conn, conn.last_active + timeout)
     
     def set_max_connections(self, max_conn: int):
         """设置最大连接数"""
@@ -59,6 +86,22 @@ class TCPProxy:
         """设置缓冲区大小"""
         self.buffer_size = size
     
+    def set_connect_timeout(self, timeout: float, attempts: int = 3):
+        """设置连接后端的超时时间，以及失败时最多尝试几个后端"""
+        self.connect_timeout = timeout
+        self.connect_attempts = attempts
+    
+    def set_upstream_pool(self, pool: Optional[UpstreamPool]):
+        """设置后端连接预热池，随代理启动和停止；只应用于客户端先发送数据的协议"""
+        self.upstream_pool = pool
+        if pool and self.is_running:
+            pool.start()
+    
+    def set_worker_context(self, context: WorkerContext):
+        """在worker进程中运行：用SO_REUSEPORT监听，后端状态从父进程同步，统计信息汇总所有worker"""
+        self.worker_context = context
+        context.attach(self.load_balancer, self.counters)
+    
     def start(self):
         """启动TCP代理"""
         if self.is_running:
@@ -66,12 +109,19 @@ class TCPProxy:
         
         try:
             # 创建服务器socket
-            self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            self.server_socket.bind((self.listen_host, self.listen_port))
-            self.server_socket.listen(128)
+            if self.worker_context:
+                self.server_socket = self.worker_context.listen(self.listen_host, self.listen_port, 128)
+            else:
+                self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                self.server_socket.bind((self.listen_host, self.listen_port))
+                self.server_socket.listen(128)
             
             self.is_running = True
+            self.stop_event.clear()
+            
+            if self.upstream_pool:
+                self.upstream_pool.start()
             
             # 启动接受连接的线程
             self.accept_thread = threading.Thread(target=self._accept_connections, daemon=True)
@@ -96,6 +146,10 @@ class TCPProxy:
             return
         
         self.is_running = False
+        self.stop_event.set()
+        
+        if self.upstream_pool:
+            self.upstream_pool.stop()
         
         # 关闭服务器socket
         if self.server_socket:
@@ -143,19 +197,13 @@ class TCPProxy:
             # 获取客户端IP
             client_ip = client_addr[0]
             
-            # 选择后端服务
-            backend = self.load_balancer.next_backend(client_ip)
+            # 选择并连接后端服务
+            backend, backend_socket = self._connect_backend(client_ip)
             if not backend:
                 logger.warning(f"No healthy backend available for {conn_id}")
                 client_socket.close()
                 return
             
-            # 连接到后端服务
-            backend_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            backend_socket.settimeout(10)  # 连接超时
-            backend_socket.connect((backend.host, backend.port))
-            backend_socket.settimeout(None)  # 清除超时
-            
             # 增加后端活跃连接数
             backend.increment_active()
             
@@ -166,11 +214,10 @@ class TCPProxy:
             
             with self.connections_lock:
                 self.connections[conn_id] = connection
+            self.idle_wheel.schedule(connection, connection.last_active + self.idle_timeout)
             
             # 更新统计信息
-            with self.stats_lock:
-                self.total_connections += 1
-                self.active_connections += 1
+            self.counters.add_many({'total_connections': 1, 'active_connections': 1})
             
             logger.info(f"New connection {conn_id} proxied to {backend.address}")
             
@@ -187,61 +234,99 @@ class TCPProxy:
                 if conn_id in self.connections:
                     del self.connections[conn_id]
             
-            with self.stats_lock:
-                self.active_connections -= 1
-                if hasattr(connection, 'bytes_received'):
-                    self.total_bytes_received += connection.bytes_received
-                if hasattr(connection, 'bytes_sent'):
-                    self.total_bytes_sent += connection.bytes_sent
+            if 'connection' in locals():
+                self.idle_wheel.cancel(connection)
+                self.counters.add_many({
+                    'active_connections': -1,
+                    'total_bytes_received': connection.bytes_received,
+                    'total_bytes_sent': connection.bytes_sent
+                })
+                
+                # 减少后端活跃连接数
+                connection.backend.decrement_active()
+    
+    def _next_untried_backend(self, client_ip: str, tried: List[Backend]) -> Optional[Backend]:
+        """选择一个还没有尝试过的后端"""
+        for _ in range(3):
+            candidate = self.load_balancer.next_backend(client_ip)
+            if candidate is None:
+                return None
+            if all(candidate is not b for b in tried):
+                return candidate
+        
+        for candidate in self.load_balancer.get_healthy_backends():
+            if all(candidate is not b for b in tried):
+                return candidate
+        return None
+    
+    def _connect_backend(self, client_ip: str) -> Tuple[Optional[Backend], Optional[socket.socket]]:
+        """连接后端：优先使用预热池中的连接，连接失败或超时换下一个后端"""
+        tried: List[Backend] = []
+        for _ in range(self.connect_attempts):
+            backend = self._next_untried_backend(client_ip, tried)
+            if backend is None:
+                break
+            tried.append(backend)
+            
+            if self.upstream_pool:
+                backend_socket = self.upstream_pool.acquire(backend)
+                if backend_socket:
+                    return backend, backend_socket
             
-            # 减少后端活跃连接数
-            if 'backend' in locals():
-                backend.decrement_active()
+            try:
+                return backend, connect_backend(backend, self.connect_timeout)
+            except OSError as e:
+                logger.error(f"Error connecting to {backend.address}: {e}")
+                backend.mark_error()
+        
+        return None, None
     
     def _cleanup_connections(self):
-        """定期清理超时连接"""
-        while self.is_running:
+        """每个tick推进时间轮，关闭空闲超时的连接"""
+        while not self.stop_event.wait(self.idle_wheel.tick):
             try:
-                current_time = threading.current_thread().ident  # 简化的时间戳
-                timeout_connections = []
-                
-                with self.connections_lock:
-                    for conn_id, conn in self.connections.items():
-                        if conn.is_idle_timeout(self.idle_timeout):
-                            timeout_connections.append(conn_id)
-                
-                # 关闭超时连接
-                for conn_id in timeout_connections:
-                    with self.connections_lock:
-                        if conn_id in self.connections:
-                            conn = self.connections[conn_id]
-                            conn.close()
-                            logger.info(f"Closed idle connection: {conn_id}")
-                
-                # 等待一分钟再检查
-                threading.Event().wait(60)
+                now = time.monotonic()
+                for conn in self.idle_wheel.advance(now):
+                    if conn.is_closed:
+                        continue
+                    
+                    # 到期时才检查活跃时间，期间有过数据的连接按新的截止时间重新调度
+                    deadline = conn.last_active + self.idle_timeout
+                    if deadline <= now:
+                        conn.close()
+                        logger.info(f"Closed idle connection: {conn.conn_id}")
+                    else:
+                        self.idle_wheel.schedule(conn, deadline)
                 
             except Exception as e:
                 logger.error(f"Error in connection cleanup: {e}")
     
     def get_stats(self) -> Dict[str, Any]:
         """获取统计信息"""
-        with self.stats_lock:
-            return {
-                'listen_address': f"{self.listen_host}:{self.listen_port}",
-                'is_running': self.is_running,
-                'total_connections': self.total_connections,
-                'active_connections': self.active_connections,
-                'total_bytes_received': self.total_bytes_received,
-                'total_bytes_sent': self.total_bytes_sent,
-                'max_connections': self.max_connections,
-                'idle_timeout': self.idle_timeout,
-                'buffer_size': self.buffer_size
-            }
+        stats = self.counters.snapshot()
+        if self.worker_context:
+            stats = self.worker_context.aggregate(stats)
+        return {
+            'listen_address': f"{self.listen_host}:{self.listen_port}",
+            'is_running': self.is_running,
+            'total_connections': stats['total_connections'],
+            'active_connections': stats['active_connections'],
+            'total_bytes_received': stats['total_bytes_received'],
+            'total_bytes_sent': stats['total_bytes_sent'],
+            'max_connections': self.max_connections,
+            'idle_timeout': self.idle_timeout,
+            'buffer_size': self.buffer_size,
+            'connect_timeout': self.connect_timeout,
+            'upstream_pool': self.upstream_pool.get_stats() if self.upstream_pool else None,
+            'worker': self.worker_context.get_stats() if self.worker_context else None
+        }
 
 class TCPConnection:
     """TCP连接封装"""
     
+    # 是否使用 os.splice 转发数据，不可用时退回到 recv_into 循环
+    use_splice = SPLICE_AVAILABLE
+    
     def __init__(self, conn_id: str, client_socket: socket.socket, 
                  backend_socket: socket.socket, backend: Backend, buffer_size: int):
         self.conn_id = conn_id
@@ -250,8 +335,8 @@ class TCPConnection:
         self.backend = backend
         self.buffer_size = buffer_size
         
-        self.start_time = threading.current_thread().ident  # 简化的时间戳
-        self.last_active = self.start_time
+        self.start_time = time.monotonic()
+        self.last_active = self.start_time  # 最近一次收发数据的时间（time.monotonic）
         self.bytes_received = 0
         self.bytes_sent = 0
         self.is_closed = False
@@ -287,32 +372,88 @@ class TCPConnection:
     def _proxy_data(self, source: socket.socket, destination: socket.socket, direction: str):
         """代理数据传输"""
         try:
-            while not self.is_closed:
-                # 使用select检查socket是否有数据可读
-                ready, _, _ = select.select([source], [], [], 1.0)
-                if not ready:
-                    continue
+            if self.use_splice and self._splice_data(source, destination, direction):
+                return
+            self._copy_data(source, destination, direction)
+        except Exception as e:
+            logger.error(f"Error proxying data {direction} for {self.conn_id}: {e}")
+    
+    def _wait_readable(self, source: socket.socket) -> bool:
+        """等待来源socket可读，连接关闭时返回False"""
+        while not self.is_closed:
+            # 使用select检查socket是否有数据可读
+            ready, _, _ = select.select([source], [], [], 1.0)
+            if ready:
+                return True
+        return False
+    
+    def _count(self, direction: str, size: int):
+        """更新统计信息"""
+        if direction == "client->backend":
+            self.bytes_received += size
+        else:
+            self.bytes_sent += size
+        self.last_active = time.monotonic()
+    
+    def _copy_data(self, source: socket.socket, destination: socket.socket, direction: str):
+        """经由每个方向预分配的缓冲区转发数据"""
+        buffer = bytearray(self.buffer_size)
+        view = memoryview(buffer)
+        while self._wait_readable(source):
+            try:
+                size = source.recv_into(buffer)
+                if not size:
+                    break
+                
+                destination.sendall(view[:size])
+                self._count(direction, size)
+                
+            except socket.error:
+                break
+    
+    def _splice_data(self, source: socket.socket, destination: socket.socket, direction: str) -> bool:
+        """用 os.splice 经管道转发数据
+        
+        Returns:
+            bool: 内核不支持对这对socket做splice时返回False，由调用方改用 _copy_data
+        """
+        pipe_read, pipe_write = os.pipe()
+        try:
+            if fcntl is not None and hasattr(fcntl, 'F_SETPIPE_SZ'):
+                try:
+                    fcntl.fcntl(pipe_write, fcntl.F_SETPIPE_SZ, self.buffer_size)
+                except OSError:
+                    pass
+            
+            # 每次都从socket对象取fd：另一个方向关闭连接后fileno()为-1，
+            # 缓存的fd编号可能已被新连接复用
+            spliced = False
+            while self._wait_readable(source):
+                try:
+                    size = os.splice(source.fileno(), pipe_write, self.buffer_size, flags=os.SPLICE_F_MOVE)
+                except OSError as e:
+                    if not spliced and e.errno in (errno.EINVAL, errno.ENOSYS):
+                        return False
+                    break
+                if not size:
+                    break
+                spliced = True
                 
+                # 管道中的数据必须全部写到目标socket
+                pending = size
                 try:
-                    data = source.recv(self.buffer_size)
-                    if not data:
-                        break
-                    
-                    destination.sendall(data)
-                    
-                    # 更新统计信息
-                    if direction == "client->backend":
-                        self.bytes_received += len(data)
-                    else:
-                        self.bytes_sent += len(data)
-                    
-                    self.last_active = threading.current_thread().ident
-                    
-                except socket.error:
+                    while pending:
+                        pending -= os.splice(pipe_read, destination.fileno(), pending, flags=os.SPLICE_F_MOVE)
+                except OSError:
+                    self._count(direction, size - pending)
                     break
-                    
-        except Exception as e:
-            logger.error(f"Error proxying data {direction} for {self.conn_id}: {e}")
+                
+                self._count(direction, size)
+            return True
+        
+        finally:
+            os.close(pipe_read)
+            os.close(pipe_write)
     
     def close(self):
         """关闭连接"""
@@ -335,5 +476,4 @@ class TCPConnection:
     
     def is_idle_timeout(self, timeout: int) -> bool:
         """检查是否空闲超时"""
-        # 简化的超时检查
-        return False  # 在实际实现中应该检查时间差
\ No newline at end of file
+        return time.monotonic() - self.last_active > timeout
\ No newline at end of file
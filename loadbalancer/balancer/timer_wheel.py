@@ -0,0 +1,89 @@
+"""
+哈希时间轮
+按到期时间把对象放进环形槽位，每个tick只处理当前槽位，调度、取消和到期都是O(1)。
+用于TCP代理的空闲超时和连接超时。
+"""
+
+import math
+import time
+import threading
+from typing import Any, Dict, List, Hashable
+
+class TimerWheel:
+    """哈希时间轮
+    
+    到期时间换算成tick编号 n，对象放进第 n % slots 个槽位；超过一圈的对象
+    留在槽位里，直到时间轮转到对应的那一圈。advance 只访问经过的槽位，
+    与对象总数无关。
+    
+    用于空闲超时时不需要在每次有数据时移动对象：连接只更新自己的活跃时间戳，
+    到期时再检查一次，尚未空闲够的连接按新的截止时间重新调度（惰性重调度），
+    每个连接每个超时周期最多被访问一次。
+    """
+    
+    def __init__(self, tick: float = 1.0, slots: int = 1024):
+        """
+        Args:
+            tick: 每个槽位代表的时间（秒），即超时的精度
+            slots: 槽位数
+        """
+        self.tick = tick
+        self.slots = slots
+        self._wheel: List[Dict[Hashable, int]] = [{} for _ in range(slots)]
+        self._slot_of: Dict[Hashable, int] = {}  # 对象 -> 所在槽位
+        self._current = math.floor(time.monotonic() / tick)  # 下一个要处理的tick编号
+        self._lock = threading.Lock()
+    
+    def __len__(self) -> int:
+        return len(self._slot_of)
+    
+    def __contains__(self, item: Hashable) -> bool:
+        return item in self._slot_of
+    
+    def schedule(self, item: Hashable, deadline: float):
+        """在 deadline（time.monotonic() 时间）之后到期，已调度的对象会被移动"""
+        with self._lock:
+            target = math.ceil(deadline / self.tick)
+            if target < self._current:
+                # 已经过去的tick不会再被处理，放到下一个tick
+                target = self._current
+            self._remove(item)
+            index = target % self.slots
+            self._wheel[index][item] = target
+            self._slot_of[item] = index
+    
+    def cancel(self, item: Hashable):
+        """取消调度"""
+        with self._lock:
+            self._remove(item)
+    
+    def _remove(self, item: Hashable):
+        index = self._slot_of.pop(item, None)
+        if index is not None:
+            del self._wheel[index][item]
+    
+    def advance(self, now: float) -> List[Any]:
+        """把时间轮推进到 now，返回到期的对象（已从时间轮中移除）"""
+        with self._lock:
+            last = math.floor(now / self.tick)
+            # 长时间没有推进时最多转一圈，更早的tick落在同样的槽位中
+            first = max(self._current, last - self.slots + 1)
+            
+            expired = []
+            for tick in range(first, last + 1):
+                bucket = self._wheel[tick % self.slots]
+                if not bucket:
+                    continue
+                for item, target in list(bucket.items()):
+                    if target <= last:
+                        del bucket[item]
+                        del self._slot_of[item]
+                        expired.append(item)
+            
+            self._current = max(self._current, last + 1)
+            return expired
+    
+    def items(self) -> List[Any]:
+        """所有已调度的对象"""
+        with self._lock:
+            return list(self._slot_of)
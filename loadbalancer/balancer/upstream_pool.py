@@ -0,0 +1,247 @@
+"""
+后端连接预热池
+为每个后端预先建立若干空闲TCP连接，新客户端到来时直接取用，省去一次握手的延迟。
+只适用于客户端先发送数据、且后端不会很快关闭空闲连接的协议；连接交给客户端后
+不会放回池中。
+"""
+
+import time
+import socket
+import logging
+import threading
+from collections import deque
+from typing import Optional, Dict, Any, Deque, Tuple
+from algorithms.base import LoadBalancer, Backend
+from algorithms.counters import StripedCounter
+
+logger = logging.getLogger(__name__)
+
+# 单次调用的非阻塞recv，不需要切换socket的阻塞模式（Windows上没有）
+_MSG_DONTWAIT = getattr(socket, 'MSG_DONTWAIT', 0)
+
+def connect_backend(backend: Backend, timeout: float) -> socket.socket:
+    """在 timeout 秒内连接后端，返回阻塞模式的socket
+    
+    settimeout 让CPython以非阻塞方式发起连接并用poll等待，超时抛出 socket.timeout。
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(timeout)
+        sock.connect((backend.host, backend.port))
+        sock.settimeout(None)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+def is_alive(sock: socket.socket) -> bool:
+    """空闲连接是否仍然可用（对端没有关闭、没有错误）"""
+    try:
+        if _MSG_DONTWAIT:
+            return sock.recv(1, socket.MSG_PEEK | _MSG_DONTWAIT) != b''
+        sock.setblocking(False)
+        try:
+            return sock.recv(1, socket.MSG_PEEK) != b''
+        finally:
+            sock.setblocking(True)
+    except (BlockingIOError, InterruptedError):
+        return True
+    except OSError:
+        return False
+
+class UpstreamPool:
+    """每个后端的空闲连接池
+    
+    后台线程把每个健康后端的空闲连接补足到目标数量：目标数量在 min_idle 和
+    max_idle 之间，取最近一个 refill_interval 内从该后端取走的连接数。后端变为不健康、
+    被移除，或空闲连接超过 max_idle_time、被对端关闭时，连接会被关闭。
+    """
+    
+    def __init__(self,
+                 load_balancer: LoadBalancer,
+                 min_idle: int = 2,
+                 max_idle: int = 16,
+                 connect_timeout: float = 1.0,
+                 max_idle_time: float = 60.0,
+                 refill_interval: float = 1.0):
+        """
+        Args:
+            load_balancer: 提供后端列表和健康状态的负载均衡器
+            min_idle: 每个后端至少保持的空闲连接数
+            max_idle: 每个后端最多保持的空闲连接数
+            connect_timeout: 预热连接的超时时间（秒）
+            max_idle_time: 空闲连接的最长保留时间（秒），避免被后端或中间设备回收
+            refill_interval: 补充连接的间隔（秒）
+        """
+        self.load_balancer = load_balancer
+        self.min_idle = min_idle
+        self.max_idle = max(max_idle, min_idle)
+        self.connect_timeout = connect_timeout
+        self.max_idle_time = max_idle_time
+        self.refill_interval = refill_interval
+        
+        self._idle: Dict[str, Deque[Tuple[socket.socket, float]]] = {}  # backend_id -> (socket, 建立时间)
+        self._demand: Dict[str, int] = {}  # backend_id -> 本周期取走的连接数
+        self._last_demand: Dict[str, int] = {}  # backend_id -> 上一个周期取走的连接数
+        self._window_start = time.monotonic()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self._refill_event = threading.Event()
+        
+        # 统计信息（接受连接的线程和补充线程都会更新，按线程分片累加）
+        self.counters = StripedCounter(('hits', 'misses', 'evictions', 'connect_failures'))
+    
+    def start(self):
+        """启动后台补充线程"""
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._maintain_loop, daemon=True, name='upstream-pool')
+        self._thread.start()
+        logger.info(f"Upstream pool started (min_idle={self.min_idle}, max_idle={self.max_idle})")
+    
+    def stop(self):
+        """停止后台线程并关闭所有空闲连接"""
+        self._stop_event.set()
+        self._refill_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        
+        with self._lock:
+            pools = list(self._idle.values())
+            self._idle.clear()
+        for pool in pools:
+            for sock, _ in pool:
+                sock.close()
+        logger.info("Upstream pool stopped")
+    
+    def acquire(self, backend: Backend) -> Optional[socket.socket]:
+        """取出一个到该后端的可用空闲连接（阻塞模式），没有时返回None"""
+        now = time.monotonic()
+        with self._lock:
+            self._demand[backend.id] = self._demand.get(backend.id, 0) + 1
+            pool = self._idle.get(backend.id)
+        
+        while pool:
+            try:
+                # 优先取最新建立的连接，最旧的由后台线程按 max_idle_time 淘汰
+                with self._lock:
+                    sock, created = pool.pop()
+            except IndexError:
+                break
+            
+            if now - created <= self.max_idle_time and is_alive(sock):
+                self.counters.add('hits')
+                # 低于 min_idle 时立即补充，否则等下一个周期按需求补足
+                if len(pool) < self.min_idle:
+                    self._refill_event.set()
+                return sock
+            
+            sock.close()
+            self.counters.add('evictions')
+        
+        self.counters.add('misses')
+        self._refill_event.set()
+        return None
+    
+    def evict(self, backend_id: str):
+        """关闭某个后端的所有空闲连接"""
+        with self._lock:
+            pool = self._idle.pop(backend_id, None)
+        if pool:
+            for sock, _ in pool:
+                sock.close()
+            self.counters.add('evictions', len(pool))
+            logger.info(f"Evicted {len(pool)} idle upstream connections of {backend_id}")
+    
+    def _maintain_loop(self):
+        while not self._stop_event.is_set():
+            try:
+                self._maintain()
+            except Exception as e:
+                logger.error(f"Error in upstream pool: {e}")
+            self._refill_event.wait(self.refill_interval)
+            self._refill_event.clear()
+    
+    def _maintain(self):
+        """淘汰失效连接，为健康后端补足空闲连接"""
+        backends = {backend.id: backend for backend in self.load_balancer.get_all_backends()}
+        
+        # 已移除或不健康的后端：关闭其所有空闲连接
+        for backend_id in list(self._idle):
+            backend = backends.get(backend_id)
+            if backend is None or not backend.is_healthy:
+                self.evict(backend_id)
+        
+        now = time.monotonic()
+        with self._lock:
+            if now - self._window_start >= self.refill_interval:
+                self._last_demand, self._demand = self._demand, {}
+                self._window_start = now
+            demands = {
+                backend_id: max(self._demand.get(backend_id, 0), self._last_demand.get(backend_id, 0))
+                for backend_id in backends
+            }
+        
+        for backend in backends.values():
+            if self._stop_event.is_set():
+                return
+            if not backend.is_healthy:
+                continue
+            
+            with self._lock:
+                pool = self._idle.setdefault(backend.id, deque())
+                # 淘汰超时或已被对端关闭的连接
+                stale = [sock for sock, created in pool
+                         if now - created > self.max_idle_time or not is_alive(sock)]
+                if stale:
+                    kept = [entry for entry in pool if entry[0] not in stale]
+                    pool.clear()
+                    pool.extend(kept)
+                target = min(max(demands[backend.id], self.min_idle), self.max_idle)
+                missing = target - len(pool)
+            for sock in stale:
+                sock.close()
+            if stale:
+                self.counters.add('evictions', len(stale))
+            
+            for _ in range(missing):
+                try:
+                    sock = connect_backend(backend, self.connect_timeout)
+                except OSError as e:
+                    self.counters.add('connect_failures')
+                    backend.mark_error()
+                    logger.warning(f"Failed to pre-connect to {backend.address}: {e}")
+                    break
+                with self._lock:
+                    # 期间该后端可能已被淘汰，不再往已移除的队列中放连接
+                    if self._idle.get(backend.id) is pool:
+                        pool.append((sock, time.monotonic()))
+                        continue
+                sock.close()
+                break
+    
+    def idle_count(self, backend_id: str) -> int:
+        """某个后端当前的空闲连接数"""
+        with self._lock:
+            pool = self._idle.get(backend_id)
+            return len(pool) if pool else 0
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取统计信息"""
+        with self._lock:
+            idle = {backend_id: len(pool) for backend_id, pool in self._idle.items()}
+        stats = self.counters.snapshot()
+        requests = stats['hits'] + stats['misses']
+        return {
+            'min_idle': self.min_idle,
+            'max_idle': self.max_idle,
+            'idle': idle,
+            'hits': stats['hits'],
+            'misses': stats['misses'],
+            'hit_rate': stats['hits'] / requests if requests > 0 else 0,
+            'evictions': stats['evictions'],
+            'connect_failures': stats['connect_failures']
+        }
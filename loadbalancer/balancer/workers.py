@@ -0,0 +1,368 @@
+"""
+多进程worker模式
+父进程fork出N个worker，每个worker用SO_REUSEPORT绑定同一个监听端口，由内核把新连接
+分散到各个进程，绕开GIL只能用满一个核的限制。
+
+父进程负责健康检查，把后端的健康状态和权重写入共享内存；worker只读取共享内存
+并同步到自己的 LoadBalancer，不再各自检查每个后端。各worker定期把计数器快照写入
+共享内存，/lb/stats 返回所有worker汇总后的计数。
+"""
+
+import os
+import mmap
+import time
+import errno
+import signal
+import socket
+import logging
+import threading
+from typing import Optional, Dict, Any, List, Callable, Sequence
+from algorithms.base import LoadBalancer, Backend
+from algorithms.counters import StripedCounter
+
+logger = logging.getLogger(__name__)
+
+# 每个worker在共享内存中最多发布的计数器个数
+MAX_COUNTERS = 32
+
+# worker同步后端状态、发布计数器的间隔（秒）
+SYNC_INTERVAL = 0.5
+PUBLISH_INTERVAL = 1.0
+
+# worker启动后很快退出时，重新启动前等待的时间（秒）
+RESPAWN_DELAY = 1.0
+
+class SharedBackendState:
+    """共享内存中的后端健康状态和权重
+    
+    布局为int64数组：[版本号, 后端0健康, 后端0权重, 后端1健康, 后端1权重, ...]。
+    只有父进程写入，每次修改后递增版本号；worker发现版本号变化时重新读取。
+    使用fork前创建的匿名共享映射，子进程直接继承。
+    """
+    
+    def __init__(self, backends: Sequence[Backend]):
+        self.backend_ids = [backend.id for backend in backends]
+        self._slots = {backend_id: i for i, backend_id in enumerate(self.backend_ids)}
+        self._mmap = mmap.mmap(-1, 8 * (1 + 2 * len(self.backend_ids)))
+        self._values = memoryview(self._mmap).cast('q')
+        for i, backend in enumerate(backends):
+            self._values[1 + 2 * i] = 1 if backend.is_healthy else 0
+            self._values[2 + 2 * i] = backend.weight
+    
+    @property
+    def version(self) -> int:
+        return self._values[0]
+    
+    def set_healthy(self, backend_id: str, healthy: bool):
+        """设置后端健康状态（父进程调用）"""
+        slot = self._slots.get(backend_id)
+        if slot is not None:
+            self._values[1 + 2 * slot] = 1 if healthy else 0
+            self._values[0] += 1
+    
+    def set_weight(self, backend_id: str, weight: int):
+        """设置后端权重（父进程调用）"""
+        slot = self._slots.get(backend_id)
+        if slot is not None:
+            self._values[2 + 2 * slot] = weight
+            self._values[0] += 1
+    
+    def read(self) -> Dict[str, tuple]:
+        """读取所有后端的 (健康状态, 权重)"""
+        values = self._values
+        return {
+            backend_id: (values[1 + 2 * i] == 1, values[2 + 2 * i])
+            for i, backend_id in enumerate(self.backend_ids)
+        }
+
+class SharedCounters:
+    """共享内存中各worker的计数器快照
+    
+    每个worker一行 MAX_COUNTERS 个float64，列的顺序由worker自己的
+    StripedCounter.names 决定（所有worker运行同一份代码，顺序一致）。
+    """
+    
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._mmap = mmap.mmap(-1, 8 * MAX_COUNTERS * workers)
+        self._values = memoryview(self._mmap).cast('d')
+    
+    def publish(self, index: int, names: Sequence[str], snapshot: Dict[str, float]):
+        """写入worker的计数器快照"""
+        base = index * MAX_COUNTERS
+        for i, name in enumerate(names[:MAX_COUNTERS]):
+            self._values[base + i] = snapshot[name]
+    
+    def clear(self, index: int):
+        """清零worker的计数器（worker重启时调用）"""
+        base = index * MAX_COUNTERS
+        for i in range(MAX_COUNTERS):
+            self._values[base + i] = 0.0
+    
+    def read(self, index: int, names: Sequence[str]) -> Dict[str, float]:
+        """读取worker最近一次发布的计数器"""
+        base = index * MAX_COUNTERS
+        return {name: self._values[base + i] for i, name in enumerate(names[:MAX_COUNTERS])}
+
+class WorkerContext:
+    """worker进程内的上下文
+    
+    提供SO_REUSEPORT监听socket，把父进程写入的后端状态同步到本进程的
+    LoadBalancer，并定期发布本进程的计数器。代理通过 set_worker_context 关联。
+    """
+    
+    def __init__(self, index: int, workers: int,
+                 backend_state: SharedBackendState, counters: SharedCounters):
+        self.index = index
+        self.workers = workers
+        self.backend_state = backend_state
+        self.shared_counters = counters
+        
+        self.load_balancers: List[LoadBalancer] = []
+        self.counters: Optional[StripedCounter] = None
+        self._synced_version = -1
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+    
+    def listen(self, host: str, port: int, backlog: int = 1024) -> socket.socket:
+        """创建带SO_REUSEPORT的监听socket"""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            sock.bind((host, port))
+            sock.listen(backlog)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+    
+    def attach(self, load_balancer: LoadBalancer, counters: Optional[StripedCounter] = None):
+        """同步该负载均衡器的后端状态；给出 counters 时定期发布到共享内存"""
+        with self._lock:
+            if load_balancer not in self.load_balancers:
+                self.load_balancers.append(load_balancer)
+            if counters is not None:
+                self.counters = counters
+            self._synced_version = -1
+            
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._sync_loop, daemon=True,
+                                                name=f"worker-{self.index}-sync")
+                self._thread.start()
+        self.sync_backends()
+    
+    def _sync_loop(self):
+        last_publish = 0.0
+        while True:
+            time.sleep(SYNC_INTERVAL)
+            try:
+                self.sync_backends()
+                now = time.monotonic()
+                if now - last_publish >= PUBLISH_INTERVAL:
+                    self.publish()
+                    last_publish = now
+            except Exception as e:
+                logger.error(f"Error in worker {self.index} sync: {e}")
+    
+    def sync_backends(self):
+        """版本号变化时，把共享内存中的后端状态应用到本进程的LoadBalancer"""
+        version = self.backend_state.version
+        if version == self._synced_version:
+            return
+        
+        states = self.backend_state.read()
+        for lb in list(self.load_balancers):
+            for backend_id, (healthy, weight) in states.items():
+                backend = lb.get_backend(backend_id)
+                if backend is None:
+                    continue
+                if backend.is_healthy != healthy:
+                    backend.set_healthy(healthy)
+                if backend.weight != weight:
+                    backend.set_weight(weight)
+        self._synced_version = version
+    
+    def publish(self):
+        """发布本进程的计数器快照"""
+        counters = self.counters
+        if counters is not None:
+            self.shared_counters.publish(self.index, counters.names, counters.snapshot())
+    
+    def aggregate(self, snapshot: Dict[str, float]) -> Dict[str, float]:
+        """把本进程的实时快照与其他worker最近发布的快照相加"""
+        names = list(snapshot)
+        totals = dict(snapshot)
+        for index in range(self.workers):
+            if index == self.index:
+                continue
+            for name, value in self.shared_counters.read(index, names).items():
+                totals[name] += value
+        
+        # 保持计数器原来的类型（整数计数不变成浮点数）
+        return {name: type(snapshot[name])(value) for name, value in totals.items()}
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取worker信息"""
+        return {
+            'index': self.index,
+            'pid': os.getpid(),
+            'workers': self.workers,
+            'backend_state_version': self._synced_version
+        }
+
+class WorkerSupervisor:
+    """fork并监控worker进程
+    
+    worker_main 在子进程中调用，负责创建代理、调用 set_worker_context 并阻塞运行；
+    它返回或抛出异常时worker退出，父进程会重新启动它。父进程不处理请求，
+    只负责健康检查（通过 set_backend_health / set_backend_weight 写入共享内存）
+    和监控worker。
+    
+    所有worker监听同一个端口，需要操作系统支持SO_REUSEPORT（Linux 3.9+、BSD）。
+    后端列表在fork时确定；运行时通过管理接口增删的后端只在处理该请求的worker中生效。
+    """
+    
+    def __init__(self,
+                 worker_main: Callable[[WorkerContext], None],
+                 workers: Optional[int] = None,
+                 backends: Sequence[Backend] = ()):
+        """
+        Args:
+            worker_main: 在worker进程中运行的函数
+            workers: worker数量，默认为CPU核数
+            backends: 需要在worker之间同步状态的后端
+        """
+        if not hasattr(os, 'fork') or not hasattr(socket, 'SO_REUSEPORT'):
+            raise RuntimeError("Worker mode requires fork() and SO_REUSEPORT")
+        
+        self.worker_main = worker_main
+        self.workers = workers or os.cpu_count() or 1
+        self.backend_state = SharedBackendState(backends)
+        self.shared_counters = SharedCounters(self.workers)
+        
+        self.pids: Dict[int, int] = {}  # pid -> worker下标
+        self.started_at: Dict[int, float] = {}  # worker下标 -> 启动时间
+        self.restarts = 0
+        self.is_running = False
+    
+    def set_backend_health(self, backend_id: str, healthy: bool):
+        """更新后端健康状态，可直接用作健康检查器的回调"""
+        self.backend_state.set_healthy(backend_id, healthy)
+    
+    def set_backend_weight(self, backend_id: str, weight: int):
+        """更新后端权重"""
+        self.backend_state.set_weight(backend_id, weight)
+    
+    def start(self):
+        """启动所有worker
+        
+        应在父进程启动其他线程（例如健康检查）之前调用，fork时进程中只有主线程。
+        """
+        if self.is_running:
+            raise RuntimeError("Worker supervisor is already running")
+        
+        self.is_running = True
+        for index in range(self.workers):
+            self._spawn(index)
+        logger.info(f"Started {self.workers} workers")
+    
+    def _spawn(self, index: int):
+        """fork一个worker"""
+        self.shared_counters.clear(index)
+        pid = os.fork()
+        if pid == 0:
+            self._run_worker(index)
+        
+        self.pids[pid] = index
+        self.started_at[index] = time.monotonic()
+    
+    def _run_worker(self, index: int):
+        """worker进程入口，不会返回"""
+        status = 0
+        try:
+            signal.signal(signal.SIGINT, signal.SIG_IGN)  # 由父进程统一处理Ctrl+C
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            context = WorkerContext(index, self.workers, self.backend_state, self.shared_counters)
+            self.worker_main(context)
+        except BaseException as e:
+            logger.error(f"Worker {index} failed: {e}")
+            status = 1
+        finally:
+            os._exit(status)
+    
+    def wait(self):
+        """监控worker直到收到SIGINT/SIGTERM，退出的worker会被重新启动"""
+        def handle_signal(signum, frame):
+            self.is_running = False
+        
+        signal.signal(signal.SIGINT, handle_signal)
+        signal.signal(signal.SIGTERM, handle_signal)
+        
+        try:
+            while self.is_running:
+                try:
+                    pid, status = os.waitpid(-1, os.WNOHANG)
+                except ChildProcessError:
+                    pid = 0
+                
+                if pid == 0:
+                    time.sleep(0.2)
+                    continue
+                
+                index = self.pids.pop(pid, None)
+                if index is None or not self.is_running:
+                    continue
+                
+                logger.warning(f"Worker {index} (pid {pid}) exited with status {status}, restarting")
+                if time.monotonic() - self.started_at.get(index, 0) < RESPAWN_DELAY:
+                    time.sleep(RESPAWN_DELAY)
+                self.restarts += 1
+                self._spawn(index)
+        finally:
+            self.stop()
+    
+    def stop(self, timeout: float = 10.0):
+        """停止所有worker：先发SIGTERM，超时后SIGKILL"""
+        self.is_running = False
+        for pid in list(self.pids):
+            self._signal(pid, signal.SIGTERM)
+        
+        deadline = time.monotonic() + timeout
+        while self.pids and time.monotonic() < deadline:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                self.pids.clear()
+                break
+            if pid:
+                self.pids.pop(pid, None)
+            else:
+                time.sleep(0.05)
+        
+        for pid in list(self.pids):
+            self._signal(pid, signal.SIGKILL)
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        self.pids.clear()
+        logger.info("Workers stopped")
+    
+    @staticmethod
+    def _signal(pid: int, signum: int):
+        try:
+            os.kill(pid, signum)
+        except OSError as e:
+            if e.errno != errno.ESRCH:
+                raise
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取worker信息"""
+        return {
+            'workers': self.workers,
+            'pids': {index: pid for pid, index in self.pids.items()},
+            'restarts': self.restarts,
+            'backend_state_version': self.backend_state.version,
+            'is_running': self.is_running
+        }
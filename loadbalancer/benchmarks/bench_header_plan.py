@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+头部改写基准
+对比原来逐请求构建集合和字典的头部处理与预编译的 HeaderPlan，
+统计每次调用的耗时和临时内存峰值
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import json
+import time
+import tracemalloc
+from typing import Dict, Any, Callable
+
+from flask import Flask, request
+from requests.structures import CaseInsensitiveDict
+
+from balancer.route import RouteConfig, HeaderPlan
+
+REQUEST_HEADERS = {
+    'Host': 'lb.example.com',
+    'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
+    'Accept-Encoding': 'gzip, deflate, br',
+    'Connection': 'keep-alive',
+    'Cookie': 'LB_SESSION_ID=4f1c2d; theme=dark',
+    'X-Forwarded-For': '203.0.113.7',
+    'X-Request-ID': '7d8f5a1e-2c44-4c4b-9a4e-1f2b3c4d5e6f',
+    'X-Debug': '1',
+    'Cache-Control': 'no-cache'
+}
+
+RESPONSE_HEADERS = {
+    'Content-Type': 'application/json',
+    'Content-Length': '1234',
+    'Connection': 'keep-alive',
+    'Keep-Alive': 'timeout=5',
+    'Date': 'Sat, 17 Oct 2026 00:00:00 GMT',
+    'Server': 'gunicorn',
+    'ETag': '"abc123"',
+    'Cache-Control': 'max-age=60',
+    'Vary': 'Accept-Encoding'
+}
+
+
+def legacy_client_ip() -> str:
+    """原来的客户端IP获取方式"""
+    xff = request.headers.get('X-Forwarded-For')
+    if xff:
+        return xff.split(',')[0].strip()
+    xri = request.headers.get('X-Real-IP')
+    if xri:
+        return xri
+    return request.remote_addr or '127.0.0.1'
+
+
+def legacy_request_headers(route_config: RouteConfig) -> Dict[str, str]:
+    """原来的 _prepare_headers"""
+    headers = dict(request.headers)
+    hop_by_hop = {
+        'connection', 'keep-alive', 'proxy-authenticate',
+        'proxy-authorization', 'te', 'trailers', 'upgrade'
+    }
+    headers = {k: v for k, v in headers.items() if k.lower() not in hop_by_hop}
+    headers['X-Forwarded-For'] = legacy_client_ip()
+    headers['X-Forwarded-Host'] = request.host
+    headers['X-Forwarded-Proto'] = request.scheme
+    headers['X-Real-IP'] = legacy_client_ip()
+    if route_config:
+        if route_config.add_headers:
+            headers.update(route_config.add_headers)
+        if route_config.remove_headers:
+            for header in route_config.remove_headers:
+                headers.pop(header, None)
+    return headers
+
+
+def legacy_response_headers(upstream: CaseInsensitiveDict, route_config: RouteConfig,
+                            backend_address: str) -> Dict[str, str]:
+    """原来的 _prepare_response_headers"""
+    response_headers = dict(upstream)
+    hop_by_hop = {
+        'connection', 'keep-alive', 'proxy-authenticate',
+        'proxy-authorization', 'te', 'trailers', 'upgrade',
+        'transfer-encoding'
+    }
+    response_headers = {k: v for k, v in response_headers.items() if k.lower() not in hop_by_hop}
+    response_headers['X-Load-Balancer'] = 'FlaskLB/1.0'
+    response_headers['X-Backend-Server'] = backend_address
+    if route_config and route_config.enable_cors:
+        response_headers.update({
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
+            'Access-Control-Allow-Headers': 'Content-Type, Authorization'
+        })
+    return response_headers
+
+
+def measure(func: Callable[[], Any], iterations: int) -> Dict[str, float]:
+    """返回每次调用的平均耗时（微秒）和临时内存峰值（字节）"""
+    func()  # 预热
+    
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    elapsed = time.perf_counter() - start
+    
+    samples = min(iterations, 1000)
+    peak_total = 0
+    tracemalloc.start()
+    for _ in range(samples):
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        func()
+        peak_total += tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+    
+    return {
+        'us_per_call': elapsed / iterations * 1_000_000,
+        'peak_bytes_per_call': peak_total / samples
+    }
+
+
+def run_benchmark(args) -> Dict[str, Any]:
+    """在同一个请求上下文中运行两种实现"""
+    app = Flask(__name__)
+    route_config = RouteConfig(
+        'api-service',
+        add_headers={'X-Service': 'api'},
+        remove_headers=['X-Debug'],
+        enable_cors=True
+    )
+    plan = HeaderPlan(route_config)
+    upstream = CaseInsensitiveDict(RESPONSE_HEADERS)
+    backend_address = '127.0.0.1:8081'
+    
+    with app.test_request_context('/api/users', headers=REQUEST_HEADERS):
+        client_ip = legacy_client_ip()
+        # 确认两种实现的结果一致
+        assert plan.request_headers(request.environ, client_ip, request.host, request.scheme) == \
+            legacy_request_headers(route_config)
+        assert plan.response_headers(upstream.items(), backend_address) == \
+            legacy_response_headers(upstream, route_config, backend_address)
+        
+        return {
+            'request_legacy': measure(lambda: legacy_request_headers(route_config), args.iterations),
+            'request_plan': measure(
+                lambda: plan.request_headers(request.environ, legacy_client_ip(),
+                                             request.host, request.scheme),
+                args.iterations
+            ),
+            'response_legacy': measure(
+                lambda: legacy_response_headers(upstream, route_config, backend_address), args.iterations
+            ),
+            'response_plan': measure(
+                lambda: plan.response_headers(upstream.items(), backend_address), args.iterations
+            )
+        }
+
+
+def print_results(results: Dict[str, Any]):
+    """打印结果"""
+    for side in ('request', 'response'):
+        legacy = results[f'{side}_legacy']
+        compiled = results[f'{side}_plan']
+        print(f"\n{side} headers:")
+        print(f"  legacy:       {legacy['us_per_call']:.2f} us/call, "
+              f"{legacy['peak_bytes_per_call']:.0f} bytes peak")
+        print(f"  header plan:  {compiled['us_per_call']:.2f} us/call, "
+              f"{compiled['peak_bytes_per_call']:.0f} bytes peak")
+        print(f"  speedup: {legacy['us_per_call'] / compiled['us_per_call']:.2f}x, "
+              f"allocation: {compiled['peak_bytes_per_call'] / legacy['peak_bytes_per_call'] * 100:.0f}%")
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='Header rewrite pipeline benchmark')
+    parser.add_argument('--iterations', type=int, default=100000,
+                       help='Number of calls per implementation')
+    parser.add_argument('--output', help='Output file for results (JSON format)')
+    
+    args = parser.parse_args()
+    
+    results = run_benchmark(args)
+    print_results(results)
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults saved to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
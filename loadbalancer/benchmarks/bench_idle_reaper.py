@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+空闲连接清理基准
+模拟N个大部分空闲的连接，对比每次检查都加锁扫描全部连接与哈希时间轮
+（惰性重调度）在每个tick上的耗时，并确认两者关闭的连接相同
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import json
+import random
+import threading
+import time
+from typing import Dict, Any, List
+
+from balancer.timer_wheel import TimerWheel
+
+
+class FakeConnection:
+    """只有活跃时间戳的连接"""
+    
+    __slots__ = ('conn_id', 'last_active', 'is_closed')
+    
+    def __init__(self, conn_id: int, last_active: float):
+        self.conn_id = conn_id
+        self.last_active = last_active
+        self.is_closed = False
+
+
+def build_connections(args, start: float, rng: random.Random) -> List[FakeConnection]:
+    """连接的初始活跃时间分散在一个超时周期内"""
+    return [
+        FakeConnection(i, start - rng.random() * args.idle_timeout)
+        for i in range(args.connections)
+    ]
+
+
+def simulate_activity(connections: List[FakeConnection], now: float, args, rng: random.Random):
+    """每个tick有一小部分连接收发数据"""
+    for conn in rng.sample(connections, int(len(connections) * args.active_ratio)):
+        if not conn.is_closed:
+            conn.last_active = now
+
+
+def run_scan(args) -> Dict[str, Any]:
+    """原来的方式：每次检查都在锁内遍历所有连接"""
+    rng = random.Random(args.seed)
+    start = float(int(time.monotonic()))
+    connections = build_connections(args, start, rng)
+    table = {conn.conn_id: conn for conn in connections}
+    lock = threading.Lock()
+    
+    closed = []
+    elapsed = 0.0
+    for tick in range(1, args.ticks + 1):
+        now = start + tick
+        simulate_activity(connections, now, args, rng)
+        
+        begin = time.perf_counter()
+        with lock:
+            expired = [conn for conn in table.values() if now - conn.last_active >= args.idle_timeout]
+        for conn in expired:
+            conn.is_closed = True
+            with lock:
+                del table[conn.conn_id]
+            closed.append(conn.conn_id)
+        elapsed += time.perf_counter() - begin
+    
+    return {'us_per_tick': elapsed / args.ticks * 1_000_000, 'closed': closed}
+
+
+def run_wheel(args) -> Dict[str, Any]:
+    """时间轮：每个tick只处理到期槽位中的连接"""
+    rng = random.Random(args.seed)
+    start = float(int(time.monotonic()))
+    connections = build_connections(args, start, rng)
+    wheel = TimerWheel(tick=1.0)
+    wheel.advance(start)
+    for conn in connections:
+        wheel.schedule(conn, conn.last_active + args.idle_timeout)
+    
+    closed = []
+    visited = 0
+    elapsed = 0.0
+    for tick in range(1, args.ticks + 1):
+        now = start + tick
+        simulate_activity(connections, now, args, rng)
+        
+        begin = time.perf_counter()
+        for conn in wheel.advance(now):
+            visited += 1
+            deadline = conn.last_active + args.idle_timeout
+            if deadline <= now:
+                conn.is_closed = True
+                closed.append(conn.conn_id)
+            else:
+                wheel.schedule(conn, deadline)
+        elapsed += time.perf_counter() - begin
+    
+    return {
+        'us_per_tick': elapsed / args.ticks * 1_000_000,
+        'visited_per_tick': visited / args.ticks,
+        'closed': closed
+    }
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='Idle connection reaper benchmark')
+    parser.add_argument('--connections', type=int, default=50000,
+                       help='Number of connections')
+    parser.add_argument('--idle-timeout', type=int, default=300,
+                       help='Idle timeout in ticks (seconds)')
+    parser.add_argument('--active-ratio', type=float, default=0.01,
+                       help='Fraction of connections active in each tick')
+    parser.add_argument('--ticks', type=int, default=200,
+                       help='Number of simulated ticks')
+    parser.add_argument('--seed', type=int, default=42,
+                       help='Random seed')
+    parser.add_argument('--output', help='Output file for results (JSON format)')
+    
+    args = parser.parse_args()
+    
+    scan = run_scan(args)
+    wheel = run_wheel(args)
+    # 时间轮与全量扫描关闭的连接应当完全一致
+    assert sorted(scan['closed']) == sorted(wheel['closed'])
+    
+    print(f"\n{args.connections} connections, {len(scan['closed'])} closed in {args.ticks} ticks:")
+    print(f"  full scan:   {scan['us_per_tick']:.0f} us/tick")
+    print(f"  timer wheel: {wheel['us_per_tick']:.0f} us/tick "
+          f"({scan['us_per_tick'] / wheel['us_per_tick']:.1f}x), "
+          f"{wheel['visited_per_tick']:.0f} connections visited per tick")
+    
+    results = {
+        'connections': args.connections,
+        'closed': len(scan['closed']),
+        'scan_us_per_tick': scan['us_per_tick'],
+        'wheel_us_per_tick': wheel['us_per_tick'],
+        'wheel_visited_per_tick': wheel['visited_per_tick']
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults saved to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
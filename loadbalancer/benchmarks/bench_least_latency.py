@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+最少在途延迟与最快响应算法的对比基准
+用线程模拟并发客户端，后端用sleep模拟服务时间，其中一个后端会间歇性卡住
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import json
+import random
+import statistics
+import threading
+import time
+from typing import Dict, Any, List
+
+from algorithms import LoadBalancerFactory
+from algorithms.base import Backend
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """计算已排序样本的分位数"""
+    if not sorted_values:
+        return 0.0
+    index = min(int(q * len(sorted_values)), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def run_benchmark(algorithm: str, args) -> Dict[str, Any]:
+    """对单个算法运行模拟负载"""
+    lb = LoadBalancerFactory.create(algorithm)
+    for i in range(args.backends):
+        lb.add_backend(Backend(f"backend-{i}", '127.0.0.1', 9000 + i))
+    
+    latencies: List[float] = []
+    distribution: Dict[str, int] = {}
+    results_lock = threading.Lock()
+    deadline = time.monotonic() + args.duration
+    
+    def worker(worker_id: int):
+        rng = random.Random(args.seed + worker_id)
+        local_latencies = []
+        local_distribution: Dict[str, int] = {}
+        client_ip = f"10.0.{worker_id // 256}.{worker_id % 256}"
+        
+        while time.monotonic() < deadline:
+            start = time.monotonic()
+            backend = lb.next_backend(client_ip)
+            backend.increment_active()
+            try:
+                service_ms = rng.expovariate(1.0 / args.service_ms)
+                # 第一个后端间歇性卡住
+                if backend.id == 'backend-0' and rng.random() < args.stall_probability:
+                    service_ms += args.stall_ms
+                time.sleep(service_ms / 1000.0)
+            finally:
+                backend.decrement_active()
+            
+            response_time = (time.monotonic() - start) * 1000
+            backend.update_response_time(response_time)
+            if hasattr(lb, 'update_response_time'):
+                lb.update_response_time(backend.id, response_time)
+            
+            local_latencies.append(response_time)
+            local_distribution[backend.id] = local_distribution.get(backend.id, 0) + 1
+        
+        with results_lock:
+            latencies.extend(local_latencies)
+            for backend_id, count in local_distribution.items():
+                distribution[backend_id] = distribution.get(backend_id, 0) + count
+    
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    
+    latencies.sort()
+    return {
+        'algorithm': algorithm,
+        'requests': len(latencies),
+        'throughput': len(latencies) / args.duration,
+        'mean': statistics.mean(latencies) if latencies else 0.0,
+        'p50': percentile(latencies, 0.50),
+        'p95': percentile(latencies, 0.95),
+        'p99': percentile(latencies, 0.99),
+        'max': latencies[-1] if latencies else 0.0,
+        'distribution': dict(sorted(distribution.items()))
+    }
+
+
+def print_result(result: Dict[str, Any]):
+    """打印单个算法的结果"""
+    print(f"\n{result['algorithm']}:")
+    print(f"  Requests: {result['requests']} ({result['throughput']:.1f} req/s)")
+    print(f"  Latency (ms): mean={result['mean']:.1f} p50={result['p50']:.1f} "
+          f"p95={result['p95']:.1f} p99={result['p99']:.1f} max={result['max']:.1f}")
+    total = result['requests'] or 1
+    for backend_id, count in result['distribution'].items():
+        print(f"  {backend_id}: {count} ({count / total * 100:.1f}%)")
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='Least outstanding latency vs fastest response benchmark')
+    parser.add_argument('--algorithms', default='least_outstanding_latency,fastest_response',
+                       help='Comma separated algorithms to compare')
+    parser.add_argument('--backends', type=int, default=4,
+                       help='Number of simulated backends')
+    parser.add_argument('--concurrency', type=int, default=32,
+                       help='Number of concurrent clients')
+    parser.add_argument('--duration', type=float, default=5.0,
+                       help='Duration of each run in seconds')
+    parser.add_argument('--service-ms', type=float, default=20.0,
+                       help='Mean service time in milliseconds')
+    parser.add_argument('--stall-ms', type=float, default=500.0,
+                       help='Extra latency of a stalled request on backend-0')
+    parser.add_argument('--stall-probability', type=float, default=0.05,
+                       help='Probability that a request on backend-0 stalls')
+    parser.add_argument('--seed', type=int, default=42,
+                       help='Random seed')
+    parser.add_argument('--output', help='Output file for results (JSON format)')
+    
+    args = parser.parse_args()
+    
+    results = []
+    for algorithm in args.algorithms.split(','):
+        result = run_benchmark(algorithm.strip(), args)
+        print_result(result)
+        results.append(result)
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults saved to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
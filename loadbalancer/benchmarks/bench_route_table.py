@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+路由表匹配基准
+对比原来的 精确匹配 + 线性前缀扫描 与基数树（带/不带路径缓存）在不同路由数量下的查找耗时
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import json
+import random
+import time
+from typing import Dict, Any, List, Optional
+
+from balancer.route import RouteConfig, RouteTable
+
+
+def linear_match(routes: Dict[str, RouteConfig], default_route: Optional[RouteConfig],
+                 path: str) -> Optional[RouteConfig]:
+    """原来的路由选择方式：精确匹配后线性扫描最长前缀"""
+    if path in routes:
+        return routes[path]
+    
+    best_match = None
+    best_length = 0
+    for route_path, config in routes.items():
+        if path.startswith(route_path) and len(route_path) > best_length:
+            best_match = config
+            best_length = len(route_path)
+    
+    if best_match:
+        return best_match
+    
+    return default_route
+
+
+def build_routes(count: int, rng: random.Random) -> List[str]:
+    """生成形如 /api/svc12/v2 的路由路径"""
+    routes = []
+    for i in range(count):
+        depth = rng.randint(1, 3)
+        parts = ['api', f"svc{i}", f"v{rng.randint(1, 3)}", 'items'][:depth + 1]
+        routes.append('/' + '/'.join(parts))
+    return routes
+
+
+def build_paths(routes: List[str], count: int, rng: random.Random) -> List[str]:
+    """生成请求路径：大部分命中某条路由的子路径，少部分不匹配任何路由"""
+    paths = []
+    for _ in range(count):
+        if rng.random() < 0.9:
+            paths.append(f"{rng.choice(routes)}/{rng.randint(1, 100000)}")
+        else:
+            paths.append(f"/static/{rng.randint(1, 100000)}.js")
+    return paths
+
+
+def time_lookups(match, paths: List[str], rounds: int) -> float:
+    """返回平均每次查找的耗时（微秒）"""
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for path in paths:
+            match(path)
+    elapsed = time.perf_counter() - start
+    return elapsed / (rounds * len(paths)) * 1_000_000
+
+
+def run_benchmark(route_count: int, args) -> Dict[str, Any]:
+    """对指定路由数量运行三种匹配方式"""
+    rng = random.Random(args.seed)
+    route_paths = build_routes(route_count, rng)
+    # 热点路径从一个较小的集合中选，模拟缓存命中的场景
+    hot_paths = build_paths(route_paths, args.hot_paths, rng)
+    paths = [rng.choice(hot_paths) for _ in range(args.lookups)]
+    
+    default_route = RouteConfig('default')
+    plain = RouteTable(cache_size=0)
+    cached = RouteTable(cache_size=args.cache_size)
+    for route_path in route_paths:
+        config = RouteConfig(route_path)
+        plain.add(route_path, config)
+        cached.add(route_path, config)
+    plain.set_default(default_route)
+    cached.set_default(default_route)
+    routes = plain.routes
+    
+    # 确认三种方式的结果一致
+    for path in paths:
+        expected = linear_match(routes, default_route, path)
+        assert plain.match(path) is expected and cached.match(path) is expected, path
+    
+    return {
+        'routes': route_count,
+        'linear_us': time_lookups(lambda p: linear_match(routes, default_route, p), paths, args.rounds),
+        'radix_us': time_lookups(plain.match, paths, args.rounds),
+        'radix_cache_us': time_lookups(cached.match, paths, args.rounds)
+    }
+
+
+def print_result(result: Dict[str, Any]):
+    """打印单个路由数量的结果"""
+    print(f"\n{result['routes']} routes:")
+    print(f"  linear scan:  {result['linear_us']:.2f} us/lookup")
+    print(f"  radix trie:   {result['radix_us']:.2f} us/lookup "
+          f"({result['linear_us'] / result['radix_us']:.1f}x)")
+    print(f"  radix + cache: {result['radix_cache_us']:.2f} us/lookup "
+          f"({result['linear_us'] / result['radix_cache_us']:.1f}x)")
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='Route table lookup benchmark')
+    parser.add_argument('--routes', default='10,100,1000',
+                       help='Comma separated route counts')
+    parser.add_argument('--lookups', type=int, default=10000,
+                       help='Number of lookups per round')
+    parser.add_argument('--hot-paths', type=int, default=500,
+                       help='Number of distinct request paths')
+    parser.add_argument('--cache-size', type=int, default=1024,
+                       help='Path cache size of the cached route table')
+    parser.add_argument('--rounds', type=int, default=5,
+                       help='Number of rounds')
+    parser.add_argument('--seed', type=int, default=42,
+                       help='Random seed')
+    parser.add_argument('--output', help='Output file for results (JSON format)')
+    
+    args = parser.parse_args()
+    
+    results = []
+    for route_count in args.routes.split(','):
+        result = run_benchmark(int(route_count), args)
+        print_result(result)
+        results.append(result)
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults saved to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
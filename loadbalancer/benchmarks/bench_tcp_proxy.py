@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+TCP代理并发连接基准
+对比每连接三个线程的 TCPProxy 与基于selectors事件循环的 EventLoopTCPProxy：
+同时保持N个空闲连接后，测量建立连接的耗时、往返延迟以及代理进程的线程数
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import asyncio
+import json
+import logging
+import threading
+import time
+from typing import Dict, Any, List
+
+from algorithms.base import Backend
+from algorithms.round_robin import RoundRobinBalancer
+from balancer.tcp_proxy import TCPProxy
+from balancer.event_tcp_proxy import EventLoopTCPProxy
+
+ENGINES = {
+    'thread': TCPProxy,
+    'event': EventLoopTCPProxy
+}
+
+
+async def echo(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    """回显后端"""
+    try:
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                break
+            writer.write(data)
+            await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+def start_echo_backend() -> int:
+    """在后台线程中启动回显后端，返回端口"""
+    ready = threading.Event()
+    ports: List[int] = []
+    
+    def run():
+        loop = asyncio.new_event_loop()
+        server = loop.run_until_complete(asyncio.start_server(echo, '127.0.0.1', 0, backlog=4096))
+        ports.append(server.sockets[0].getsockname()[1])
+        ready.set()
+        loop.run_forever()
+    
+    threading.Thread(target=run, daemon=True).start()
+    ready.wait()
+    return ports[0]
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """计算已排序样本的分位数"""
+    if not sorted_values:
+        return 0.0
+    index = min(int(q * len(sorted_values)), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+async def hold_connections(port: int, args) -> Dict[str, Any]:
+    """建立N个连接，全部建立后每个连接做若干次往返"""
+    semaphore = asyncio.Semaphore(args.connect_concurrency)
+    
+    async def connect():
+        async with semaphore:
+            return await asyncio.open_connection('127.0.0.1', port)
+    
+    start = time.perf_counter()
+    streams = await asyncio.gather(*[connect() for _ in range(args.connections)])
+    connect_time = time.perf_counter() - start
+    threads = threading.active_count()
+    
+    latencies: List[float] = []
+    message = b'x' * args.message_size
+    
+    async def ping(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        for _ in range(args.round_trips):
+            sent = time.perf_counter()
+            writer.write(message)
+            await writer.drain()
+            await asyncio.wait_for(reader.readexactly(len(message)), args.timeout)
+            latencies.append(time.perf_counter() - sent)
+    
+    start = time.perf_counter()
+    outcomes = await asyncio.gather(*[ping(reader, writer) for reader, writer in streams],
+                                    return_exceptions=True)
+    ping_time = time.perf_counter() - start
+    # TCPProxy 使用 select.select，文件描述符超过 FD_SETSIZE(1024) 的连接会失败
+    failed = sum(1 for outcome in outcomes if isinstance(outcome, Exception))
+    
+    for _, writer in streams:
+        writer.close()
+    
+    latencies.sort()
+    return {
+        'connect_seconds': connect_time,
+        'threads': threads,
+        'failed_connections': failed,
+        'round_trips_per_second': len(latencies) / ping_time,
+        'p50_ms': percentile(latencies, 0.5) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000
+    }
+
+
+def run_benchmark(engine: str, backend_port: int, args) -> Dict[str, Any]:
+    """对单个TCP代理实现运行基准"""
+    lb = RoundRobinBalancer()
+    lb.add_backend(Backend('echo', '127.0.0.1', backend_port))
+    
+    threads_before = threading.active_count()
+    proxy = ENGINES[engine]('127.0.0.1', 0, lb)
+    proxy.max_connections = args.connections
+    if engine == 'thread':
+        proxy.start()
+        port = proxy.server_socket.getsockname()[1]
+    else:
+        proxy.loop_count = args.loops or proxy.loop_count
+        proxy.start()
+        port = proxy.listen_port
+    
+    try:
+        result = asyncio.run(hold_connections(port, args))
+        result['proxy_threads'] = result.pop('threads') - threads_before
+    finally:
+        proxy.stop()
+    
+    result['engine'] = engine
+    result['connections'] = args.connections
+    return result
+
+
+def print_result(result: Dict[str, Any]):
+    """打印单个实现的结果"""
+    print(f"\n{result['engine']} ({result['connections']} connections):")
+    print(f"  connect all:   {result['connect_seconds']:.2f} s")
+    print(f"  round trips:   {result['round_trips_per_second']:.0f}/s, "
+          f"p50 {result['p50_ms']:.2f} ms, p99 {result['p99_ms']:.2f} ms")
+    print(f"  proxy threads: {result['proxy_threads']}")
+    print(f"  failed:        {result['failed_connections']}")
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='TCP proxy concurrent connection benchmark')
+    parser.add_argument('--engines', default='thread,event',
+                       help='Comma separated engines (thread, event)')
+    parser.add_argument('--connections', type=int, default=1000,
+                       help='Number of concurrent connections')
+    parser.add_argument('--round-trips', type=int, default=5,
+                       help='Round trips per connection')
+    parser.add_argument('--message-size', type=int, default=64,
+                       help='Message size in bytes')
+    parser.add_argument('--connect-concurrency', type=int, default=200,
+                       help='Maximum number of connections being opened at once')
+    parser.add_argument('--timeout', type=float, default=10.0,
+                       help='Round trip timeout in seconds')
+    parser.add_argument('--loops', type=int, default=0,
+                       help='Event loops of the event engine (default: CPU count)')
+    parser.add_argument('--output', help='Output file for results (JSON format)')
+    
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.CRITICAL)
+    
+    backend_port = start_echo_backend()
+    results = []
+    for engine in args.engines.split(','):
+        result = run_benchmark(engine, backend_port, args)
+        print_result(result)
+        results.append(result)
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults saved to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+TCP代理吞吐量基准
+对比 TCPConnection 原来的 recv + sendall 循环、预分配缓冲区的 recv_into 循环和
+os.splice 零拷贝路径：客户端经代理向回显后端发送数据并读回，统计吞吐量，
+并检查代理统计的字节数是否与实际传输量一致
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import json
+import logging
+import select
+import socket
+import threading
+import time
+from typing import Dict, Any, List
+
+from algorithms.base import Backend
+from algorithms.round_robin import RoundRobinBalancer
+from balancer.tcp_proxy import TCPProxy, TCPConnection, SPLICE_AVAILABLE
+
+CHUNK_SIZE = 256 * 1024
+
+
+def legacy_proxy_data(self, source: socket.socket, destination: socket.socket, direction: str):
+    """原来的 TCPConnection._proxy_data"""
+    try:
+        while not self.is_closed:
+            ready, _, _ = select.select([source], [], [], 1.0)
+            if not ready:
+                continue
+            try:
+                data = source.recv(self.buffer_size)
+                if not data:
+                    break
+                destination.sendall(data)
+                if direction == "client->backend":
+                    self.bytes_received += len(data)
+                else:
+                    self.bytes_sent += len(data)
+                self.last_active = threading.current_thread().ident
+            except socket.error:
+                break
+    except Exception:
+        pass
+
+
+MODES = {
+    'legacy': (legacy_proxy_data, False),
+    'recv_into': (TCPConnection._proxy_data, False),
+    'splice': (TCPConnection._proxy_data, True)
+}
+
+
+def start_echo_backend() -> int:
+    """启动回显后端，每个连接一个线程，返回端口"""
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind(('127.0.0.1', 0))
+    server.listen(128)
+    
+    def handle(conn: socket.socket):
+        buffer = bytearray(CHUNK_SIZE)
+        view = memoryview(buffer)
+        with conn:
+            while True:
+                size = conn.recv_into(buffer)
+                if not size:
+                    break
+                conn.sendall(view[:size])
+    
+    def accept():
+        while True:
+            conn, _ = server.accept()
+            threading.Thread(target=handle, args=(conn,), daemon=True).start()
+    
+    threading.Thread(target=accept, daemon=True).start()
+    return server.getsockname()[1]
+
+
+def transfer(port: int, total: int) -> int:
+    """发送 total 字节并读回，返回读回的字节数"""
+    sock = socket.create_connection(('127.0.0.1', port))
+    payload = memoryview(os.urandom(CHUNK_SIZE))
+    
+    def send():
+        remaining = total
+        while remaining:
+            chunk = payload[:min(remaining, CHUNK_SIZE)]
+            sock.sendall(chunk)
+            remaining -= len(chunk)
+    
+    sender = threading.Thread(target=send)
+    sender.start()
+    
+    buffer = bytearray(CHUNK_SIZE)
+    received = 0
+    while received < total:
+        size = sock.recv_into(buffer)
+        if not size:
+            break
+        received += size
+    
+    sender.join()
+    sock.close()
+    return received
+
+
+def run_benchmark(mode: str, backend_port: int, args) -> Dict[str, Any]:
+    """对单个数据路径运行基准"""
+    proxy_data, use_splice = MODES[mode]
+    original = TCPConnection._proxy_data, TCPConnection.use_splice
+    TCPConnection._proxy_data = proxy_data
+    TCPConnection.use_splice = use_splice
+    
+    lb = RoundRobinBalancer()
+    lb.add_backend(Backend('echo', '127.0.0.1', backend_port))
+    proxy = TCPProxy('127.0.0.1', 0, lb)
+    proxy.buffer_size = args.buffer_size
+    proxy.start()
+    port = proxy.server_socket.getsockname()[1]
+    
+    total = args.megabytes * 1024 * 1024
+    received: List[int] = []
+    try:
+        start = time.perf_counter()
+        workers = [
+            threading.Thread(target=lambda: received.append(transfer(port, total)))
+            for _ in range(args.connections)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - start
+    finally:
+        proxy.stop()
+        TCPConnection._proxy_data, TCPConnection.use_splice = original
+    
+    # 连接关闭后字节数才汇总到代理的统计信息
+    deadline = time.monotonic() + 5
+    while proxy.get_stats()['active_connections'] and time.monotonic() < deadline:
+        time.sleep(0.05)
+    stats = proxy.get_stats()
+    
+    expected = total * args.connections
+    return {
+        'mode': mode,
+        'seconds': elapsed,
+        'throughput_mb_s': sum(received) * 2 / elapsed / (1024 * 1024),
+        'accounting_ok': (
+            sum(received) == expected
+            and stats['total_bytes_received'] == expected
+            and stats['total_bytes_sent'] == expected
+        )
+    }
+
+
+def print_result(result: Dict[str, Any], baseline: Dict[str, Any]):
+    """打印单个数据路径的结果"""
+    print(f"\n{result['mode']}:")
+    print(f"  throughput: {result['throughput_mb_s']:.0f} MB/s "
+          f"({result['throughput_mb_s'] / baseline['throughput_mb_s']:.2f}x)")
+    print(f"  accounting: {'ok' if result['accounting_ok'] else 'MISMATCH'}")
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='TCP proxy data path throughput benchmark')
+    parser.add_argument('--modes', default='legacy,recv_into,splice',
+                       help='Comma separated data paths (legacy, recv_into, splice)')
+    parser.add_argument('--megabytes', type=int, default=256,
+                       help='Megabytes sent through each connection')
+    parser.add_argument('--connections', type=int, default=4,
+                       help='Number of parallel connections')
+    parser.add_argument('--buffer-size', type=int, default=64 * 1024,
+                       help='Proxy buffer size')
+    parser.add_argument('--output', help='Output file for results (JSON format)')
+    
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    
+    modes = args.modes.split(',')
+    if 'splice' in modes and not SPLICE_AVAILABLE:
+        print("os.splice is not available, skipping splice mode")
+        modes.remove('splice')
+    
+    backend_port = start_echo_backend()
+    results = []
+    for mode in modes:
+        result = run_benchmark(mode, backend_port, args)
+        print_result(result, results[0] if results else result)
+        results.append(result)
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults saved to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+后端连接预热池基准
+依次建立N个客户端连接，测量经TCP代理发出第一个请求到收到回显的耗时，
+对比每次新建后端连接与从 UpstreamPool 取用预热连接。
+本机回环上握手很快，差别主要体现在 --backend 指向跨网络的后端时。
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import json
+import logging
+import socket
+import statistics
+import threading
+import time
+from typing import Dict, Any, List, Tuple
+
+from algorithms.base import Backend
+from algorithms.round_robin import RoundRobinBalancer
+from balancer.tcp_proxy import TCPProxy
+from balancer.event_tcp_proxy import EventLoopTCPProxy
+from balancer.upstream_pool import UpstreamPool
+
+ENGINES = {
+    'thread': TCPProxy,
+    'event': EventLoopTCPProxy
+}
+
+
+def start_echo_backend() -> Tuple[str, int]:
+    """在后台线程中启动回显后端，返回地址"""
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind(('127.0.0.1', 0))
+    server.listen(1024)
+    
+    def echo(conn: socket.socket):
+        with conn:
+            while True:
+                data = conn.recv(65536)
+                if not data:
+                    break
+                conn.sendall(data)
+    
+    def accept():
+        while True:
+            conn, _ = server.accept()
+            threading.Thread(target=echo, args=(conn,), daemon=True).start()
+    
+    threading.Thread(target=accept, daemon=True).start()
+    return server.getsockname()
+
+
+def run_case(args, host: str, port: int, use_pool: bool, listen_port: int) -> Dict[str, Any]:
+    """依次建立连接，返回首个请求往返耗时的统计"""
+    lb = RoundRobinBalancer()
+    lb.add_backend(Backend('backend-1', host, port))
+    proxy = ENGINES[args.engine]('127.0.0.1', listen_port, lb)
+    if use_pool:
+        proxy.set_upstream_pool(UpstreamPool(lb, min_idle=args.min_idle, max_idle=args.max_idle))
+    proxy.start()
+    time.sleep(args.warmup)
+    
+    latencies: List[float] = []
+    try:
+        for i in range(args.connections):
+            payload = b'ping %d' % i
+            begin = time.perf_counter()
+            with socket.create_connection(('127.0.0.1', listen_port)) as client:
+                client.sendall(payload)
+                assert client.recv(65536) == payload
+                latencies.append(time.perf_counter() - begin)
+            if args.interval:
+                time.sleep(args.interval)
+        pool_stats = proxy.upstream_pool.get_stats() if use_pool else None
+    finally:
+        proxy.stop()
+    
+    latencies.sort()
+    return {
+        'pool': use_pool,
+        'p50_ms': statistics.median(latencies) * 1000,
+        'p99_ms': latencies[int(len(latencies) * 0.99) - 1] * 1000,
+        'mean_ms': statistics.mean(latencies) * 1000,
+        'pool_hits': pool_stats['hits'] if pool_stats else 0,
+        'pool_misses': pool_stats['misses'] if pool_stats else 0
+    }
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='Upstream connection pool benchmark')
+    parser.add_argument('--engine', choices=sorted(ENGINES), default='event',
+                       help='TCP proxy engine')
+    parser.add_argument('--backend', help='Echo backend host:port (default: local echo server)')
+    parser.add_argument('--connections', type=int, default=500,
+                       help='Number of sequential client connections')
+    parser.add_argument('--interval', type=float, default=0.002,
+                       help='Pause between connections in seconds')
+    parser.add_argument('--min-idle', type=int, default=4,
+                       help='Minimum idle connections per backend')
+    parser.add_argument('--max-idle', type=int, default=16,
+                       help='Maximum idle connections per backend')
+    parser.add_argument('--warmup', type=float, default=1.0,
+                       help='Seconds to wait after starting the proxy')
+    parser.add_argument('--port', type=int, default=19500,
+                       help='First proxy listen port')
+    parser.add_argument('--output', help='Output file for results (JSON format)')
+    
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    
+    if args.backend:
+        host, port = args.backend.rsplit(':', 1)
+        port = int(port)
+    else:
+        host, port = start_echo_backend()
+    
+    results = []
+    for i, use_pool in enumerate((False, True)):
+        result = run_case(args, host, port, use_pool, args.port + i)
+        results.append(result)
+        label = 'pooled' if use_pool else 'direct'
+        print(f"{label:>7}: p50 {result['p50_ms']:.3f} ms, p99 {result['p99_ms']:.3f} ms, "
+              f"mean {result['mean_ms']:.3f} ms, pool hits {result['pool_hits']}/{args.connections}")
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'engine': args.engine, 'backend': f"{host}:{port}", 'results': results}, f, indent=2)
+        print(f"\nResults saved to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
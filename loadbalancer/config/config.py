@@ -12,7 +12,9 @@ class Config:
         'ip_hash',
         'least_connections',
         'consistent_hash',
-        'fastest_response'
+        'fastest_response',
+        'p2c_ewma',
+        'least_outstanding_latency'
     ]
     
     # 默认后端服务器
@@ -6,5 +6,6 @@
 from .session import SessionManager
 from .circuit_breaker import CircuitBreaker  
 from .rate_limiter import RateLimiter
+from .retry import RetryBudget
 
-__all__ = ['SessionManager', 'CircuitBreaker', 'RateLimiter']
\ No newline at end of file
+__all__ = ['SessionManager', 'CircuitBreaker', 'RateLimiter', 'RetryBudget']
\ No newline at end of file
@@ -0,0 +1,107 @@
+"""
+重试预算
+限制重试和对冲请求占正常流量的比例，防止重试在故障时放大流量
+"""
+
+import time
+import threading
+from typing import Dict, Any
+
+
+# 幂等方法：失败后可以换一个后端重试
+IDEMPOTENT_METHODS = frozenset(('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'))
+
+# 安全方法：可以同时发往多个后端（对冲请求）
+SAFE_METHODS = frozenset(('GET', 'HEAD', 'OPTIONS'))
+
+
+class RetryBudget:
+    """重试预算
+    
+    在最近 window_size 秒内，重试（包括对冲请求）的数量不超过
+    max(请求数 * ratio, min_retries_per_second * window_size)。
+    后端整体故障时，重试最多让流量增加 ratio，而不是成倍放大。
+    """
+    
+    def __init__(self,
+                 ratio: float = 0.2,
+                 min_retries_per_second: float = 1.0,
+                 window_size: int = 10):
+        """
+        初始化重试预算
+        
+        Args:
+            ratio: 允许的重试数与请求数之比
+            min_retries_per_second: 流量很小时每秒至少允许的重试数
+            window_size: 统计窗口大小（秒）
+        """
+        self.ratio = ratio
+        self.min_retries_per_second = min_retries_per_second
+        self.window_size = window_size
+        
+        # 按秒分桶的环形窗口
+        self._stamps = [-1] * window_size
+        self._requests = [0] * window_size
+        self._retries = [0] * window_size
+        
+        # 统计信息
+        self.total_requests = 0
+        self.total_retries = 0
+        self.rejected_retries = 0
+        
+        self.lock = threading.Lock()
+    
+    def _bucket(self, second: int) -> int:
+        """获取当前秒对应的桶，过期的桶先清零（调用方需持有 self.lock）"""
+        index = second % self.window_size
+        if self._stamps[index] != second:
+            self._stamps[index] = second
+            self._requests[index] = 0
+            self._retries[index] = 0
+        return index
+    
+    def _window_totals(self, second: int):
+        """统计窗口内的请求数和重试数（调用方需持有 self.lock）"""
+        cutoff = second - self.window_size
+        requests = retries = 0
+        for stamp, request_count, retry_count in zip(self._stamps, self._requests, self._retries):
+            if stamp > cutoff:
+                requests += request_count
+                retries += retry_count
+        return requests, retries
+    
+    def record_request(self):
+        """记录一个原始请求"""
+        second = int(time.time())
+        with self.lock:
+            self._requests[self._bucket(second)] += 1
+            self.total_requests += 1
+    
+    def try_acquire(self) -> bool:
+        """申请一次重试，预算不足时返回False"""
+        second = int(time.time())
+        with self.lock:
+            index = self._bucket(second)
+            requests, retries = self._window_totals(second)
+            allowed = max(requests * self.ratio, self.min_retries_per_second * self.window_size)
+            if retries >= allowed:
+                self.rejected_retries += 1
+                return False
+            
+            self._retries[index] += 1
+            self.total_retries += 1
+            return True
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取统计信息"""
+        second = int(time.time())
+        with self.lock:
+            requests, retries = self._window_totals(second)
+            return {
+                'ratio': self.ratio,
+                'window_requests': requests,
+                'window_retries': retries,
+                'total_requests': self.total_requests,
+                'total_retries': self.total_retries,
+                'rejected_retries': self.rejected_retries
+            }
\ No newline at end of file
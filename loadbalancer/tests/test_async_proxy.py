@@ -0,0 +1,71 @@
+"""
+异步HTTP代理测试
+客户端在请求体传输中途断开时，不应计入后端的失败
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+
+from algorithms.base import Backend
+from algorithms.round_robin import RoundRobinBalancer
+from balancer.async_proxy import AsyncHTTPProxy
+
+
+async def _send_truncated_request(head: bytes, partial_body: bytes):
+    """向代理发送不完整的请求体后断开，返回后端和代理"""
+    async def upstream(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        # 读到代理关闭连接为止
+        await reader.read()
+        writer.close()
+    
+    upstream_server = await asyncio.start_server(upstream, '127.0.0.1', 0)
+    backend = Backend('backend-1', '127.0.0.1', upstream_server.sockets[0].getsockname()[1])
+    lb = RoundRobinBalancer()
+    lb.add_backend(backend)
+    
+    proxy = AsyncHTTPProxy(lb, '127.0.0.1', 0)
+    proxy.enable_access_log(False)
+    await proxy.start()
+    try:
+        port = proxy._server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(head + partial_body)
+        await writer.drain()
+        writer.close()
+        await writer.wait_closed()
+        
+        for _ in range(200):
+            if proxy.counters.snapshot()['failed_requests']:
+                break
+            await asyncio.sleep(0.01)
+    finally:
+        await proxy.stop()
+        upstream_server.close()
+    return backend, proxy
+
+
+def test_truncated_length_body_is_client_error():
+    """Content-Length 请求体不完整"""
+    head = (b'POST /upload HTTP/1.1\r\nHost: test\r\n'
+            b'Content-Length: 1000\r\n\r\n')
+    backend, proxy = asyncio.run(_send_truncated_request(head, b'abc'))
+    
+    assert proxy.counters.snapshot()['failed_requests'] == 1
+    assert backend.error_count == 0
+    assert backend.is_healthy
+    assert proxy.circuit_breaker.total_failures == 0
+
+
+def test_truncated_chunked_body_is_client_error():
+    """chunked 请求体在分块中间断开"""
+    head = (b'POST /upload HTTP/1.1\r\nHost: test\r\n'
+            b'Transfer-Encoding: chunked\r\n\r\n')
+    backend, proxy = asyncio.run(_send_truncated_request(head, b'64\r\nabc'))
+    
+    assert proxy.counters.snapshot()['failed_requests'] == 1
+    assert backend.error_count == 0
+    assert backend.is_healthy
+    assert proxy.circuit_breaker.total_failures == 0
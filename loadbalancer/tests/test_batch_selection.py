@@ -0,0 +1,59 @@
+"""
+批量选择测试
+每种负载均衡算法的 next_backends 都应与逐个调用 next_backend 并建立连接的结果一致
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from algorithms import LoadBalancerFactory
+from algorithms.base import Backend
+
+# 预先存在的活跃连接数和响应时间（毫秒），让各后端处于不同的负载
+ACTIVE_CONNECTIONS = (10, 0, 3, 1)
+RESPONSE_TIMES = (20.0, 90.0, 35.0, 60.0)
+CLIENT_IPS = [f"192.168.1.{i % 5}" for i in range(16)] + [None]
+
+
+def create_loaded_balancer(algorithm: str):
+    """创建带有4个后端和预设负载的负载均衡器"""
+    lb = LoadBalancerFactory.create(algorithm)
+    if hasattr(lb, '_random'):
+        # 随机算法使用相同的种子，两次运行抽取同样的后端对
+        lb._random.seed(42)
+    
+    backends = [Backend(f"backend-{i}", f"10.0.0.{i}", 8000 + i, weight=i + 1) for i in range(4)]
+    for backend in backends:
+        lb.add_backend(backend)
+    for backend, active, response_time in zip(backends, ACTIVE_CONNECTIONS, RESPONSE_TIMES):
+        for _ in range(active):
+            backend.increment_active()
+        if hasattr(lb, 'update_response_time'):
+            lb.update_response_time(backend.id, response_time)
+    return lb
+
+
+@pytest.mark.parametrize('algorithm', LoadBalancerFactory.get_available_algorithms())
+def test_next_backends_matches_sequential_picks(algorithm):
+    """整批选择与逐个选择并建立连接的结果相同"""
+    sequential_lb = create_loaded_balancer(algorithm)
+    expected = []
+    for client_ip in CLIENT_IPS:
+        backend = sequential_lb.next_backend(client_ip)
+        expected.append(backend.id)
+        backend.increment_active()
+    
+    batch_lb = create_loaded_balancer(algorithm)
+    actual = [backend.id for backend in batch_lb.next_backends(CLIENT_IPS)]
+    
+    assert actual == expected
+
+
+@pytest.mark.parametrize('algorithm', LoadBalancerFactory.get_available_algorithms())
+def test_next_backends_without_healthy_backends(algorithm):
+    """没有健康后端时整批返回None"""
+    lb = LoadBalancerFactory.create(algorithm)
+    assert lb.next_backends(CLIENT_IPS) == [None] * len(CLIENT_IPS)